@@ -1,9 +1,11 @@
-import subprocess
 import os
 import time
 import logging
 from typing import Optional, Tuple, List, Union
 
+from common.keygen import KeyPool, generate_keypair, pubkey
+from common.command_executor import CommandExecutor, CommandError
+
 
 class ConfiguradorWireguardCliente:
     """
@@ -13,14 +15,19 @@ class ConfiguradorWireguardCliente:
     DEFAULT_INTERFACE = "wg0"
     DEFAULT_PORT = 51820
 
-    def __init__(self, interface_name: str = DEFAULT_INTERFACE):
+    def __init__(self, interface_name: str = DEFAULT_INTERFACE, key_pool: Optional[KeyPool] = None,
+                 executor: Optional[CommandExecutor] = None):
         """
         Inicializa el configurador de Wireguard.
         
         Args:
             interface_name: Nombre de la interfaz Wireguard (por defecto 'wg0')
+            key_pool: Pool opcional de pares de claves generados por adelantado
+            executor: Ejecutor de comandos (se crea uno si no se indica)
         """
         self.interface_name = interface_name
+        self.key_pool = key_pool
+        self.executor = executor or CommandExecutor()
         self.private_key: Optional[str] = None
         self.public_key: Optional[str] = None
         self.ip_wg: Optional[str] = None
@@ -29,6 +36,10 @@ class ConfiguradorWireguardCliente:
     def _setup_logger(self) -> logging.Logger:
         """Configura y retorna un logger instance."""
         logger = logging.getLogger(__name__)
+        # Con logging configurado en el proceso (structured_log.setup_logging)
+        # los registros van a su cola; si no, un handler propio, una sola vez
+        if logger.handlers or logging.getLogger().handlers:
+            return logger
         logger.setLevel(logging.INFO)
         handler = logging.StreamHandler()
         formatter = logging.Formatter(
@@ -39,44 +50,23 @@ class ConfiguradorWireguardCliente:
 
     def create_keys(self) -> Tuple[str, str]:
         """
-        Genera las claves pública y privada de Wireguard de manera segura.
+        Genera las claves pública y privada de Wireguard dentro del proceso
+        (Curve25519), tomándolas del pool si existe.
         
         Returns:
             Tuple con (clave_privada, clave_publica)
-            
-        Raises:
-            RuntimeError: Si falla la generación de claves
         """
-        try:
-            self.logger.info("Generando claves Wireguard...")
-            
-            # Generar clave privada
-            private_key = subprocess.run(
-                ["wg", "genkey"],
-                capture_output=True,
-                text=True,
-                check=True
-            ).stdout.strip()
-
-            # Generar clave pública
-            public_key = subprocess.run(
-                ["wg", "pubkey"],
-                input=private_key,
-                capture_output=True,
-                text=True,
-                check=True
-            ).stdout.strip()
-
-            self.private_key = private_key
-            self.public_key = public_key
-
-            self.logger.info("Claves generadas exitosamente")
-            return private_key, public_key
-
-        except subprocess.CalledProcessError as e:
-            error_msg = f"Error generando claves: {e.stderr.strip()}"
-            self.logger.error(error_msg)
-            raise RuntimeError(error_msg)
+        self.logger.info("Generando claves Wireguard...")
+        if self.key_pool is not None:
+            private_key, public_key = self.key_pool.get()
+        else:
+            private_key, public_key = generate_keypair()
+
+        self.private_key = private_key
+        self.public_key = public_key
+
+        self.logger.info("Claves generadas exitosamente")
+        return private_key, public_key
 
     def create_wg_interface(self, ip_wg: str, 
                           peer_public_key: Optional[str] = None,
@@ -108,20 +98,19 @@ class ConfiguradorWireguardCliente:
 
             self.logger.info(f"Creando interfaz {self.interface_name}...")
             
-            # Crear interfaz
-            self._run_command(f"ip link add dev {self.interface_name} type wireguard")
-            self._run_command(f"ip address add {ip_wg} dev {self.interface_name}")
+            # Crear, direccionar y activar la interfaz en un solo proceso ip
+            self.executor.ip_batch([
+                ["link", "add", "dev", self.interface_name, "type", "wireguard"],
+                ["address", "add", ip_wg, "dev", self.interface_name],
+                ["link", "set", "up", "dev", self.interface_name],
+            ])
             self.ip_wg = ip_wg
 
             # Configurar interfaz
+            cmd = ["wg", "set", self.interface_name, "listen-port", str(self.DEFAULT_PORT)]
             if self.private_key:
-                subprocess.run(
-                    ["wg", "set", self.interface_name, "private-key", "/dev/stdin"],
-                    input=self.private_key.encode(),
-                    check=True
-                )
-            
-            self._run_command(f"wg set {self.interface_name} listen-port {self.DEFAULT_PORT}")
+                cmd += ["private-key", "/dev/stdin"]
+            self.executor.run(cmd, input=self.private_key)
 
             # Configurar peer si se proporcionan parámetros
             if all([peer_public_key, peer_allowed_ips, peer_endpoint_ip, peer_listen_port]):
@@ -131,8 +120,6 @@ class ConfiguradorWireguardCliente:
                     endpoint_ip=peer_endpoint_ip,
                     listen_port=peer_listen_port
                 )
-
-            self._run_command(f"ip link set up dev {self.interface_name}")
             
             # Esperar a que la interfaz esté lista
             time.sleep(1)
@@ -140,7 +127,7 @@ class ConfiguradorWireguardCliente:
             self.logger.info(f"Interfaz {self.interface_name} creada exitosamente")
             return True
 
-        except subprocess.CalledProcessError as e:
+        except CommandError as e:
             error_msg = f"Error configurando interfaz: {e.stderr.strip()}"
             self.logger.error(error_msg)
             self._cleanup_interface()
@@ -174,19 +161,19 @@ class ConfiguradorWireguardCliente:
             
             self.logger.info(f"Añadiendo peer {public_key[:8]}...")
             
-            cmd = (
-                f"wg set {self.interface_name} peer {public_key} "
-                f"allowed-ips {allowed_ips_str} "
-                f"endpoint {endpoint_ip}:{listen_port}"
-            )
+            cmd = [
+                "wg", "set", self.interface_name, "peer", public_key,
+                "allowed-ips", allowed_ips_str,
+                "endpoint", f"{endpoint_ip}:{listen_port}"
+            ]
             
-            self._run_command(cmd)
+            self.executor.run(cmd)
             self.logger.info(f"Peer {public_key[:8]} añadido exitosamente")
 
         except ValueError as e:
             self.logger.error(f"Error en parámetros: {e}")
             raise
-        except subprocess.CalledProcessError as e:
+        except CommandError as e:
             error_msg = f"Error añadiendo peer: {e.stderr.strip()}"
             self.logger.error(error_msg)
             raise RuntimeError(error_msg)
@@ -198,21 +185,16 @@ class ConfiguradorWireguardCliente:
         Returns:
             str: La dirección IP con notación CIDR, o None si no se encuentra
         """
-        try:
-            result = subprocess.run(
-                ["ip", "-br", "-4", "addr", "show", "dev", self.interface_name],
-                capture_output=True,
-                text=True,
-                check=True
-            )
-            # Formato: wg0 UP 10.0.0.2/24
-            parts = result.stdout.strip().split()
-            if len(parts) >= 3:
-                self.ip_wg = parts[2]
-                return self.ip_wg
-            return None
-        except subprocess.CalledProcessError:
+        result = self.executor.run(["ip", "-br", "-4", "addr", "show", "dev", self.interface_name],
+                                   check=False)
+        if result.returncode != 0:
             return None
+        # Formato: wg0 UP 10.0.0.2/24
+        parts = result.stdout.strip().split()
+        if len(parts) >= 3:
+            self.ip_wg = parts[2]
+            return self.ip_wg
+        return None
 
     def change_interface_ip(self, new_ip: str, verify: bool = True) -> None:
         """
@@ -242,11 +224,12 @@ class ConfiguradorWireguardCliente:
             # Obtener IP actual para eliminarla
             current_ip = self.get_interface_ip()
             
+            # Reemplazar la dirección en un solo proceso ip
+            commands = []
             if current_ip:
-                self._run_command(f"ip addr del {current_ip} dev {self.interface_name}")
-            
-            # Añadir nueva IP
-            self._run_command(f"ip addr add {new_ip} dev {self.interface_name}")
+                commands.append(["addr", "del", current_ip, "dev", self.interface_name])
+            commands.append(["addr", "add", new_ip, "dev", self.interface_name])
+            self.executor.ip_batch(commands)
             self.ip_wg = new_ip
             
             if verify:
@@ -257,7 +240,7 @@ class ConfiguradorWireguardCliente:
             
             self.logger.info(f"IP cambiada exitosamente a {new_ip}")
 
-        except subprocess.CalledProcessError as e:
+        except CommandError as e:
             error_msg = f"Error cambiando IP: {e.stderr.strip()}"
             self.logger.error(error_msg)
             raise RuntimeError(error_msg)
@@ -284,39 +267,14 @@ class ConfiguradorWireguardCliente:
 
     def _interface_exists(self) -> bool:
         """Verifica si la interfaz ya existe."""
-        try:
-            subprocess.run(
-                ["ip", "link", "show", self.interface_name],
-                check=True,
-                stdout=subprocess.DEVNULL,
-                stderr=subprocess.DEVNULL
-            )
-            return True
-        except subprocess.CalledProcessError:
-            return False
-
-    def _run_command(self, command: str) -> None:
-        """Ejecuta un comando de shell con manejo de errores."""
-        try:
-            result = subprocess.run(
-                command,
-                shell=True,
-                check=True,
-                capture_output=True,
-                text=True
-            )
-            if result.stdout:
-                self.logger.debug(result.stdout.strip())
-        except subprocess.CalledProcessError as e:
-            error_msg = f"Comando fallido: {command}\nError: {e.stderr.strip()}"
-            self.logger.error(error_msg)
-            raise RuntimeError(error_msg)
+        result = self.executor.run(["ip", "link", "show", self.interface_name], check=False)
+        return result.returncode == 0
 
     def _cleanup_interface(self) -> None:
         """Intenta limpiar la interfaz si la creación falla."""
         try:
             if self._interface_exists():
-                self._run_command(f"ip link delete dev {self.interface_name}")
+                self.executor.run(["ip", "link", "delete", "dev", self.interface_name])
         except RuntimeError:
             pass  # No enmascarar el error original con errores de limpieza
 
@@ -337,11 +295,11 @@ class ConfiguradorWireguardCliente:
         try:
             self.logger.info(f"Eliminando interfaz {self.interface_name}...")
             
-            # Primero desactivar la interfaz
-            self._run_command(f"ip link set down dev {self.interface_name}")
-            
-            # Eliminar la interfaz
-            self._run_command(f"ip link delete dev {self.interface_name}")
+            # Desactivar y eliminar la interfaz en un solo proceso ip
+            self.executor.ip_batch([
+                ["link", "set", "down", "dev", self.interface_name],
+                ["link", "delete", "dev", self.interface_name],
+            ])
             
             # Limpiar propiedades
             self.private_key = None
@@ -351,7 +309,7 @@ class ConfiguradorWireguardCliente:
             self.logger.info(f"Interfaz {self.interface_name} eliminada correctamente")
             return True
 
-        except subprocess.CalledProcessError as e:
+        except CommandError as e:
             error_msg = f"Error al eliminar la interfaz: {e.stderr.strip()}"
             self.logger.error(error_msg)
             raise RuntimeError(error_msg)
@@ -362,9 +320,9 @@ class ConfiguradorWireguardCliente:
             raise RuntimeError(f"La interfaz {self.interface_name} no existe")
             
         try:
-            self._run_command(f"ip link set up dev {self.interface_name}")
+            self.executor.run(["ip", "link", "set", "up", "dev", self.interface_name])
             self.logger.info(f"Interfaz {self.interface_name} activada")
-        except subprocess.CalledProcessError as e:
+        except CommandError as e:
             error_msg = f"Error activando interfaz: {e.stderr.strip()}"
             self.logger.error(error_msg)
             raise RuntimeError(error_msg)
@@ -375,9 +333,9 @@ class ConfiguradorWireguardCliente:
             raise RuntimeError(f"La interfaz {self.interface_name} no existe")
             
         try:
-            self._run_command(f"ip link set down dev {self.interface_name}")
+            self.executor.run(["ip", "link", "set", "down", "dev", self.interface_name])
             self.logger.info(f"Interfaz {self.interface_name} desactivada")
-        except subprocess.CalledProcessError as e:
+        except CommandError as e:
             error_msg = f"Error desactivando interfaz: {e.stderr.strip()}"
             self.logger.error(error_msg)
             raise RuntimeError(error_msg)
@@ -389,18 +347,12 @@ class ConfiguradorWireguardCliente:
         Returns:
             str: Estado de la interfaz ("up", "down", o "not found")
         """
-        try:
-            result = subprocess.run(
-                ["ip", "-o", "link", "show", self.interface_name],
-                capture_output=True,
-                text=True,
-                check=True
-            )
-            if "UP" in result.stdout:
-                return "up"
-            return "down"
-        except subprocess.CalledProcessError:
+        result = self.executor.run(["ip", "-o", "link", "show", self.interface_name], check=False)
+        if result.returncode != 0:
             return "not found"
+        if "UP" in result.stdout:
+            return "up"
+        return "down"
         
     def up_interface(self) -> None:
         """
@@ -416,10 +368,10 @@ class ConfiguradorWireguardCliente:
             
         try:
             self.logger.info(f"Bringing interface {self.interface_name} up...")
-            self._run_command(f"ip link set up dev {self.interface_name}")
+            self.executor.run(["ip", "link", "set", "up", "dev", self.interface_name])
             self.logger.info(f"Interface {self.interface_name} is now up")
             
-        except subprocess.CalledProcessError as e:
+        except CommandError as e:
             error_msg = f"Failed to bring interface up: {e.stderr.strip()}"
             self.logger.error(error_msg)
             raise RuntimeError(error_msg)
@@ -438,10 +390,10 @@ class ConfiguradorWireguardCliente:
             
         try:
             self.logger.info(f"Bringing interface {self.interface_name} down...")
-            self._run_command(f"ip link set down dev {self.interface_name}")
+            self.executor.run(["ip", "link", "set", "down", "dev", self.interface_name])
             self.logger.info(f"Interface {self.interface_name} is now down")
             
-        except subprocess.CalledProcessError as e:
+        except CommandError as e:
             error_msg = f"Failed to bring interface down: {e.stderr.strip()}"
             self.logger.error(error_msg)
             raise RuntimeError(error_msg)
@@ -455,29 +407,18 @@ class ConfiguradorWireguardCliente:
             Tuple of (private_key, public_key)
             
         Raises:
-            RuntimeError: If key generation fails
+            RuntimeError: If the stored private key is invalid
         """
         try:
             self.logger.info("Generating server WireGuard keys...")
             
             # Generate private key if not already exists
             if not self.private_key:
-                self.private_key = subprocess.run(
-                    ["wg", "genkey"],
-                    capture_output=True,
-                    text=True,
-                    check=True
-                ).stdout.strip()
+                self.private_key, self.public_key = self.create_keys()
             
-            # Generate public key from private key if not exists
+            # Derive public key from private key if not exists
             if not self.public_key:
-                self.public_key = subprocess.run(
-                    ["wg", "pubkey"],
-                    input=self.private_key,
-                    capture_output=True,
-                    text=True,
-                    check=True
-                ).stdout.strip()
+                self.public_key = pubkey(self.private_key)
             
             self.logger.info("Successfully generated server keys")
             self.logger.debug(f"Private key: {self.private_key[:8]}...")
@@ -485,7 +426,7 @@ class ConfiguradorWireguardCliente:
             
             return self.private_key, self.public_key
 
-        except subprocess.CalledProcessError as e:
-            error_msg = f"Server key generation failed: {e.stderr.strip()}"
+        except ValueError as e:
+            error_msg = f"Server key generation failed: {e}"
             self.logger.error(error_msg)
             raise RuntimeError(error_msg)
\ No newline at end of file
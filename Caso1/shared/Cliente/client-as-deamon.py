@@ -1,18 +1,31 @@
 # Daemon del cliente
 import logging
-from xmlrpc.server import SimpleXMLRPCServer
+import os
+import sys
+from socketserver import ThreadingMixIn
+from xmlrpc.server import SimpleXMLRPCServer, SimpleXMLRPCRequestHandler, resolve_dotted_attribute
 
 # Es al mismo tiempo cliente
 import xmlrpc.client
 
+# Módulos compartidos con el servidor (shared/common)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
 # Manejadores de red
 from conn_scapy import verificar_conectividad
+from pooled_transport import PooledTransport, DEFAULT_POOL_SIZE
+from common.metrics import Metrics, CommandStats, MetricsPageMixin, InstrumentedProxy, DEFAULT_SLOW_COMMAND
+from common.structured_log import (setup_logging, RequestLog, RequestLogMixin, DEFAULT_LOG_LEVEL,
+                                   DEFAULT_REQUEST_SAMPLE)
 # Importar configurador de Wireguard
 import WG.ConfiguradorWireguardCliente as ConfiguradorWireguardCliente
+from common.keygen import KeyPool, DEFAULT_KEY_POOL_SIZE
+from common.memory_executor import MemoryExecutor, DEFAULT_COMMAND_LATENCY
 
 # Importar os
+import argparse
 from os import geteuid
-from sys import exit, argv
+from sys import exit
 
 # Constantes
 DEFAULT_SERVER_PORT = 8080
@@ -20,12 +33,35 @@ DEFAULT_LOCAL_PORT = 3041
 DEFAULT_LOCAL_ADDRESS = "0.0.0.0"
 LOG_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
 LOG_LEVEL = logging.INFO
+# Endpoints por página al listar una red
+ENDPOINT_PAGE_SIZE = 500
+# Segundos que una conexión keep-alive del CLI puede quedar ociosa
+KEEPALIVE_IDLE_TIMEOUT = 15
+
+
+class KeepAliveRequestHandler(RequestLogMixin, MetricsPageMixin, SimpleXMLRPCRequestHandler):
+    """
+    Handler HTTP/1.1 para que el CLI reutilice su conexión con el daemon;
+    en GET /metrics sirve las métricas de las llamadas al orquestador
+    """
+    protocol_version = "HTTP/1.1"
+    timeout = KEEPALIVE_IDLE_TIMEOUT
+
+
+class DaemonXMLRPCServer(ThreadingMixIn, SimpleXMLRPCServer):
+    """
+    Servidor local del daemon; un hilo por conexión para que una conexión
+    keep-alive ociosa no bloquee a otros clientes
+    """
+    daemon_threads = True
 
 class ClientAsDeamon:
     """
     Clase que representa al cliente como un daemon
     """
-    def __init__(self, dir_servidor, public_ip, port_local=DEFAULT_LOCAL_PORT, wg_ip="100.10.0.2", wg_port=51820):
+    def __init__(self, dir_servidor, public_ip, port_local=DEFAULT_LOCAL_PORT, wg_ip="100.10.0.2", wg_port=51820,
+                 pool_size=DEFAULT_POOL_SIZE, key_pool_size=DEFAULT_KEY_POOL_SIZE, executor=None,
+                 request_sample=DEFAULT_REQUEST_SAMPLE, slow_command=DEFAULT_SLOW_COMMAND):
         # Configurar logger
         self._setup_logger()
         
@@ -33,7 +69,14 @@ class ClientAsDeamon:
         self.wg = None
         # Servidor en la nube
         self.dir_servidor = f"http://{dir_servidor}:{DEFAULT_SERVER_PORT}/"
-        self.orquestador = xmlrpc.client.ServerProxy(self.dir_servidor, allow_none=True)
+        # Latencia y errores de cada llamada al orquestador
+        self.metrics = Metrics("linkguard_orchestrator_rpc")
+        # Bitácoras muestreadas de las llamadas del CLI y de las llamadas al orquestador
+        self.request_log = RequestLog(logging.getLogger("ClientDaemon.cli"), request_sample)
+        self.orquestador = InstrumentedProxy(
+            xmlrpc.client.ServerProxy(self.dir_servidor, allow_none=True,
+                                      transport=PooledTransport(pool_size=pool_size)),
+            self.metrics, RequestLog(logging.getLogger("ClientDaemon.orquestador"), request_sample))
         # Servidor local
         self.dir_local = DEFAULT_LOCAL_ADDRESS
         self.port_local = port_local
@@ -42,36 +85,43 @@ class ClientAsDeamon:
         self.wg_ip = wg_ip
         self.wg_port = wg_port
         self.actual_user = None
+        # Token de la sesión abierta en el orquestador
+        self.session_token = None
         self.public_ip = public_ip
         
         # Create server
-        self.xmlrpc_server = SimpleXMLRPCServer((self.dir_local, self.port_local), logRequests=True)
-        # Iniciar configurador de Wireguard
-        self.wg = ConfiguradorWireguardCliente.ConfiguradorWireguardCliente()
+        self.xmlrpc_server = DaemonXMLRPCServer((self.dir_local, self.port_local), logRequests=False,
+                                                requestHandler=KeepAliveRequestHandler)
+        # Tiempo de los comandos ip/wg del configurador y bitácora de los lentos
+        self.command_stats = CommandStats("linkguard_command", slow_threshold=slow_command)
+        self.xmlrpc_server.metrics = (self.metrics, self.command_stats)
+        self.xmlrpc_server.register_function(self.metrics.snapshot, "system.stats")
+        self.xmlrpc_server.register_function(self.command_stats.snapshot, "system.command_stats")
+        # Claves generadas en segundo plano para aprovisionar endpoints sin esperar
+        self.key_pool = KeyPool(key_pool_size).start() if key_pool_size > 0 else None
+        # Iniciar configurador de Wireguard (executor=MemoryExecutor() lo simula sin root)
+        self.wg = ConfiguradorWireguardCliente.ConfiguradorWireguardCliente(key_pool=self.key_pool,
+                                                                           executor=executor)
+        self.wg.executor.add_listener(self.command_stats.record)
         
         self.logger.info(f"Cliente daemon inicializado. Servidor en {self.dir_servidor}, escuchando en {self.dir_local}:{self.port_local}")
 
     def _setup_logger(self):
         """Configura el logger para la clase"""
         self.logger = logging.getLogger('ClientDaemon')
+        # Con setup_logging los registros van a su cola; si la clase se usa
+        # desde otro script sin configurar logging se agrega un handler propio
+        if self.logger.handlers or logging.getLogger().handlers:
+            return
         self.logger.setLevel(LOG_LEVEL)
-        
+
         # Crear formateador
         formatter = logging.Formatter(LOG_FORMAT)
-        
+
         # Crear handler para consola
         ch = logging.StreamHandler()
         ch.setFormatter(formatter)
-        
-        # Añadir handler al logger
-        if not self.logger.handlers:
-            self.logger.addHandler(ch)
-        
-        # Logger específico para XML-RPC
-        self.xmlrpc_logger = logging.getLogger('xmlrpc.server')
-        self.xmlrpc_logger.setLevel(LOG_LEVEL)
-        if not self.xmlrpc_logger.handlers:
-            self.xmlrpc_logger.addHandler(ch)
+        self.logger.addHandler(ch)
 
     def start_server(self):
         """
@@ -84,15 +134,28 @@ class ClientAsDeamon:
         self.logger.info(f"Servidor XML-RPC iniciado en {self.dir_local}:{self.port_local}")
         self.xmlrpc_server.serve_forever()
 
+    def _dispatch(self, method, params):
+        """
+        Despacha las llamadas del CLI registrando una muestra en la bitácora
+        """
+        try:
+            func = resolve_dotted_attribute(self, method, False)
+        except AttributeError:
+            func = None
+        if not callable(func):
+            raise Exception(f'method "{method}" is not supported')
+        return self.request_log.timed(method, func, *params)
+
     def register_user(self, name, email, password):
         """
         Registra un usuario en el servidor
         """
         self.logger.info(f"Registrando usuario: {name} {email}")
-        is_register = self.orquestador.register_user(name, email, password)
-        if not is_register:
+        token = self.orquestador.register_user(name, email, password)
+        if not token:
             self.logger.warning("Error al registrar el usuario! El correo ya está registrado")
             return False
+        self.session_token = token
         self.logger.info("Usuario registrado exitosamente")
         return True
 
@@ -101,10 +164,11 @@ class ClientAsDeamon:
         Identifica un usuario en el servidor
         """
         self.logger.info(f"Intentando identificación para usuario: {email}")
-        is_identified = self.orquestador.identify_user(email, password)
-        if not is_identified:
+        token = self.orquestador.identify_user(email, password)
+        if not token:
             self.logger.warning("Identificación fallida")
             return False
+        self.session_token = token
         self.logger.info("Identificación exitosa")
         return True
 
@@ -112,40 +176,65 @@ class ClientAsDeamon:
         """
         Obtiene el nombre del usuario actual
         """
-        return self.orquestador.whoami()
+        return self.orquestador.whoami(self.session_token)
 
-    def create_private_network(self, nombre):
+    def create_private_network(self, nombre, segmento=None):
         """
         Crea una red privada en el servidor
         """
         self.logger.info(f"Creando red privada: {nombre}")
-        private_network_id = self.orquestador.create_private_network(nombre)
+        if segmento:
+            private_network_id = self.orquestador.create_private_network(self.session_token, nombre, segmento)
+        else:
+            private_network_id = self.orquestador.create_private_network(self.session_token, nombre)
         if private_network_id == -1:
             self.logger.warning("Error al crear red privada")
             return -1
         self.logger.info(f"Red privada creada con ID: {private_network_id}")
         return private_network_id
 
+    def delete_private_network(self, id_red_privada):
+        """
+        Elimina una red privada y todos sus endpoints
+        """
+        self.logger.info(f"Eliminando red privada ID: {id_red_privada}")
+        result = self.orquestador.delete_private_network(self.session_token, id_red_privada)
+        if not result:
+            self.logger.warning("No se encontró la red privada")
+        return result
+
+    def delete_endpoint(self, id_red_privada, id_endpoint):
+        """
+        Elimina un endpoint de una red privada y libera su IP
+        """
+        self.logger.info(f"Eliminando endpoint ID: {id_endpoint} de la red privada ID: {id_red_privada}")
+        result = self.orquestador.delete_endpoint(self.session_token, id_red_privada, id_endpoint)
+        if not result:
+            self.logger.warning("No se encontró el endpoint")
+        return result
+
     def get_private_networks(self):
         """
         Recupera las redes privadas del servidor
         """
         self.logger.info("Obteniendo redes privadas")
-        priv_net = self.orquestador.get_private_networks()
+        priv_net = self.orquestador.get_private_networks(self.session_token)
         return priv_net
 
-    def get_endpoints(self, id_red_privada):
+    def get_endpoints(self, id_red_privada, fields=(), cursor=0, limit=ENDPOINT_PAGE_SIZE):
         """
-        Obtiene los endpoints de una red privada
+        Obtiene una página de endpoints de una red privada:
+        {"endpoints": [...], "next_cursor": n} (-1 en la última página)
         """
-        self.logger.info(f"Obteniendo endpoints para red privada ID: {id_red_privada}")
-        endpoints = self.orquestador.get_endpoints(id_red_privada)
+        self.logger.info(f"Obteniendo endpoints para red privada ID: {id_red_privada} desde {cursor}")
+        endpoints = self.orquestador.get_endpoints(self.session_token, id_red_privada,
+                                                   list(fields), cursor, limit)
         return endpoints
 
     def connect_endpoint(self, id_endpoint, id_red_privada):
         self.logger.info(f"Conectando endpoint ID: {id_endpoint} en red privada ID: {id_red_privada}")
         # Encontrar la red privada
-        private_network = self.orquestador.get_private_network_by_id(id_red_privada)
+        private_network = self.orquestador.get_private_network_by_id(self.session_token, id_red_privada)
 
         if private_network == -1:
             self.logger.error("No se encontró la red privada")
@@ -169,7 +258,8 @@ class ClientAsDeamon:
     def close_session(self):
         self.logger.info("Cerrando sesión")
         # Cerrar el servidor XML-RPC
-        result = self.orquestador.close_session()
+        result = self.orquestador.close_session(self.session_token)
+        self.session_token = None
         # Limpiar configuraciones de Wireguard
         if self.wg:
             self.wg.clear_interface()
@@ -181,50 +271,43 @@ class ClientAsDeamon:
     def init_wireguard_interface(self, ip_cliente):
         self.logger.info("Inicializando interfaz Wireguard")
         wg_private_key, self.wg_public_key = self.wg.create_keys()
-        self.logger.debug(f"Clave privada: {wg_private_key}")
-        self.logger.debug(f"Clave pública: {self.wg_public_key}")
+        self.logger.debug("Clave privada: %s", wg_private_key)
+        self.logger.debug("Clave pública: %s", self.wg_public_key)
 
         self.wg.create_wg_interface(ip_cliente)
         self.logger.info("Interfaz Wireguard inicializada")
 
     def configure_as_peer(self, nombre_endpoint, id_red_privada, ip_cliente, listen_port):
         self.logger.info(f"Configurando como peer: {nombre_endpoint} en red {id_red_privada}")
-        endpoint_ip_WG, id_endpoint = self.orquestador.create_endpoint(id_red_privada, nombre_endpoint)
-        if endpoint_ip_WG == -1:
+        # Las llaves se generan antes para que el orquestador pueda registrar
+        # el peer en la misma RPC que asigna la IP
+        self.wg_private_key, self.wg_public_key = self.wg.create_keys()
+
+        self.logger.info(f"Aprovisionando endpoint con clave: {self.wg_public_key}")
+        config = self.orquestador.provision_endpoint(self.session_token, id_red_privada, nombre_endpoint,
+                                                     self.wg_public_key, ip_cliente, listen_port)
+        if config == -1:
             self.logger.error("Error al configurar el peer!")
             return -1
+        endpoint_ip_WG = config["wireguard_ip"]
         self.logger.info(f"IP de Wireguard asignada: {endpoint_ip_WG}")
+        self.logger.debug("Allowed IPs: %s", config['allowed_ips'])
+        self.logger.debug("Configuración del servidor - Clave: %s, Puerto: %s, IP: %s",
+                          config['server_public_key'], config['server_port'], config['server_public_ip'])
 
-        # Verificar si la interfaz existe
         self.logger.info("Creando nueva interfaz Wireguard")
-        self.init_wireguard_interface(endpoint_ip_WG)
-
-        # Configurar peer en local
-        self.logger.info("Obteniendo configuración del servidor...")
-        allowed_ips = self.orquestador.get_allowed_ips(id_red_privada)
-        self.logger.debug(f"Allowed IPs: {allowed_ips}")
-        
-        wg_o_pk, wg_o_port, wg_o_ip = self.orquestador.get_wireguard_config()
-        self.logger.debug(f"Configuración del servidor - Clave: {wg_o_pk}, Puerto: {wg_o_port}, IP: {wg_o_ip}")
+        self.wg.create_wg_interface(endpoint_ip_WG)
 
         self.logger.info("Creando peer local...")
-        result = self.wg.add_peer(wg_o_pk, allowed_ips, wg_o_ip, wg_o_port)
+        self.wg.add_peer(config["server_public_key"], config["allowed_ips"],
+                         config["server_public_ip"], config["server_port"])
         self.logger.info("Peer local creado")
 
-        # Registrar peer en el servidor
-        self.logger.info(f"Registrando peer en servidor con clave: {self.wg_public_key}")
-        ip_wg_peer = self.orquestador.create_peer(self.wg_public_key, allowed_ips, endpoint_ip_WG, listen_port, ip_cliente)
-        
-        result = self.orquestador.complete_endpoint(id_red_privada, id_endpoint, 
-                                                  self.wg_public_key, allowed_ips, 
-                                                  ip_cliente, listen_port)
-        self.logger.debug(f"Resultado completar endpoint: {result}")
-
-        return ip_wg_peer
+        return endpoint_ip_WG
 
     def register_peer(self, public_key, allowed_ips, ip_cliente, listen_port):
         self.logger.info(f"Registrando nuevo peer con IP: {ip_cliente}")
-        endpoint_ip_WG = self.orquestador.create_peer(public_key, allowed_ips, ip_cliente, listen_port)
+        endpoint_ip_WG = self.orquestador.create_peer(self.session_token, public_key, allowed_ips, ip_cliente, listen_port, ip_cliente)
         if endpoint_ip_WG == -1:
             self.logger.error("Error al registrar peer en servidor")
             return
@@ -237,18 +320,30 @@ class ClientAsDeamon:
 
 
 if __name__ == "__main__":
-    if geteuid() != 0:
+    parser = argparse.ArgumentParser(description="Daemon del cliente LinkGuard")
+    parser.add_argument("server_address", help="IP del orquestador")
+    parser.add_argument("public_ip", help="IP pública del cliente")
+    parser.add_argument("--backend", choices=("kernel", "memory"), default="kernel",
+                        help="Interfaz Wireguard real o simulada en memoria (no requiere root)")
+    parser.add_argument("--backend-latency", type=float, default=DEFAULT_COMMAND_LATENCY,
+                        help="Segundos que tarda cada comando simulado con --backend memory")
+    parser.add_argument("--log-level", default=DEFAULT_LOG_LEVEL,
+                        choices=("DEBUG", "INFO", "WARNING", "ERROR"), type=str.upper,
+                        help="Nivel mínimo de la bitácora (DEBUG registra cada llamada)")
+    parser.add_argument("--log-json", action="store_true",
+                        help="Escribir la bitácora como un objeto JSON por línea")
+    parser.add_argument("--request-sample", type=float, default=DEFAULT_REQUEST_SAMPLE,
+                        help="Fracción de las llamadas exitosas que se registran (las fallidas siempre)")
+    parser.add_argument("--slow-command", type=float, default=DEFAULT_SLOW_COMMAND,
+                        help="Segundos a partir de los cuales un comando ip/wg se registra como lento (0 = nunca)")
+    args = parser.parse_args()
+
+    if args.backend == "kernel" and geteuid() != 0:
         print("Se necesita permisos de administrador para ejecutar el servidor")
         exit()
-    
-    if len(argv) < 3:
-        print("Ingresa la IP del orquestador!")
-        print("Ingresa la IP del orquestador!")
-        exit()
 
-    # Configuración
-    SERVER_ADDRESS = argv[1]#"localhost"  # Cambiar por la dirección del servidor
-    CLIENT_PUBLIC_IP = argv[2]#"0.0.0.0"  # Cambiar por la IP pública del cliente
-    
-    client_as_deamon = ClientAsDeamon(SERVER_ADDRESS, CLIENT_PUBLIC_IP) 
+    executor = MemoryExecutor(latency=args.backend_latency) if args.backend == "memory" else None
+    setup_logging(args.log_level, json_output=args.log_json)
+    client_as_deamon = ClientAsDeamon(args.server_address, args.public_ip, executor=executor,
+                                      request_sample=args.request_sample, slow_command=args.slow_command)
     client_as_deamon.start_server()
@@ -4,6 +4,8 @@ import sys
 import os
 import logging
 
+from pooled_transport import PooledTransport
+
 # Configuración de logger
 LOG_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
 logging.basicConfig(level=logging.INFO, format=LOG_FORMAT)
@@ -11,10 +13,12 @@ logger = logging.getLogger('WireGuard-CLI')
 
 # Constantes
 DEFAULT_DAEMON_ADDRESS = "http://0.0.0.0:3041/"
+# Campos que muestra ver_endpoints
+ENDPOINT_FIELDS = ["id", "name", "wireguard_ip"]
 
 class WireGuardCLI:
     def __init__(self, daemon_address=DEFAULT_DAEMON_ADDRESS):
-        self.daemon = xmlrpc.client.ServerProxy(daemon_address)
+        self.daemon = xmlrpc.client.ServerProxy(daemon_address, transport=PooledTransport(pool_size=1))
         logger.info(f"Conectado al daemon en {daemon_address}")
 
     def registrar_usuario(self, nombre, email, password):
@@ -67,6 +71,30 @@ class WireGuardCLI:
         print(f"✓ Red '{nombre}' creada - ID: {result}")
         return True
 
+    def borrar_red_privada(self, id_red_privada):
+        logger.info(f"Eliminando red privada: {id_red_privada}")
+        result = self.daemon.delete_private_network(id_red_privada)
+        if not result:
+            logger.error("Error al eliminar red privada")
+            print("✗ Error: No se encontró la red privada")
+            return False
+
+        logger.info("Red privada eliminada")
+        print(f"✓ Red {id_red_privada} eliminada")
+        return True
+
+    def borrar_endpoint(self, id_red_privada, id_endpoint):
+        logger.info(f"Eliminando endpoint {id_endpoint} de la red {id_red_privada}")
+        result = self.daemon.delete_endpoint(id_red_privada, id_endpoint)
+        if not result:
+            logger.error("Error al eliminar endpoint")
+            print("✗ Error: No se encontró el endpoint")
+            return False
+
+        logger.info("Endpoint eliminado")
+        print(f"✓ Endpoint {id_endpoint} eliminado")
+        return True
+
     def ver_redes_privadas(self):
         logger.info("Solicitando listado de redes privadas")
         result = self.daemon.get_private_networks()
@@ -82,15 +110,26 @@ class WireGuardCLI:
 
     def ver_endpoints(self, id_red_privada):
         logger.info(f"Solicitando endpoints para red ID: {id_red_privada}")
-        result = self.daemon.get_endpoints(id_red_privada)
+        result = []
+        cursor = 0
+        # Se piden solo los campos que se muestran, una página a la vez
+        while cursor != -1:
+            page = self.daemon.get_endpoints(id_red_privada, ENDPOINT_FIELDS, cursor)
+            if page == -1:
+                logger.error(f"No se encontró la red {id_red_privada}")
+                print("✗ Error: No se encontró la red privada")
+                return
+            if not result and page["endpoints"]:
+                print(f"\n🔌 Endpoints para red {id_red_privada}:")
+            for endpoint in page["endpoints"]:
+                result.append(endpoint)
+                print(f"  {len(result)}. {endpoint['name']} (ID: {endpoint['id']}) {endpoint['wireguard_ip']}")
+            cursor = page["next_cursor"]
+
         if not result:
             logger.warning(f"No se encontraron endpoints para red {id_red_privada}")
             print("No hay endpoints disponibles")
             return
-        
-        print(f"\n🔌 Endpoints para red {id_red_privada}:")
-        for i, endpoint in enumerate(result, 1):
-            print(f"  {i}. {endpoint['nombre']} (ID: {endpoint['id']})")
         return result
 
     def conectar_endpoint(self, id_endpoint, id_red_privada):
@@ -174,6 +213,16 @@ COMMAND_MAP = {
         "args": (1, 2),
         "desc": "Crear red privada: <nombre> [segmento_red]"
     },
+    "borrar_red_privada": {
+        "func": "borrar_red_privada",
+        "args": 1,
+        "desc": "Eliminar red privada y sus endpoints: <id_red_privada>"
+    },
+    "borrar_red_peer": {
+        "func": "borrar_endpoint",
+        "args": 2,
+        "desc": "Eliminar endpoint: <id_red_privada> <id_endpoint>"
+    },
     "ver_redes_privadas": {
         "func": "ver_redes_privadas",
         "args": 0,
@@ -0,0 +1,128 @@
+## Transporte XML-RPC con conexiones persistentes
+import http.client
+import threading
+import time
+import xmlrpc.client
+
+# Conexiones ociosas que se conservan por host
+DEFAULT_POOL_SIZE = 4
+# Segundos que una conexión ociosa se considera reutilizable
+DEFAULT_IDLE_TIMEOUT = 10.0
+# Límite para establecer la conexión TCP
+DEFAULT_CONNECT_TIMEOUT = 5.0
+# Límite para recibir la respuesta de una RPC
+DEFAULT_READ_TIMEOUT = 60.0
+
+
+class PooledTransport(xmlrpc.client.Transport):
+    """
+    Transporte XML-RPC que reutiliza conexiones HTTP/1.1 (keep-alive).
+
+    Cada petición toma una conexión libre del pool (o abre una nueva) y la
+    devuelve al terminar, por lo que un mismo ServerProxy puede usarse desde
+    varios hilos. Las conexiones que pasan más de `idle_timeout` segundos sin
+    uso se descartan en lugar de reutilizarse.
+    """
+
+    def __init__(self, pool_size=DEFAULT_POOL_SIZE,
+                 idle_timeout=DEFAULT_IDLE_TIMEOUT,
+                 connect_timeout=DEFAULT_CONNECT_TIMEOUT,
+                 read_timeout=DEFAULT_READ_TIMEOUT,
+                 use_datetime=False, use_builtin_types=False, headers=()):
+        super().__init__(use_datetime=use_datetime,
+                         use_builtin_types=use_builtin_types, headers=headers)
+        self.pool_size = pool_size
+        self.idle_timeout = idle_timeout
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        # Conexiones ociosas {host: [(HTTPConnection, último uso)]}
+        self._idle = {}
+        self._lock = threading.Lock()
+
+    def request(self, host, handler, request_body, verbose=False):
+        # Una conexión reutilizada pudo ser cerrada por el servidor mientras
+        # estaba ociosa: se descarta y se intenta con la siguiente, hasta
+        # llegar a una conexión nueva
+        while True:
+            conn, reused = self._acquire(host)
+            try:
+                return self._post(conn, host, handler, request_body, verbose)
+            except xmlrpc.client.Fault:
+                # La conexión ya regresó al pool
+                raise
+            except (http.client.RemoteDisconnected, ConnectionError):
+                conn.close()
+                if not reused:
+                    raise
+            except Exception:
+                conn.close()
+                raise
+
+    def close(self):
+        """
+        Cierra todas las conexiones ociosas del pool
+        """
+        with self._lock:
+            idle, self._idle = self._idle, {}
+        for connections in idle.values():
+            for conn, _ in connections:
+                conn.close()
+
+    def _acquire(self, host):
+        now = time.monotonic()
+        stale = []
+        conn = None
+        with self._lock:
+            connections = self._idle.get(host)
+            while connections:
+                candidate, last_used = connections.pop()
+                if now - last_used <= self.idle_timeout:
+                    conn = candidate
+                    break
+                stale.append(candidate)
+        for candidate in stale:
+            candidate.close()
+        if conn is not None:
+            return conn, True
+
+        chost, _, _ = self.get_host_info(host)
+        conn = http.client.HTTPConnection(chost, timeout=self.connect_timeout)
+        conn.connect()
+        conn.sock.settimeout(self.read_timeout)
+        return conn, False
+
+    def _release(self, host, conn):
+        with self._lock:
+            connections = self._idle.setdefault(host, [])
+            if len(connections) < self.pool_size:
+                connections.append((conn, time.monotonic()))
+                return
+        conn.close()
+
+    def _post(self, conn, host, handler, request_body, verbose):
+        _, extra_headers, _ = self.get_host_info(host)
+        conn.set_debuglevel(1 if verbose else 0)
+        conn.putrequest("POST", handler, skip_accept_encoding=True)
+        for key, value in list(self._headers) + list(extra_headers or []):
+            conn.putheader(key, value)
+        conn.putheader("Content-Type", "text/xml")
+        conn.putheader("User-Agent", self.user_agent)
+        conn.putheader("Content-Length", str(len(request_body)))
+        conn.endheaders(request_body)
+
+        response = conn.getresponse()
+        if response.status != 200:
+            response.read()
+            conn.close()
+            raise xmlrpc.client.ProtocolError(host + handler, response.status,
+                                              response.reason,
+                                              dict(response.getheaders()))
+        self.verbose = verbose
+        try:
+            # parse_response lee el cuerpo completo aunque la RPC sea un Fault
+            return self.parse_response(response)
+        finally:
+            if response.will_close or not response.isclosed():
+                conn.close()
+            else:
+                self._release(host, conn)
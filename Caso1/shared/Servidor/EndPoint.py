@@ -1,16 +1,77 @@
+import ipaddress
+import sys
+
+# Campos que se pueden pedir en get_endpoints, en el orden de to_dict()
+ENDPOINT_FIELDS = ("id", "name", "private_network_id", "wireguard_ip", "wireguard_port",
+                   "wireguard_public_key", "public_ip", "allowed_ips")
+
+
+def _encode_ip(ip):
+    """
+    Guarda una IPv4 como entero (28 bytes en lugar de ~60 de la cadena);
+    cualquier otro valor (None, "", un nombre) se conserva tal cual
+    """
+    if isinstance(ip, str) and ip:
+        try:
+            return int(ipaddress.IPv4Address(ip))
+        except ValueError:
+            return ip
+    return ip
+
+
+def _decode_ip(value):
+    if type(value) is int:
+        return str(ipaddress.IPv4Address(value))
+    return value
+
+
 class Endpoint:
+    # Sin __dict__ por instancia: con un millón de endpoints el orquestador
+    # guarda solo estos campos
+    __slots__ = ("id", "name", "private_network_id", "_wireguard_ip", "_wireguard_port",
+                 "wireguard_private_key", "wireguard_public_key", "_public_ip",
+                 "allowed_ips", "config_wireguard")
+
     def __init__(self, id_endpoint, name, private_network_id):
         self.id = id_endpoint
         self.name = name
         self.private_network_id = private_network_id
-        self.wireguard_ip = ""
-        self.wireguard_port = ""
+        self._wireguard_ip = ""
+        self._wireguard_port = None
         self.wireguard_private_key = ""
         self.wireguard_public_key = ""
 
-        self.public_ip = ""
+        self._public_ip = ""
+        self.allowed_ips = ()
+
+        # Solo se crea al guardar una configuración
+        self.config_wireguard = None
+
+    # Las IPs se guardan como enteros y el puerto como int, pero se leen y
+    # escriben como antes
+    @property
+    def wireguard_ip(self):
+        return _decode_ip(self._wireguard_ip)
+
+    @wireguard_ip.setter
+    def wireguard_ip(self, wireguard_ip):
+        self._wireguard_ip = _encode_ip(wireguard_ip)
 
-        self.config_wireguard = dict()
+    @property
+    def public_ip(self):
+        return _decode_ip(self._public_ip)
+
+    @public_ip.setter
+    def public_ip(self, public_ip):
+        self._public_ip = _encode_ip(public_ip)
+
+    @property
+    def wireguard_port(self):
+        return self._wireguard_port
+
+    @wireguard_port.setter
+    def wireguard_port(self, wireguard_port):
+        self._wireguard_port = int(wireguard_port) if wireguard_port not in (None, "") else None
 
     def get_id(self):
         return self.id
@@ -35,6 +96,9 @@ class Endpoint:
     
     def get_public_ip(self):
         return self.public_ip
+
+    def get_allowed_ips(self):
+        return self.allowed_ips
     
     def set_private_network_id(self, private_network_id):
         self.private_network_id = private_network_id
@@ -43,23 +107,43 @@ class Endpoint:
         self.config_wireguard = config
 
     def set_wireguard_public_key(self,wg_public_key):
-        self.wireguard_private_key = wg_public_key
-
-    def set_allowed_ips(self, wg_public_key):
         self.wireguard_public_key = wg_public_key
+
+    def set_allowed_ips(self, allowed_ips):
+        # Los bloques se repiten entre endpoints de la misma red
+        self.allowed_ips = tuple(sys.intern(str(block)) for block in allowed_ips or ())
+
+    def set_public_ip(self, public_ip):
+        self.public_ip = public_ip
     
     def set_listen_port(self, listen_port):
         self.wireguard_port = listen_port
 
     def set_wireguard_ip(self, wireguard_ip):
         self.wireguard_ip = wireguard_ip
-    
+
+    def to_dict(self, fields=None):
+        """
+        Campos del endpoint para XML-RPC (sin la llave privada); `fields`
+        limita la respuesta a un subconjunto de ENDPOINT_FIELDS
+        """
+        return {field: self._field(field) for field in (fields or ENDPOINT_FIELDS)}
+
+    def _field(self, field):
+        if field == "allowed_ips":
+            return list(self.allowed_ips)
+        if field in ("id", "name", "private_network_id"):
+            return getattr(self, field)
+        # XML-RPC sin allow_none: los campos vacíos viajan como ""
+        return getattr(self, field) or ""
         
     def __str__(self) -> str:
         str_endpoint = "[Interface]\n"
         str_endpoint += "PrivateKey = " + self.wireguard_private_key + "\n"
         str_endpoint += "Address = " + self.wireguard_ip + "/32\n"
-        str_endpoint += "ListenPort = " + self.wireguard_port + "\n"
+        str_endpoint += "ListenPort = " + str(self.wireguard_port) + "\n"
+        if not self.config_wireguard:
+            return str_endpoint
         str_endpoint += "\n"
         str_endpoint += "[Peer]\n"
         str_endpoint += "PublicKey = " + self.config_wireguard["public_key"] + "\n"
@@ -1,7 +1,19 @@
 import ipaddress
+import logging
+import threading
 from EndPoint import Endpoint
+from ip_allocator import IPAllocator
+
+logger = logging.getLogger(__name__)
+
+# Endpoints por página de get_endpoints
+DEFAULT_ENDPOINT_PAGE = 500
+MAX_ENDPOINT_PAGE = 5000
 
 class PrivateNetwork:
+    __slots__ = ("id", "name", "mask_network", "segment", "allocator", "num_endpoints",
+                 "endpoints", "lock")
+
     def __init__(self, id_red, name, segment, mask_network):
         self.id = id_red
         self.name = name
@@ -9,11 +21,14 @@ class PrivateNetwork:
         self.mask_network = mask_network
         self.segment = ipaddress.IPv4Network(f"{segment}/{mask_network}")
         
-        self.available_hosts = self.calcule_network_range()
+        # El primer host se reserva para el orquestador
+        self.allocator = IPAllocator(self.segment, reserved=1)
         self.num_endpoints = 0
         
-        # Diccionario de endpoints {id: Endpoint}
+        # Diccionario de endpoints {id (int): Endpoint}
         self.endpoints = dict()
+        # Serializa la asignación de ids e IPs entre RPCs concurrentes
+        self.lock = threading.Lock()
 
     def get_id(self):
         return str(self.id)
@@ -28,61 +43,111 @@ class PrivateNetwork:
         return self.mask_network
     
     def get_available_hosts(self):
-        if len(self.available_hosts) == 0: # type: ignore
-            return []
-        return [str(host) for host in self.available_hosts] # type: ignore
+        return list(self.allocator.iter_free())
+
+    def get_available_ranges(self):
+        """
+        IPs permitidas de la red: el segmento completo, que incluye al
+        orquestador y a todos los peers; no depende de cuántas IPs estén libres
+        """
+        return [str(self.segment)]
     
     def get_endpoints(self):
         return list(self.endpoints.values())
     
+    def page_endpoints(self, cursor=0, limit=DEFAULT_ENDPOINT_PAGE):
+        """
+        Hasta `limit` endpoints con id >= cursor, en orden de id.
+
+        Los ids se asignan con un contador, así que la página se arma
+        consultando ids consecutivos en el diccionario sin recorrer los
+        endpoints anteriores al cursor.
+
+        Returns:
+            tuple: (endpoints, cursor de la siguiente página o -1 si no hay más)
+        """
+        endpoints = []
+        endpoint_id = max(int(cursor), 0)
+        end = self.num_endpoints
+        while endpoint_id < end and len(endpoints) < limit:
+            endpoint = self.endpoints.get(endpoint_id)
+            if endpoint is not None:
+                endpoints.append(endpoint)
+            endpoint_id += 1
+        return endpoints, (endpoint_id if endpoint_id < end else -1)
+
     def add_endpoint(self, endpoint):
-        self.endpoints[str(endpoint.id)] = endpoint
+        self.endpoints[int(endpoint.id)] = endpoint
 
     def get_network_mask(self):
         return self.segment.netmask
 
     def set_segment(self, segment):
         self.segment = ipaddress.IPv4Network(segment)
+        self.allocator = IPAllocator(self.segment, reserved=1)
 
     def set_network_mask(self, mask_network):
         self.mask_network = mask_network
         ip = self.segment.exploded.split('/')[0]
         self.segment = ipaddress.IPv4Network(f"{ip}/{mask_network}")
+        self.allocator = IPAllocator(self.segment, reserved=1)
 
-    def calcule_network_range(self) -> list:
-        hosts = list(self.segment.hosts())
-        self.available_hosts = hosts.pop(0)
-        return hosts
-    
     def calculate_next_host(self):
-        print("Calculando siguiente dirección IP disponible...")
-        if len(self.available_hosts) == 0: # type: ignore
-            print("No hay direcciones IP disponibles!")
-            return None
-        next_host = self.available_hosts.pop(0) # type: ignore
-        return str(next_host)
+        next_host = self.allocator.allocate()
+        if next_host is None:
+            logger.warning("No hay direcciones IP disponibles en la red %s", self.name)
+        return next_host
+
+    def release_host(self, host):
+        return self.allocator.release(host)
     
     def create_endpoint(self, name) -> Endpoint:
-        print("Creando endpoint... en la red privada: " + self.name)
-        endpoint = Endpoint(id_endpoint=self.num_endpoints, name=name, private_network_id=self.id)
-        
-        endpoint.wireguard_ip = self.calculate_next_host()
-        endpoint.wireguard_port = "51820"
-        
-        self.add_endpoint(endpoint)
-        
-        self.num_endpoints += 1
+        """
+        Crea un endpoint con la siguiente IP libre; regresa None (sin agregar
+        nada a la red) si ya no hay direcciones disponibles
+        """
+        logger.debug("Creando endpoint %s en la red privada %s", name, self.name)
+        with self.lock:
+            wireguard_ip = self.calculate_next_host()
+            if wireguard_ip is None:
+                return None
+            endpoint = Endpoint(id_endpoint=self.num_endpoints, name=name, private_network_id=self.id)
+
+            endpoint.wireguard_ip = wireguard_ip
+            endpoint.wireguard_port = 51820
+
+            self.add_endpoint(endpoint)
+
+            self.num_endpoints += 1
         return endpoint 
     
+    def remove_endpoint(self, endpoint_id):
+        """
+        Quita el endpoint y devuelve su IP al asignador
+        """
+        with self.lock:
+            endpoint = self.endpoints.pop(self._key(endpoint_id), None)
+            if endpoint is not None and endpoint.wireguard_ip:
+                self.release_host(endpoint.wireguard_ip)
+        return endpoint
+
     def get_endpoint_by_id(self, endpoint_id):
         try:
             # Diccionario de endpoints self.endpoints {id: Endpoint}
-            endpoint = self.endpoints[endpoint_id]
+            endpoint = self.endpoints[self._key(endpoint_id)]
             return endpoint
         except:
             return -1
             
         
 
+    @staticmethod
+    def _key(endpoint_id):
+        # Las RPCs entregan el id como cadena; las llaves son enteros
+        try:
+            return int(endpoint_id)
+        except (TypeError, ValueError):
+            return None
+
     def __str__(self):
         return "ID: " + str(self.id) + " IP Address: " + str(self.segment) + " Mask Network: " + str(self.mask_network) 
\ No newline at end of file
@@ -1,82 +1,89 @@
-import subprocess
 import os
 import logging
 from typing import Optional, Tuple, Dict, List, Union
+import ipaddress
+import threading
 import time
 
+from common.keygen import KeyPool, generate_keypair, genpsk, _decode_key
+from common.command_executor import CommandExecutor, CommandError, thread_command_time, add_thread_command_time
+
+# Seconds the batcher waits for more peers before applying a batch
+PEER_BATCH_DELAY = 0.02
+# Maximum peers applied in a single wg addconf call
+PEER_BATCH_MAX = 1000
+# Seconds between two reconciliations of the interface
+RECONCILE_INTERVAL = 60.0
+# Maximum peers changed by a single wg set call (bounds argv length)
+RECONCILE_CHUNK = 500
+# Directory where the nftables rulesets are saved
+NFT_RULES_DIR = "/etc/nftables.d"
+
 class WireGuardConfigurator:
     """
     A comprehensive WireGuard configuration manager that handles interface creation,
     peer management, and firewall configuration with proper error handling.
     """
 
-    def __init__(self, interface_name: str = "wg10", listen_port: int = 51820):
+    def __init__(self, interface_name: str = "wg10", listen_port: int = 51820,
+                 key_pool: Optional[KeyPool] = None,
+                 executor: Optional[CommandExecutor] = None):
         """
         Initialize the WireGuard configurator.
         
         Args:
             interface_name: Name of the WireGuard interface (default: wg10)
             listen_port: Port for WireGuard to listen on (default: 51820)
+            key_pool: Optional pool of pre-generated key pairs
+            executor: Command executor (one is created if not given)
         """
         self.interface_name = interface_name
         self.listen_port = listen_port
+        self.key_pool = key_pool
+        self.executor = executor or CommandExecutor()
         self.private_key: Optional[str] = None
         self.public_key: Optional[str] = None
+        # Sources allowed to reach the listen port (nft set elements)
+        self.firewall_sources = set()
+        self.external_interface: Optional[str] = None
         self.logger = self._setup_logger()
 
     def _setup_logger(self) -> logging.Logger:
         """Configure and return a logger instance."""
         logger = logging.getLogger(__name__)
-        logger.setLevel(logging.INFO)
-        handler = logging.StreamHandler()
-        formatter = logging.Formatter(
-            '%(asctime)s - %(name)s - %(levelname)s - %(message)s')
-        handler.setFormatter(formatter)
-        logger.addHandler(handler)
+        # When the process configured logging (structured_log.setup_logging)
+        # records propagate to its queued handler and level; otherwise the
+        # configurators share a handler of their own, added only once
+        if not logger.handlers and not logging.getLogger().handlers:
+            logger.setLevel(logging.INFO)
+            handler = logging.StreamHandler()
+            formatter = logging.Formatter(
+                '%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+            handler.setFormatter(formatter)
+            logger.addHandler(handler)
         return logger
 
     def create_keys(self) -> Tuple[str, str]:
         """
-        Generate WireGuard public and private keys securely.
+        Generate WireGuard public and private keys in-process (Curve25519).
         
         Returns:
             Tuple of (private_key, public_key)
-            
-        Raises:
-            RuntimeError: If key generation fails
         """
-        try:
-            self.logger.info("Generating WireGuard keys...")
-            
-            # Generate private key
-            result = subprocess.run(
-                ["wg", "genkey"],
-                capture_output=True,
-                text=True,
-                check=True
-            )
-            private_key = result.stdout.strip()
-            
-            # Generate public key
-            result = subprocess.run(
-                ["wg", "pubkey"],
-                input=private_key,
-                capture_output=True,
-                text=True,
-                check=True
-            )
-            public_key = result.stdout.strip()
-
-            self.private_key = private_key
-            self.public_key = public_key
-            
-            self.logger.info("Successfully generated WireGuard keys")
-            return private_key, public_key
+        self.logger.info("Generating WireGuard keys...")
+        private_key, public_key = self._new_keypair()
 
-        except subprocess.CalledProcessError as e:
-            error_msg = f"Key generation failed: {e.stderr.strip()}"
-            self.logger.error(error_msg)
-            raise RuntimeError(error_msg)
+        self.private_key = private_key
+        self.public_key = public_key
+        
+        self.logger.info("Successfully generated WireGuard keys")
+        return private_key, public_key
+
+    def _new_keypair(self) -> Tuple[str, str]:
+        """Take a key pair from the pool, or generate one if there is no pool."""
+        if self.key_pool is not None:
+            return self.key_pool.get()
+        return generate_keypair()
 
     def create_interface(self, ip_wg: str, peer_config: Optional[Dict] = None) -> bool:
         """
@@ -96,7 +103,7 @@ class WireGuardConfigurator:
         Raises:
             RuntimeError: If operation fails or unsupported OS
         """
-        if not self._check_os_support():
+        if not self.executor.simulated and not self._check_os_support():
             error_msg = "Unsupported operating system (Linux required)"
             self.logger.error(error_msg)
             raise RuntimeError(error_msg)
@@ -108,22 +115,18 @@ class WireGuardConfigurator:
         try:
             self.logger.info(f"Creating WireGuard interface {self.interface_name}...")
             
-            # Create interface
-            self._run_command(f"ip link add dev {self.interface_name} type wireguard")
-            self._run_command(f"ip address add {ip_wg} dev {self.interface_name}")
+            # Create, address and bring up the interface in one ip process
+            self.executor.ip_batch([
+                ["link", "add", "dev", self.interface_name, "type", "wireguard"],
+                ["address", "add", ip_wg, "dev", self.interface_name],
+                ["link", "set", "up", "dev", self.interface_name],
+            ])
 
             # Configure interface
-            subprocess.run(
-                ["wg", "set", self.interface_name, "listen-port", str(self.listen_port)],
-                check=True
-            )
-            
+            cmd = ["wg", "set", self.interface_name, "listen-port", str(self.listen_port)]
             if self.private_key:
-                subprocess.run(
-                    ["wg", "set", self.interface_name, "private-key", "/dev/stdin"],
-                    input=self.private_key.encode(),
-                    check=True
-                )
+                cmd += ["private-key", "/dev/stdin"]
+            self.executor.run(cmd, input=self.private_key)
             
             # Add peer if configuration provided
             if peer_config:
@@ -133,13 +136,11 @@ class WireGuardConfigurator:
                     endpoint_ip=peer_config.get('endpoint_ip'),
                     endpoint_port=peer_config.get('endpoint_port')
                 )
-
-            self._run_command(f"ip link set up dev {self.interface_name}")
             
             self.logger.info(f"Successfully created interface {self.interface_name}")
             return True
 
-        except subprocess.CalledProcessError as e:
+        except CommandError as e:
             error_msg = f"Failed to create interface: {e.stderr.strip()}"
             self.logger.error(error_msg)
             # Attempt cleanup if something went wrong
@@ -180,85 +181,385 @@ class WireGuardConfigurator:
             
             self.logger.info(f"Adding peer {public_key[:8]}...")
             
-            cmd = [f"wg set {self.interface_name} peer {public_key} allowed-ips {allowed_ips_str}"]
+            cmd = ["wg", "set", self.interface_name, "peer", public_key,
+                   "allowed-ips", allowed_ips_str]
             
             if endpoint_ip and endpoint_port:
-                cmd.append(f"endpoint {endpoint_ip}:{endpoint_port}")
+                cmd += ["endpoint", f"{endpoint_ip}:{endpoint_port}"]
             
-            self._run_command(" ".join(cmd))
+            self.executor.run(cmd)
             self.logger.info(f"Successfully added peer {public_key[:8]}")
 
         except ValueError as e:
             self.logger.error(f"Invalid configuration: {e}")
             raise
-        except subprocess.CalledProcessError as e:
+        except CommandError as e:
             error_msg = f"Failed to add peer: {e.stderr.strip()}"
             self.logger.error(error_msg)
             raise RuntimeError(error_msg)
 
+    def render_config(self, peers: List[Dict], include_interface: bool = True) -> str:
+        """
+        Render a WireGuard configuration (wg setconf format).
+        
+        Args:
+            peers: Peer dictionaries with the same keys as peer_config
+            include_interface: Whether to emit the [Interface] section
+            
+        Returns:
+            str: The configuration text
+            
+        Raises:
+            ValueError: If a peer has no public key, invalid allowed_ips or a
+                value that would break out of its line
+        """
+        lines = []
+        if include_interface:
+            lines.append("[Interface]")
+            lines.append(f"ListenPort = {self.listen_port}")
+            if self.private_key:
+                lines.append(f"PrivateKey = {self.private_key}")
+
+        for peer in peers:
+            if not peer.get('public_key'):
+                raise ValueError("public_key is required")
+            lines.append("")
+            lines.append("[Peer]")
+            lines.append(f"PublicKey = {peer['public_key']}")
+            allowed_ips = peer.get('allowed_ips') or []
+            if isinstance(allowed_ips, str):
+                allowed_ips = [allowed_ips]
+            elif not isinstance(allowed_ips, list):
+                raise ValueError("allowed_ips must be string or list of strings")
+            if allowed_ips:
+                lines.append(f"AllowedIPs = {', '.join(allowed_ips)}")
+            endpoint_ip, endpoint_port = peer.get('endpoint_ip'), peer.get('endpoint_port')
+            if endpoint_ip and endpoint_port:
+                if ":" in endpoint_ip:
+                    endpoint_ip = f"[{endpoint_ip}]"
+                lines.append(f"Endpoint = {endpoint_ip}:{endpoint_port}")
+        # Each value must stay on its own line, otherwise it could add
+        # settings (e.g. another AllowedIPs) to the peer
+        for line in lines:
+            if "\n" in line or "\r" in line:
+                raise ValueError(f"Invalid value in config line: {line.splitlines()[0]!r}")
+        return "\n".join(lines) + "\n"
+
+    def apply_peers(self, peers: List[Dict], replace: bool = False) -> None:
+        """
+        Program many peers with a single wg call.
+        
+        Args:
+            peers: Peer dictionaries with the same keys as peer_config
+            replace: If True the interface is synced to exactly this peer set
+                (wg syncconf); otherwise the peers are added (wg addconf)
+                
+        Raises:
+            RuntimeError: If operation fails
+            ValueError: If a peer configuration is invalid
+        """
+        command = "syncconf" if replace else "addconf"
+        config = self.render_config(peers, include_interface=replace)
+        try:
+            self.logger.info(f"Applying {len(peers)} peers with wg {command}...")
+            self.executor.run(["wg", command, self.interface_name, "/dev/stdin"], input=config)
+            self.logger.info(f"Successfully applied {len(peers)} peers")
+        except CommandError as e:
+            error_msg = f"Failed to apply peers: {e.stderr.strip()}"
+            self.logger.error(error_msg)
+            raise RuntimeError(error_msg)
+
+    def dump(self) -> Tuple[Dict, Dict[str, Dict]]:
+        """
+        Read the kernel state of the interface with a single wg show dump.
+        
+        Returns:
+            Tuple of (interface, {public_key: peer}) as returned by parse_dump
+            
+        Raises:
+            RuntimeError: If the interface does not exist or wg fails
+        """
+        try:
+            result = self.executor.run(["wg", "show", self.interface_name, "dump"])
+        except CommandError as e:
+            error_msg = f"Failed to dump interface: {e.stderr.strip()}"
+            self.logger.error(error_msg)
+            raise RuntimeError(error_msg)
+        return parse_dump(result.stdout)
+
+    def latest_handshakes(self) -> Dict[str, int]:
+        """
+        Read the last handshake time of every peer of the interface.
+        
+        Returns:
+            Dict of {public_key: unix timestamp}, 0 if the peer never handshaked
+            
+        Raises:
+            RuntimeError: If the interface does not exist or wg fails
+        """
+        try:
+            result = self.executor.run(["wg", "show", self.interface_name, "latest-handshakes"])
+        except CommandError as e:
+            error_msg = f"Failed to read handshakes: {e.stderr.strip()}"
+            self.logger.error(error_msg)
+            raise RuntimeError(error_msg)
+        handshakes = {}
+        for line in result.stdout.splitlines():
+            fields = line.split()
+            if len(fields) == 2:
+                handshakes[fields[0]] = int(fields[1])
+        return handshakes
+
+    def set_peers(self, peers: List[Dict], remove: List[str],
+                  set_interface: bool = False) -> None:
+        """
+        Apply peer changes with wg set, several peers per call.
+        
+        Unlike addconf, allowed-ips given here replace the current ones.
+        
+        Args:
+            peers: Peers to add or update (same keys as peer_config)
+            remove: Public keys of the peers to remove
+            set_interface: Also set the private key and listen port
+            
+        Raises:
+            RuntimeError: If operation fails
+        """
+        changes = [["peer", key, "remove"] for key in remove]
+        for peer in peers:
+            allowed_ips = peer.get('allowed_ips') or []
+            if isinstance(allowed_ips, str):
+                allowed_ips = [allowed_ips]
+            args = ["peer", peer['public_key'], "allowed-ips", ",".join(allowed_ips)]
+            if peer.get('endpoint_ip') and peer.get('endpoint_port'):
+                endpoint_ip = peer['endpoint_ip']
+                if ":" in endpoint_ip:
+                    endpoint_ip = f"[{endpoint_ip}]"
+                args += ["endpoint", f"{endpoint_ip}:{peer['endpoint_port']}"]
+            changes.append(args)
+
+        chunks = [changes[i:i + RECONCILE_CHUNK] for i in range(0, len(changes), RECONCILE_CHUNK)]
+        if set_interface and not chunks:
+            chunks = [[]]
+        try:
+            for i, chunk in enumerate(chunks):
+                cmd = ["wg", "set", self.interface_name]
+                stdin = None
+                if set_interface and i == 0:
+                    cmd += ["listen-port", str(self.listen_port)]
+                    if self.private_key:
+                        cmd += ["private-key", "/dev/stdin"]
+                        stdin = self.private_key
+                for args in chunk:
+                    cmd += args
+                self.executor.run(cmd, input=stdin)
+        except CommandError as e:
+            error_msg = f"Failed to set peers: {e.stderr.strip()}"
+            self.logger.error(error_msg)
+            raise RuntimeError(error_msg)
+
+    def set_routes(self, networks: List[str], remove: bool = False) -> None:
+        """
+        Route (or stop routing) networks through this interface, all in one
+        ip process.
+        
+        Args:
+            networks: Networks in CIDR notation
+            remove: Delete the routes instead of adding them
+            
+        Raises:
+            RuntimeError: If operation fails
+        """
+        if not networks:
+            return
+        if remove:
+            commands = [["route", "del", network, "dev", self.interface_name] for network in networks]
+        else:
+            commands = [["route", "replace", network, "dev", self.interface_name] for network in networks]
+        try:
+            self.executor.ip_batch(commands)
+        except CommandError as e:
+            error_msg = f"Failed to update routes: {e.stderr.strip()}"
+            self.logger.error(error_msg)
+            raise RuntimeError(error_msg)
+
+    @property
+    def firewall_table(self) -> str:
+        """Name of the nftables table owned by this interface."""
+        return f"linkguard_{self.interface_name}"
+
+    def render_firewall(self) -> str:
+        """
+        Render the nftables script for this interface.
+        
+        The table is declared, deleted and declared again in the same script,
+        so applying it replaces any previous version atomically and never
+        duplicates rules. Allowed sources live in an interval set, so matching
+        a packet is a single set lookup whatever the number of sources.
+        
+        Returns:
+            str: Script for nft -f
+        """
+        table = self.firewall_table
+        lines = [
+            f"table inet {table}",
+            f"delete table inet {table}",
+            f"table inet {table} {{",
+            "    set allowed_sources {",
+            "        type ipv4_addr",
+            "        flags interval",
+            "        auto-merge",
+        ]
+        if self.firewall_sources:
+            lines.append(f"        elements = {{ {', '.join(sorted(self.firewall_sources))} }}")
+        lines += [
+            "    }",
+            "    chain input {",
+            "        type filter hook input priority 0; policy accept;",
+            f"        ip saddr @allowed_sources udp dport {self.listen_port} accept",
+            f"        udp dport {self.listen_port} accept",
+            "    }",
+            "    chain forward {",
+            "        type filter hook forward priority 0; policy accept;",
+            f'        iifname "{self.interface_name}" accept',
+            f'        oifname "{self.interface_name}" accept',
+            "    }",
+        ]
+        if self.external_interface:
+            lines += [
+                "    chain postrouting {",
+                "        type nat hook postrouting priority srcnat; policy accept;",
+                f'        oifname "{self.external_interface}" masquerade',
+                "    }",
+            ]
+        lines.append("}")
+        return "\n".join(lines) + "\n"
+
     def configure_firewall(self, local_ips: List[str], external_interface: str = "eth0") -> None:
         """
         Configure firewall rules for WireGuard traffic.
         
+        The whole ruleset is applied atomically with a single nft -f; calling
+        it again only adds the new sources, it never duplicates rules.
+        
         Args:
-            local_ips: List of local IPs to allow (default allows any)
+            local_ips: List of local IPs or networks to allow
             external_interface: External network interface for NAT (default: eth0)
             
         Raises:
             RuntimeError: If operation fails
+            ValueError: If an IP is invalid
         """
+        sources = {self._firewall_source(ip) for ip in local_ips or []}
         try:
             self.logger.info("Configuring firewall rules...")
-            
-            # Base rules
-            rules = [
-                f"iptables -A INPUT -p udp --dport {self.listen_port} -j ACCEPT",
-                f"iptables -A FORWARD -i {self.interface_name} -j ACCEPT",
-                f"iptables -A FORWARD -o {self.interface_name} -j ACCEPT",
-                f"iptables -t nat -A POSTROUTING -o {external_interface} -j MASQUERADE"
-            ]
-            
-            # Add rules for specific IPs if provided
-            if local_ips:
-                for ip in local_ips:
-                    rules.insert(0, f"iptables -A INPUT -s {ip} -p udp --dport {self.listen_port} -j ACCEPT")
-
-            for rule in rules:
-                self._run_command(rule)
-                
+            self.external_interface = external_interface
+            self.firewall_sources |= sources
+            self.executor.run(["nft", "-f", "-"], input=self.render_firewall())
             self.logger.info("Successfully configured firewall rules")
 
-        except subprocess.CalledProcessError as e:
+        except CommandError as e:
             error_msg = f"Failed to configure firewall: {e.stderr.strip()}"
             self.logger.error(error_msg)
             raise RuntimeError(error_msg)
 
+    def add_firewall_peer(self, ip: str) -> None:
+        """
+        Allow a source with a single nft set element insert.
+        
+        Before configure_firewall() the source is only recorded and is
+        included when the ruleset is applied.
+        
+        Raises:
+            RuntimeError: If operation fails
+            ValueError: If the IP is invalid
+        """
+        source = self._firewall_source(ip)
+        if source in self.firewall_sources:
+            return
+        self.firewall_sources.add(source)
+        if self.external_interface is None:
+            return
+        try:
+            self.executor.run(["nft", "add", "element", "inet", self.firewall_table,
+                               "allowed_sources", f"{{ {source} }}"])
+        except CommandError as e:
+            self.firewall_sources.discard(source)
+            error_msg = f"Failed to allow {source}: {e.stderr.strip()}"
+            self.logger.error(error_msg)
+            raise RuntimeError(error_msg)
+
+    def remove_firewall_peer(self, ip: str) -> None:
+        """
+        Remove a source from the allowed set.
+        
+        Raises:
+            RuntimeError: If operation fails
+            ValueError: If the IP is invalid
+        """
+        self.remove_firewall_peers([ip])
+
+    def remove_firewall_peers(self, ips: List[str]) -> None:
+        """
+        Remove several sources from the allowed set with a single nft call.
+        
+        Raises:
+            RuntimeError: If operation fails
+            ValueError: If an IP is invalid
+        """
+        sources = {self._firewall_source(ip) for ip in ips} & self.firewall_sources
+        if not sources:
+            return
+        self.firewall_sources -= sources
+        if self.external_interface is None:
+            return
+        try:
+            self.executor.run(["nft", "delete", "element", "inet", self.firewall_table,
+                               "allowed_sources", f"{{ {', '.join(sorted(sources))} }}"])
+        except CommandError as e:
+            error_msg = f"Failed to remove {', '.join(sorted(sources))}: {e.stderr.strip()}"
+            self.logger.error(error_msg)
+            raise RuntimeError(error_msg)
+
+    @staticmethod
+    def _firewall_source(ip: str) -> str:
+        """Normalize an IPv4 address or network for the nft set."""
+        network = ipaddress.IPv4Network(ip, strict=False)
+        if network.prefixlen == 32:
+            return str(network.network_address)
+        return str(network)
+
     def save_firewall_rules(self) -> None:
         """
-        Save firewall rules to persistent storage.
+        Save the nftables table of this interface to persistent storage.
         
         Raises:
             RuntimeError: If operation fails
         """
         try:
             self.logger.info("Saving firewall rules...")
-            self._run_command("mkdir -p /etc/iptables")
-            self._run_command("iptables-save > /etc/iptables/rules.v4")
-            self._run_command("ip6tables-save > /etc/iptables/rules.v6")
+            os.makedirs(NFT_RULES_DIR, exist_ok=True)
+            rules = self.executor.run(["nft", "list", "table", "inet", self.firewall_table]).stdout
+            with open(os.path.join(NFT_RULES_DIR, f"{self.firewall_table}.nft"), "w") as rules_file:
+                rules_file.write(rules)
             self.logger.info("Firewall rules saved successfully")
-        except subprocess.CalledProcessError as e:
+        except CommandError as e:
             error_msg = f"Failed to save firewall rules: {e.stderr.strip()}"
             self.logger.error(error_msg)
             raise RuntimeError(error_msg)
+        except OSError as e:
+            error_msg = f"Failed to save firewall rules: {e}"
+            self.logger.error(error_msg)
+            raise RuntimeError(error_msg)
 
     def remove_interface(self) -> None:
         """Remove the WireGuard interface if it exists."""
         if self._interface_exists():
             try:
                 self.logger.info(f"Removing interface {self.interface_name}...")
-                self._run_command(f"ip link delete dev {self.interface_name}")
+                self.executor.run(["ip", "link", "delete", "dev", self.interface_name])
                 self.logger.info(f"Interface {self.interface_name} removed")
-            except subprocess.CalledProcessError as e:
+            except CommandError as e:
                 error_msg = f"Failed to remove interface: {e.stderr.strip()}"
                 self.logger.error(error_msg)
                 raise RuntimeError(error_msg)
@@ -274,9 +575,9 @@ class WireGuardConfigurator:
             raise RuntimeError(f"Interface {self.interface_name} does not exist")
             
         try:
-            self._run_command(f"ip link set up dev {self.interface_name}")
+            self.executor.run(["ip", "link", "set", "up", "dev", self.interface_name])
             self.logger.info(f"Interface {self.interface_name} brought up")
-        except subprocess.CalledProcessError as e:
+        except CommandError as e:
             error_msg = f"Failed to bring interface up: {e.stderr.strip()}"
             self.logger.error(error_msg)
             raise RuntimeError(error_msg)
@@ -292,9 +593,9 @@ class WireGuardConfigurator:
             raise RuntimeError(f"Interface {self.interface_name} does not exist")
             
         try:
-            self._run_command(f"ip link set down dev {self.interface_name}")
+            self.executor.run(["ip", "link", "set", "down", "dev", self.interface_name])
             self.logger.info(f"Interface {self.interface_name} brought down")
-        except subprocess.CalledProcessError as e:
+        except CommandError as e:
             error_msg = f"Failed to bring interface down: {e.stderr.strip()}"
             self.logger.error(error_msg)
             raise RuntimeError(error_msg)
@@ -306,68 +607,29 @@ class WireGuardConfigurator:
         Returns:
             str: Interface status ("up", "down", or "not found")
         """
-        try:
-            result = subprocess.run(
-                ["ip", "-o", "link", "show", self.interface_name],
-                capture_output=True,
-                text=True,
-                check=True
-            )
-            if "UP" in result.stdout:
-                return "up"
-            else:
-                return "down"
-        except subprocess.CalledProcessError:
+        result = self.executor.run(["ip", "-o", "link", "show", self.interface_name], check=False)
+        if result.returncode != 0:
             return "not found"
+        if "UP" in result.stdout:
+            return "up"
+        else:
+            return "down"
 
     # Private helper methods
     def _interface_exists(self) -> bool:
         """Check if the WireGuard interface exists."""
-        try:
-            subprocess.run(
-                ["ip", "link", "show", self.interface_name],
-                check=True,
-                stdout=subprocess.DEVNULL,
-                stderr=subprocess.DEVNULL
-            )
-            return True
-        except subprocess.CalledProcessError:
-            return False
+        result = self.executor.run(["ip", "link", "show", self.interface_name], check=False)
+        return result.returncode == 0
 
     def _check_os_support(self) -> bool:
         """Check if the OS is supported (Linux)."""
         return os.name == "posix" and os.uname().sysname == "Linux"
 
-    def _run_command(self, command: str) -> None:
-        """
-        Execute a shell command with error handling.
-        
-        Args:
-            command: The command to execute
-            
-        Raises:
-            RuntimeError: If command fails
-        """
-        try:
-            result = subprocess.run(
-                command,
-                shell=True,
-                check=True,
-                capture_output=True,
-                text=True
-            )
-            if result.stdout:
-                self.logger.debug(result.stdout.strip())
-        except subprocess.CalledProcessError as e:
-            error_msg = f"Command failed: {command}\nError: {e.stderr.strip()}"
-            self.logger.error(error_msg)
-            raise RuntimeError(error_msg)
-
     def _cleanup_interface(self) -> None:
         """Attempt to clean up interface if creation fails."""
         try:
             if self._interface_exists():
-                self._run_command(f"ip link delete dev {self.interface_name}")
+                self.executor.run(["ip", "link", "delete", "dev", self.interface_name])
         except RuntimeError:
             pass  # Don't mask original error with cleanup error
 
@@ -388,11 +650,11 @@ class WireGuardConfigurator:
         try:
             self.logger.info(f"Clearing interface {self.interface_name}...")
             
-            # Bring interface down first
-            self.interface_down()
-            
-            # Remove interface
-            self.remove_interface()
+            # Bring interface down and remove it in one ip process
+            self.executor.ip_batch([
+                ["link", "set", "down", "dev", self.interface_name],
+                ["link", "delete", "dev", self.interface_name],
+            ])
             
             # Reset keys
             self.private_key = None
@@ -401,7 +663,7 @@ class WireGuardConfigurator:
             self.logger.info(f"Successfully cleared interface {self.interface_name}")
             return True
 
-        except subprocess.CalledProcessError as e:
+        except CommandError as e:
             error_msg = f"Failed to clear interface: {e.stderr.strip()}"
             self.logger.error(error_msg)
             raise RuntimeError(error_msg)
@@ -412,48 +674,13 @@ class WireGuardConfigurator:
         
         Returns:
             Tuple of (private_key, public_key, preshared_key)
-            
-        Raises:
-            RuntimeError: If key generation fails
         """
-        try:
-            self.logger.info("Generating peer WireGuard keys...")
-            
-            # Generate private key
-            result = subprocess.run(
-                ["wg", "genkey"],
-                capture_output=True,
-                text=True,
-                check=True
-            )
-            private_key = result.stdout.strip()
-            
-            # Generate public key
-            result = subprocess.run(
-                ["wg", "pubkey"],
-                input=private_key,
-                capture_output=True,
-                text=True,
-                check=True
-            )
-            public_key = result.stdout.strip()
-            
-            # Generate preshared key
-            result = subprocess.run(
-                ["wg", "genpsk"],
-                capture_output=True,
-                text=True,
-                check=True
-            )
-            preshared_key = result.stdout.strip()
-
-            self.logger.info("Successfully generated peer keys")
-            return private_key, public_key, preshared_key
-
-        except subprocess.CalledProcessError as e:
-            error_msg = f"Peer key generation failed: {e.stderr.strip()}"
-            self.logger.error(error_msg)
-            raise RuntimeError(error_msg)
+        self.logger.info("Generating peer WireGuard keys...")
+        private_key, public_key = self._new_keypair()
+        preshared_key = genpsk()
+
+        self.logger.info("Successfully generated peer keys")
+        return private_key, public_key, preshared_key
         
     def get_interface_ip(self) -> Optional[str]:
         """
@@ -462,21 +689,16 @@ class WireGuardConfigurator:
         Returns:
             str: The current IP address with CIDR notation, or None if not found
         """
-        try:
-            result = subprocess.run(
-                ["ip", "-br", "-4", "addr", "show", "dev", self.interface_name],
-                capture_output=True,
-                text=True,
-                check=True
-            )
-            # El formato de salida es: wg0 UP 10.0.0.1/24
-            parts = result.stdout.strip().split()
-            if len(parts) >= 3:
-                self.current_ip = parts[2]
-                return self.current_ip
-            return None
-        except subprocess.CalledProcessError:
+        result = self.executor.run(["ip", "-br", "-4", "addr", "show", "dev", self.interface_name],
+                                   check=False)
+        if result.returncode != 0:
             return None
+        # El formato de salida es: wg0 UP 10.0.0.1/24
+        parts = result.stdout.strip().split()
+        if len(parts) >= 3:
+            self.current_ip = parts[2]
+            return self.current_ip
+        return None
 
     def change_interface_ip(self, new_ip: str, verify: bool = True) -> None:
         """
@@ -502,11 +724,12 @@ class WireGuardConfigurator:
             # Get current IP to remove it
             current_ip = self.get_interface_ip()
             
+            # Replace the address in one ip process
+            commands = []
             if current_ip:
-                self._run_command(f"ip addr del {current_ip} dev {self.interface_name}")
-            
-            # Add new IP
-            self._run_command(f"ip addr add {new_ip} dev {self.interface_name}")
+                commands.append(["addr", "del", current_ip, "dev", self.interface_name])
+            commands.append(["addr", "add", new_ip, "dev", self.interface_name])
+            self.executor.ip_batch(commands)
             self.current_ip = new_ip
             
             if verify:
@@ -519,7 +742,7 @@ class WireGuardConfigurator:
             
             self.logger.info(f"IP address changed to {new_ip}")
 
-        except subprocess.CalledProcessError as e:
+        except CommandError as e:
             error_msg = f"Failed to change IP address: {e.stderr.strip()}"
             self.logger.error(error_msg)
             raise RuntimeError(error_msg)
@@ -543,4 +766,315 @@ class WireGuardConfigurator:
                 return False
             return True
         except (ValueError, IndexError):
-            return False
\ No newline at end of file
+            return False
+
+
+class PeerBatcher:
+    """
+    Coalesces peers added concurrently (e.g. a burst of create_peer RPCs) into
+    a single wg addconf call.
+
+    add() queues the peer and blocks until the batch containing it has been
+    applied, so callers keep the semantics of add_peer. If a batch fails, its
+    peers are retried one by one so a single bad peer only fails its caller.
+    """
+
+    def __init__(self, configurator: WireGuardConfigurator,
+                 max_delay: float = PEER_BATCH_DELAY, max_batch: int = PEER_BATCH_MAX):
+        self.configurator = configurator
+        self.max_delay = max_delay
+        self.max_batch = max_batch
+        # Pending entries [peer, done event, error, seconds spent in commands]
+        self._pending: List[list] = []
+        self._cond = threading.Condition()
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name="peer-batcher", daemon=True)
+        self._thread.start()
+
+    def add(self, public_key: str,
+            allowed_ips: Union[str, List[str]] = None,  # type: ignore
+            endpoint_ip: Optional[str] = None,
+            endpoint_port: Optional[int] = None) -> None:
+        """
+        Add a peer as part of the next batch.
+        
+        Raises:
+            RuntimeError: If the peer could not be applied
+            ValueError: If a peer value is invalid (see validate_peer)
+        """
+        entry = [validate_peer(public_key, allowed_ips, endpoint_ip, endpoint_port),
+                 threading.Event(), None, 0.0]
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("Peer batcher is closed")
+            self._pending.append(entry)
+            self._cond.notify()
+        entry[1].wait()
+        # The commands ran on the batching thread on behalf of this caller
+        add_thread_command_time(entry[3])
+        if entry[2] is not None:
+            raise RuntimeError(entry[2])
+
+    def close(self) -> None:
+        """Apply the pending peers and stop the batching thread."""
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+        self._thread.join()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._pending and not self._closed:
+                    self._cond.wait()
+                if not self._pending:
+                    return
+                # Give concurrent callers a moment to join the batch
+                deadline = time.monotonic() + self.max_delay
+                while len(self._pending) < self.max_batch and not self._closed:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                batch = self._pending[:self.max_batch]
+                del self._pending[:self.max_batch]
+            self._apply(batch)
+
+    def _apply(self, batch):
+        start = thread_command_time()
+        try:
+            try:
+                self.configurator.apply_peers([entry[0] for entry in batch])
+            except (RuntimeError, ValueError) as e:
+                if len(batch) == 1:
+                    batch[0][2] = str(e)
+                else:
+                    for entry in batch:
+                        try:
+                            self.configurator.apply_peers([entry[0]])
+                        except (RuntimeError, ValueError) as e:
+                            entry[2] = str(e)
+        except Exception as e:
+            # Keep the batching thread alive; the callers see the error
+            self.configurator.logger.exception("Unexpected error applying peers")
+            for entry in batch:
+                if entry[2] is None:
+                    entry[2] = str(e) or type(e).__name__
+        finally:
+            # Never leave a caller waiting
+            elapsed = thread_command_time() - start
+            for entry in batch:
+                entry[3] = elapsed
+                entry[1].set()
+
+
+def validate_peer(public_key: str,
+                  allowed_ips: Union[str, List[str]] = None,  # type: ignore
+                  endpoint_ip: Optional[str] = None,
+                  endpoint_port: Optional[Union[int, str]] = None) -> Dict:
+    """
+    Check client supplied peer values before they reach a wg config.
+    
+    The public key must be a WireGuard key, every allowed IP an address or
+    network, the endpoint an IP address and the port in 1..65535.
+    
+    Returns:
+        Dict: The peer (same keys as peer_config) with allowed_ips as a list
+            and endpoint_port as an int
+        
+    Raises:
+        ValueError: If a value is invalid
+    """
+    if not public_key:
+        raise ValueError("public_key is required")
+    if not isinstance(public_key, str) or public_key != public_key.strip():
+        raise ValueError("Invalid WireGuard key encoding")
+    _decode_key(public_key)
+
+    if not allowed_ips:
+        allowed_ips = []
+    elif isinstance(allowed_ips, str):
+        allowed_ips = [allowed_ips]
+    elif not isinstance(allowed_ips, list):
+        raise ValueError("allowed_ips must be string or list of strings")
+    for ip in allowed_ips:
+        if not isinstance(ip, str) or ip != ip.strip():
+            raise ValueError(f"Invalid allowed IP: {ip!r}")
+        ipaddress.ip_network(ip, strict=False)
+
+    if endpoint_ip:
+        if not isinstance(endpoint_ip, str):
+            raise ValueError(f"Invalid endpoint IP: {endpoint_ip!r}")
+        ipaddress.ip_address(endpoint_ip)
+    if endpoint_port is not None:
+        # Ports typed on the client CLI arrive as strings
+        if isinstance(endpoint_port, str) and endpoint_port.isascii() and endpoint_port.isdigit():
+            endpoint_port = int(endpoint_port)
+        if isinstance(endpoint_port, bool) or not isinstance(endpoint_port, int) \
+                or not 1 <= endpoint_port <= 65535:
+            raise ValueError(f"Invalid endpoint port: {endpoint_port!r}")
+    return {
+        'public_key': public_key,
+        'allowed_ips': list(allowed_ips),
+        'endpoint_ip': endpoint_ip,
+        'endpoint_port': endpoint_port,
+    }
+
+
+def parse_dump(output: str) -> Tuple[Dict, Dict[str, Dict]]:
+    """
+    Parse the output of wg show <interface> dump.
+    
+    The first line describes the interface (private key, public key, listen
+    port, fwmark); every other line is a peer (public key, preshared key,
+    endpoint, allowed ips, latest handshake, rx, tx, persistent keepalive).
+    
+    Returns:
+        Tuple of (interface, {public_key: peer})
+    """
+    lines = output.splitlines()
+    interface: Dict = {}
+    peers: Dict[str, Dict] = {}
+    if not lines:
+        return interface, peers
+
+    fields = lines[0].split("\t")
+    if len(fields) >= 3:
+        interface = {
+            'private_key': None if fields[0] == "(none)" else fields[0],
+            'public_key': None if fields[1] == "(none)" else fields[1],
+            'listen_port': int(fields[2]) if fields[2].isdigit() else None,
+        }
+    for line in lines[1:]:
+        fields = line.split("\t")
+        if len(fields) < 8:
+            continue
+        peers[fields[0]] = {
+            'public_key': fields[0],
+            'endpoint': None if fields[2] == "(none)" else fields[2],
+            'allowed_ips': [] if fields[3] == "(none)" else fields[3].split(","),
+            'latest_handshake': int(fields[4]),
+            'transfer_rx': int(fields[5]),
+            'transfer_tx': int(fields[6]),
+        }
+    return interface, peers
+
+
+def _same_allowed_ips(desired: List[str], actual: List[str]) -> bool:
+    if set(desired) == set(actual):
+        return True
+    # The kernel prints normalized networks; only parse when the text differs
+    try:
+        return ({ipaddress.ip_network(ip, strict=False) for ip in desired} ==
+                {ipaddress.ip_network(ip, strict=False) for ip in actual})
+    except ValueError:
+        return False
+
+
+def diff_peers(desired: Dict[str, Dict], actual: Dict[str, Dict]) -> Tuple[List[Dict], List[str]]:
+    """
+    Compare the desired peers with the kernel peers.
+    
+    Endpoints are only set for new peers, since the kernel updates them
+    when a peer roams.
+    
+    Returns:
+        Tuple of (peers to add or update, public keys to remove)
+    """
+    to_set = []
+    for key, peer in desired.items():
+        allowed_ips = peer.get('allowed_ips') or []
+        if isinstance(allowed_ips, str):
+            allowed_ips = [allowed_ips]
+        current = actual.get(key)
+        if current is None:
+            to_set.append(dict(peer, allowed_ips=allowed_ips))
+        elif not _same_allowed_ips(allowed_ips, current['allowed_ips']):
+            to_set.append({'public_key': key, 'allowed_ips': allowed_ips})
+    to_remove = [key for key in actual if key not in desired]
+    return to_set, to_remove
+
+
+class WireGuardReconciler:
+    """
+    Keeps the kernel interface in line with the orchestrator registry.
+    
+    Each pass reads the kernel state with one wg show dump, diffs it against
+    desired_peers() and applies only the delta with wg set. Callers that
+    change the registry must do so before touching the kernel: the dump is
+    taken before the registry is read, so a peer being added or removed is
+    never undone by a concurrent pass.
+    """
+
+    def __init__(self, configurator: WireGuardConfigurator, desired_peers,
+                 address: Optional[str] = None, interval: float = RECONCILE_INTERVAL):
+        """
+        Args:
+            configurator: Configurator of the managed interface
+            desired_peers: Callable returning {public_key: peer}
+            address: Interface address, used to recreate a missing interface
+            interval: Seconds between periodic passes
+        """
+        self.configurator = configurator
+        self.desired_peers = desired_peers
+        self.address = address
+        self.interval = interval
+        self.logger = configurator.logger
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def reconcile(self) -> Dict[str, int]:
+        """
+        Run one reconciliation pass.
+        
+        Returns:
+            dict: Number of peers added, updated and removed
+        """
+        with self._lock:
+            try:
+                interface, actual = self.configurator.dump()
+            except RuntimeError:
+                if not self.address:
+                    raise
+                self.logger.warning(f"Interface {self.configurator.interface_name} missing, recreating it")
+                self.configurator.create_interface(self.address)
+                interface, actual = self.configurator.dump()
+
+            desired = self.desired_peers()
+            to_set, to_remove = diff_peers(desired, actual)
+            set_interface = (
+                interface.get('listen_port') != self.configurator.listen_port or
+                (self.configurator.private_key is not None and
+                 interface.get('private_key') != self.configurator.private_key))
+            if to_set or to_remove or set_interface:
+                self.configurator.set_peers(to_set, to_remove, set_interface=set_interface)
+
+            added = sum(1 for peer in to_set if peer['public_key'] not in actual)
+            stats = {'added': added, 'updated': len(to_set) - added, 'removed': len(to_remove)}
+            if to_set or to_remove:
+                self.logger.info(f"Reconciled {self.configurator.interface_name}: {stats}")
+            return stats
+
+    def start(self) -> None:
+        """Start the periodic reconciliation thread."""
+        if self._thread is None and self.interval > 0:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="wg-reconciler", daemon=True)
+            self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.reconcile()
+            except (RuntimeError, ValueError) as e:
+                self.logger.error(f"Reconciliation failed: {e}")
+            except Exception:
+                # A bad registry entry must not stop reconciliation for good
+                self.logger.exception("Unexpected error during reconciliation")
@@ -0,0 +1,68 @@
+## Benchmark: asignación de IPs con lista de hosts vs IPAllocator
+import argparse
+import ipaddress
+import time
+import tracemalloc
+
+from ip_allocator import IPAllocator
+
+PREFIXES = (24, 16, 12)
+
+
+class ListAllocator:
+    """
+    Implementación anterior de PrivateNetwork: lista de IPv4Address y pop(0)
+    """
+    def __init__(self, segment):
+        hosts = list(segment.hosts())
+        hosts.pop(0)
+        self.available_hosts = hosts
+
+    def allocate(self):
+        if len(self.available_hosts) == 0:
+            return None
+        return str(self.available_hosts.pop(0))
+
+
+def measure(factory, segment, allocs):
+    """
+    Regresa (bytes tras construir, segundos de construcción, asignaciones/s)
+    """
+    tracemalloc.start()
+    start = time.perf_counter()
+    allocator = factory(segment)
+    build_time = time.perf_counter() - start
+    memory, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    start = time.perf_counter()
+    for _ in range(allocs):
+        allocator.allocate()
+    elapsed = time.perf_counter() - start
+    return memory, build_time, allocs / elapsed if elapsed else float("inf")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de asignación de IPs")
+    parser.add_argument("--allocs", type=int, default=20000,
+                        help="Asignaciones medidas con IPAllocator")
+    parser.add_argument("--legacy-allocs", type=int, default=2000,
+                        help="Asignaciones medidas con la lista (pop(0) es O(n))")
+    args = parser.parse_args()
+
+    print(f"{'red':>6} {'implementación':>14} {'memoria':>12} {'construcción':>13} {'asign/s':>12}")
+    for prefix in PREFIXES:
+        segment = ipaddress.IPv4Network(f"100.64.0.0/{prefix}")
+        hosts = segment.num_addresses - 3
+        rows = (
+            ("lista", ListAllocator, min(args.legacy_allocs, hosts)),
+            ("bitmap", lambda seg: IPAllocator(seg, reserved=1), min(args.allocs, hosts)),
+        )
+        for name, factory, allocs in rows:
+            memory, build_time, rate = measure(factory, segment, allocs)
+            print(f"{'/' + str(prefix):>6} {name:>14} {memory / 1024:>9.1f} KiB "
+                  f"{build_time * 1000:>10.2f} ms {rate:>12,.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,54 @@
+## Benchmark: generación de pares de claves WireGuard
+import argparse
+import os
+import shutil
+import subprocess
+import sys
+import time
+
+# Módulos compartidos con el cliente (shared/common)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from common.keygen import KeyPool, X25519PrivateKey, generate_keypair
+
+
+def wg_keypair():
+    """
+    Implementación anterior: `wg genkey` y `wg pubkey` como subprocesos
+    """
+    private_key = subprocess.run(["wg", "genkey"], capture_output=True,
+                                 text=True, check=True).stdout.strip()
+    public_key = subprocess.run(["wg", "pubkey"], input=private_key, capture_output=True,
+                                text=True, check=True).stdout.strip()
+    return private_key, public_key
+
+
+def rate(generate, count):
+    start = time.perf_counter()
+    for _ in range(count):
+        generate()
+    return count / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de generación de claves")
+    parser.add_argument("--count", type=int, default=500, help="Pares de claves por medición")
+    args = parser.parse_args()
+
+    backend = "cryptography" if X25519PrivateKey is not None else "python puro"
+    if shutil.which("wg"):
+        print(f"{'wg genkey + wg pubkey':>26}: {rate(wg_keypair, args.count):>10,.0f} pares/s")
+    else:
+        print(f"{'wg genkey + wg pubkey':>26}: no disponible (wg no instalado)")
+    print(f"{'en proceso (' + backend + ')':>26}: {rate(generate_keypair, args.count):>10,.0f} pares/s")
+
+    # Con el pool lleno, una petición solo saca un par de la cola
+    pool = KeyPool(args.count).start()
+    while len(pool) < args.count:
+        time.sleep(0.05)
+    print(f"{'KeyPool (lleno)':>26}: {rate(pool.get, args.count):>10,.0f} pares/s")
+    pool.stop()
+
+
+if __name__ == "__main__":
+    main()
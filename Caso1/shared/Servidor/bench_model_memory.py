@@ -0,0 +1,111 @@
+## Benchmark: memoria por endpoint del modelo del orquestador
+import argparse
+import base64
+import gc
+import os
+import time
+import tracemalloc
+
+from subnet_pool import SubnetPool
+from usuario import Usuario
+import PrivateNetwork as rp
+
+
+class LegacyEndpoint:
+    """
+    Implementación anterior de Endpoint: __dict__ por instancia, IPs y
+    puerto como cadenas y un diccionario de configuración vacío
+    """
+    def __init__(self, id_endpoint, name, private_network_id):
+        self.id = id_endpoint
+        self.name = name
+        self.private_network_id = private_network_id
+        self.wireguard_ip = ""
+        self.wireguard_port = ""
+        self.wireguard_private_key = ""
+        self.wireguard_public_key = ""
+        self.public_ip = ""
+        self.allowed_ips = []
+        self.config_wireguard = dict()
+
+    def set_wireguard_public_key(self, wg_public_key):
+        self.wireguard_public_key = wg_public_key
+
+    def set_allowed_ips(self, allowed_ips):
+        self.allowed_ips = allowed_ips
+
+    def set_public_ip(self, public_ip):
+        self.public_ip = public_ip
+
+    def set_listen_port(self, listen_port):
+        self.wireguard_port = str(listen_port)
+
+
+def build(endpoints, networks):
+    """
+    Crea `endpoints` endpoints completos repartidos en `networks` redes
+
+    Returns:
+        Usuario: Dueño de todas las redes (mantiene vivo el modelo)
+    """
+    per_network = -(-endpoints // networks)
+    prefix = 32 - max(2, (per_network + 2).bit_length())
+    pool = SubnetPool("10.0.0.0/8", prefix)
+    usuario = Usuario("bench", "bench@example.com", "bench")
+    created = 0
+    for _ in range(networks):
+        segment = pool.allocate()
+        red = rp.PrivateNetwork(usuario.next_private_network_id(), "red",
+                                str(segment.network_address), segment.prefixlen)
+        usuario.add_private_network(red)
+        for _ in range(min(per_network, endpoints - created)):
+            endpoint = red.create_endpoint(f"ep{created}")
+            endpoint.set_wireguard_public_key(base64.b64encode(os.urandom(32)).decode())
+            # Igual que provision_endpoint: el segmento de la red
+            endpoint.set_allowed_ips(red.get_available_ranges())
+            endpoint.set_public_ip(f"198.51.{created >> 8 & 0xFF}.{created & 0xFF}")
+            endpoint.set_listen_port(51820)
+            created += 1
+    return usuario
+
+
+def measure(endpoints, networks):
+    """
+    Regresa (bytes por endpoint, segundos de construcción)
+    """
+    gc.collect()
+    tracemalloc.start()
+    start = time.perf_counter()
+    usuario = build(endpoints, networks)
+    elapsed = time.perf_counter() - start
+    memory, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del usuario
+    return memory / endpoints, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de memoria del modelo")
+    parser.add_argument("--endpoints", type=int, default=1000000,
+                        help="Endpoints que se crean")
+    parser.add_argument("--networks", type=int, default=10000,
+                        help="Redes privadas entre las que se reparten")
+    parser.add_argument("--legacy", action="store_true",
+                        help="Medir también el Endpoint anterior (basado en __dict__)")
+    args = parser.parse_args()
+
+    rows = [("slots", rp.Endpoint)]
+    if args.legacy:
+        rows.append(("dict", LegacyEndpoint))
+    current = rp.Endpoint
+    print(f"{'modelo':>8} {'endpoints':>10} {'redes':>7} {'bytes/endpoint':>15} {'total':>10} {'construcción':>13}")
+    for name, endpoint_class in rows:
+        rp.Endpoint = endpoint_class
+        per_endpoint, elapsed = measure(args.endpoints, args.networks)
+        print(f"{name:>8} {args.endpoints:>10,} {args.networks:>7,} {per_endpoint:>15,.0f} "
+              f"{per_endpoint * args.endpoints / 2**20:>6,.0f} MiB {elapsed:>11.1f} s")
+    rp.Endpoint = current
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+## Benchmark: costo de parsear wg show dump y calcular el delta
+import argparse
+import ipaddress
+import os
+import random
+import sys
+import time
+
+# Módulos compartidos con el cliente (shared/common)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from WG.configGeneratorServer import diff_peers, parse_dump
+
+NETWORK = ipaddress.IPv4Network("100.64.0.0/10")
+
+
+def build(peers, drift):
+    """
+    Regresa (salida de wg show dump, peers deseados) con `drift` peers
+    faltantes, sobrantes y con allowed-ips distintas
+    """
+    desired = {}
+    lines = ["PRIVATE=\tPUBLIC=\t51820\toff"]
+    for i in range(peers):
+        key = f"peer{i:08d}"
+        ip = f"{NETWORK.network_address + i + 2}/32"
+        desired[key] = {"public_key": key, "allowed_ips": [ip],
+                        "endpoint_ip": "192.0.2.1", "endpoint_port": 51820}
+        lines.append(f"{key}\t(none)\t192.0.2.1:51820\t{ip}\t0\t0\t0\toff")
+
+    rng = random.Random(1)
+    # Peers borrados a mano, con allowed-ips cambiadas y ajenos al registro
+    missing = set(rng.sample(range(1, peers + 1), drift))
+    changed = set(rng.sample(range(1, peers + 1), drift)) - missing
+    for i in sorted(changed):
+        lines[i] = lines[i].replace("/32", "/31")
+    lines = [line for i, line in enumerate(lines) if i not in missing]
+    for i in range(drift):
+        lines.append(f"stray{i:08d}\t(none)\t(none)\t(none)\t0\t0\t0\toff")
+    return "\n".join(lines) + "\n", desired
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark del reconciliador")
+    parser.add_argument("--peers", type=int, default=10000, help="Peers en la interfaz")
+    parser.add_argument("--drift", type=int, default=100,
+                        help="Peers faltantes, cambiados y sobrantes")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    output, desired = build(args.peers, args.drift)
+    parse_times, diff_times = [], []
+    for _ in range(args.repeat):
+        start = time.perf_counter()
+        _, actual = parse_dump(output)
+        parse_times.append(time.perf_counter() - start)
+        start = time.perf_counter()
+        to_set, to_remove = diff_peers(desired, actual)
+        diff_times.append(time.perf_counter() - start)
+
+    print(f"peers: {args.peers:,}  dump: {len(output) / 1024:.0f} KiB")
+    print(f"parse_dump: {min(parse_times) * 1000:.1f} ms  diff_peers: {min(diff_times) * 1000:.1f} ms")
+    print(f"delta: {len(to_set)} a agregar/actualizar, {len(to_remove)} a eliminar")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+## Benchmark: escritura y recuperación del estado en SQLite
+import argparse
+import os
+import statistics
+import tempfile
+import time
+
+from state_store import StateStore
+from subnet_pool import SubnetPool
+from usuario import Usuario
+import PrivateNetwork as rp
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de StateStore")
+    parser.add_argument("--endpoints", type=int, default=100000,
+                        help="Endpoints que se guardan")
+    parser.add_argument("--per-network", type=int, default=250,
+                        help="Endpoints por red privada")
+    args = parser.parse_args()
+
+    path = os.path.join(tempfile.mkdtemp(), "state.db")
+    store = StateStore(path)
+    pool = SubnetPool("100.64.0.0/10", 24)
+    usuario = Usuario("bench", "bench@example.com", "bench")
+    store.save_user(usuario)
+
+    latencies = []
+    start = time.perf_counter()
+    red = None
+    for i in range(args.endpoints):
+        if i % args.per_network == 0:
+            segment = pool.allocate()
+            red = rp.PrivateNetwork(usuario.next_private_network_id(), "red",
+                                    str(segment.network_address), segment.prefixlen)
+            usuario.add_private_network(red)
+        endpoint = red.create_endpoint(f"ep{i}")
+        endpoint.set_wireguard_public_key(f"key{i}")
+        t0 = time.perf_counter()
+        store.save_network(usuario.email, red)
+        store.save_endpoint(usuario.email, endpoint)
+        latencies.append(time.perf_counter() - t0)
+    store.flush()
+    elapsed = time.perf_counter() - start
+    store.close()
+
+    latencies.sort()
+    p99 = latencies[int(len(latencies) * 0.99)]
+    print(f"endpoints guardados: {args.endpoints:,} en {elapsed:.2f} s "
+          f"({args.endpoints / elapsed:,.0f} endpoints/s)")
+    print(f"latencia al encolar: media {statistics.mean(latencies) * 1e6:.1f} us, "
+          f"p99 {p99 * 1e6:.1f} us")
+    print(f"tamaño de la base: {os.path.getsize(path) / 1024 / 1024:.1f} MiB")
+
+    start = time.perf_counter()
+    store = StateStore(path)
+    usuarios = store.restore(SubnetPool("100.64.0.0/10", 24))
+    elapsed = time.perf_counter() - start
+    store.close()
+    redes = usuarios[usuario.email].get_num_private_networks()
+    print(f"recuperación: {redes:,} redes en {elapsed:.2f} s")
+
+
+if __name__ == "__main__":
+    main()
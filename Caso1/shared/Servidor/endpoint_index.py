@@ -0,0 +1,100 @@
+## Índices globales de endpoints del orquestador
+import threading
+
+
+class EndpointIndex:
+    """
+    Índices {IP de Wireguard: dueño} y {llave pública: dueño}, donde el dueño
+    es la tupla (email, id de red, id de endpoint).
+
+    Las subredes de las redes privadas no se traslapan, así que una IP de
+    Wireguard identifica a un solo endpoint en todo el orquestador. Se
+    mantienen al crear, completar y eliminar endpoints para que correlacionar
+    la salida de `wg show` no requiera recorrer usuarios y redes. Las lecturas
+    no toman el lock, las operaciones sobre los diccionarios son atómicas.
+
+    También cuenta, por shard, cuántos peers usan cada IP pública (varios
+    endpoints detrás de un NAT comparten la misma), para saber cuándo se
+    puede quitar del firewall.
+    """
+
+    def __init__(self):
+        self._by_ip = {}
+        self._by_public_key = {}
+        # Dueño -> (IP, llave pública) indexadas, para limpiar al reindexar
+        self._entries = {}
+        # (shard, IP pública) -> peers que la usan
+        self._sources = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def add(self, email, private_network_id, endpoint, shard=0) -> None:
+        """
+        Indexa (o reindexa tras completar) un endpoint
+        """
+        owner = (email, private_network_id, endpoint.get_id())
+        ip = endpoint.get_wireguard_ip() or None
+        public_key = endpoint.get_wireguard_public_key() or None
+        public_ip = endpoint.get_public_ip() or None
+        source = (shard, public_ip) if public_ip else None
+        with self._lock:
+            self._discard(owner)
+            if ip:
+                self._by_ip[ip] = owner
+            if public_key:
+                self._by_public_key[public_key] = owner
+            if source:
+                self._sources[source] = self._sources.get(source, 0) + 1
+            self._entries[owner] = (ip, public_key, source)
+
+    def remove(self, email, private_network_id, endpoint_id) -> None:
+        with self._lock:
+            self._discard((email, private_network_id, endpoint_id))
+
+    def by_ip(self, ip):
+        """
+        Regresa (email, id de red, id de endpoint) o None
+        """
+        return self._by_ip.get(ip)
+
+    def by_public_key(self, public_key):
+        """
+        Regresa (email, id de red, id de endpoint) o None
+        """
+        return self._by_public_key.get(public_key)
+
+    def add_source(self, public_ip, shard=0) -> None:
+        """
+        Cuenta un uso de la IP pública de un peer que no es de un endpoint
+        """
+        with self._lock:
+            self._sources[(shard, public_ip)] = self._sources.get((shard, public_ip), 0) + 1
+
+    def remove_source(self, public_ip, shard=0) -> None:
+        with self._lock:
+            self._release_source((shard, public_ip))
+
+    def source_in_use(self, public_ip, shard=0) -> bool:
+        """
+        Indica si algún peer del shard sigue usando la IP pública
+        """
+        return (shard, public_ip) in self._sources
+
+    def _release_source(self, source):
+        count = self._sources.get(source, 0) - 1
+        if count > 0:
+            self._sources[source] = count
+        else:
+            self._sources.pop(source, None)
+
+    def _discard(self, owner):
+        ip, public_key, source = self._entries.pop(owner, (None, None, None))
+        if source:
+            self._release_source(source)
+        # Solo se borra si la entrada sigue apuntando a este endpoint
+        if ip and self._by_ip.get(ip) == owner:
+            del self._by_ip[ip]
+        if public_key and self._by_public_key.get(public_key) == owner:
+            del self._by_public_key[public_key]
@@ -0,0 +1,143 @@
+## Asignador de direcciones IP de una red privada
+import heapq
+import ipaddress
+from typing import Iterator, Optional
+
+
+class IPAllocator:
+    """
+    Asigna las direcciones de host de un segmento sin materializarlas.
+
+    Cada dirección se representa como su desplazamiento entero respecto a la
+    dirección de red. Un bitmap (1 bit por dirección) responde en O(1) si una
+    dirección está ocupada; las direcciones nunca usadas se entregan en orden
+    con un puntero que solo avanza y las liberadas se guardan en un heap para
+    reutilizar primero la más baja en O(log n). Un /16 ocupa 8 KiB y un /8
+    2 MiB, en lugar de una lista con un IPv4Address por host.
+    """
+
+    def __init__(self, segment: ipaddress.IPv4Network, reserved: int = 0):
+        """
+        Args:
+            segment: Segmento del que se asignan direcciones
+            reserved: Primeros hosts que nunca se asignan (ej. el orquestador)
+        """
+        self.segment = segment
+        self._base = int(segment.network_address)
+        size = segment.num_addresses
+        if size > 2:
+            # Sin dirección de red ni de broadcast, igual que hosts()
+            first, last = 1, size - 2
+        else:
+            first, last = 0, size - 1
+        self._first = min(first + reserved, last + 1)
+        self._last = last
+        # Siguiente dirección nunca asignada
+        self._next = self._first
+        # Direcciones liberadas por debajo de self._next
+        self._freed = []
+        self._bitmap = bytearray((size + 7) // 8)
+        self._allocated = 0
+
+    def capacity(self) -> int:
+        """Número de direcciones asignables del segmento."""
+        return self._last - self._first + 1
+
+    def available(self) -> int:
+        """Número de direcciones libres."""
+        return self.capacity() - self._allocated
+
+    def __len__(self) -> int:
+        return self._allocated
+
+    def __contains__(self, ip) -> bool:
+        return self.is_allocated(ip)
+
+    def allocate(self) -> Optional[str]:
+        """
+        Asigna la dirección libre más baja.
+
+        Returns:
+            str: La dirección asignada, o None si el segmento está lleno
+        """
+        offset = self._allocate_offset()
+        if offset is None:
+            return None
+        return str(ipaddress.IPv4Address(self._base + offset))
+
+    def allocate_address(self, ip) -> bool:
+        """
+        Marca como ocupada una dirección concreta (ej. al recuperar estado).
+
+        Returns:
+            bool: False si la dirección está fuera de rango o ya ocupada
+        """
+        offset = self._offset(ip)
+        if offset is None or self._test(offset):
+            return False
+        self._set(offset)
+        self._allocated += 1
+        return True
+
+    def release(self, ip) -> bool:
+        """
+        Devuelve una dirección al segmento.
+
+        Returns:
+            bool: False si la dirección no estaba asignada
+        """
+        offset = self._offset(ip)
+        if offset is None or not self._test(offset):
+            return False
+        self._clear(offset)
+        self._allocated -= 1
+        if offset < self._next:
+            heapq.heappush(self._freed, offset)
+        return True
+
+    def is_allocated(self, ip) -> bool:
+        """Indica si una dirección está asignada."""
+        offset = self._offset(ip)
+        return offset is not None and self._test(offset)
+
+    def iter_free(self) -> Iterator[str]:
+        """Recorre las direcciones libres en orden ascendente."""
+        for offset in range(self._first, self._last + 1):
+            if not self._test(offset):
+                yield str(ipaddress.IPv4Address(self._base + offset))
+
+    def _allocate_offset(self) -> Optional[int]:
+        while self._freed:
+            offset = heapq.heappop(self._freed)
+            # Pudo ocuparse de nuevo con allocate_address()
+            if not self._test(offset):
+                break
+        else:
+            # Saltar direcciones ocupadas con allocate_address()
+            while self._next <= self._last and self._test(self._next):
+                self._next += 1
+            if self._next > self._last:
+                return None
+            offset = self._next
+            self._next += 1
+        self._set(offset)
+        self._allocated += 1
+        return offset
+
+    def _offset(self, ip) -> Optional[int]:
+        try:
+            offset = int(ipaddress.IPv4Address(ip)) - self._base
+        except ValueError:
+            return None
+        if self._first <= offset <= self._last:
+            return offset
+        return None
+
+    def _test(self, offset: int) -> bool:
+        return bool(self._bitmap[offset >> 3] & (1 << (offset & 7)))
+
+    def _set(self, offset: int) -> None:
+        self._bitmap[offset >> 3] |= 1 << (offset & 7)
+
+    def _clear(self, offset: int) -> None:
+        self._bitmap[offset >> 3] &= ~(1 << (offset & 7)) & 0xFF
@@ -0,0 +1,176 @@
+## Arrendamiento de las IPs de los endpoints
+import heapq
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Vigencia de un endpoint completo; cada handshake o renovación la extiende
+DEFAULT_LEASE_TTL = 7 * 24 * 3600
+# Vigencia de un endpoint creado que aún no registra su llave pública
+PENDING_LEASE_TTL = 600
+# Segundos entre dos revisiones de arrendamientos vencidos
+DEFAULT_LEASE_CHECK_INTERVAL = 60.0
+
+
+class LeaseTable:
+    """
+    Vencimientos de los endpoints {(email, red, endpoint): vencimiento}.
+
+    Un heap ordenado por vencimiento permite obtener los arrendamientos
+    vencidos sin recorrer toda la tabla; las renovaciones agregan una nueva
+    entrada y las anteriores se descartan al salir del heap.
+    """
+
+    def __init__(self):
+        self._expiry = {}
+        self._heap = []
+        # Llave pública -> arrendamiento, para renovar con los handshakes
+        self._by_public_key = {}
+        # Arrendamiento -> llave pública, para liberarlo sin recorrer la tabla
+        self._public_keys = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._expiry)
+
+    def grant(self, key, ttl, public_key=None, now=None) -> float:
+        """
+        Otorga (o reemplaza) el arrendamiento de un endpoint.
+
+        Returns:
+            float: Momento de vencimiento
+        """
+        expiry = (time.time() if now is None else now) + ttl
+        with self._lock:
+            self._expiry[key] = expiry
+            heapq.heappush(self._heap, (expiry, key))
+            if public_key:
+                previous = self._public_keys.get(key)
+                if previous is not None and previous != public_key:
+                    self._forget_public_key(key)
+                self._by_public_key[public_key] = key
+                self._public_keys[key] = public_key
+        return expiry
+
+    def renew(self, key, ttl, now=None):
+        """
+        Extiende un arrendamiento existente; nunca lo acorta.
+
+        Returns:
+            float: Nuevo vencimiento, o None si el endpoint no tiene arrendamiento
+        """
+        expiry = (time.time() if now is None else now) + ttl
+        with self._lock:
+            current = self._expiry.get(key)
+            if current is None:
+                return None
+            if expiry > current:
+                self._expiry[key] = expiry
+                heapq.heappush(self._heap, (expiry, key))
+                return expiry
+            return current
+
+    def renew_handshakes(self, handshakes, ttl) -> int:
+        """
+        Extiende los arrendamientos a partir de {llave pública: último handshake}.
+
+        Returns:
+            int: Arrendamientos renovados
+        """
+        renewed = 0
+        for public_key, handshake in handshakes.items():
+            if not handshake:
+                continue
+            key = self._by_public_key.get(public_key)
+            if key is not None and self.renew(key, ttl, now=handshake) is not None:
+                renewed += 1
+        return renewed
+
+    def release(self, key) -> None:
+        with self._lock:
+            self._expiry.pop(key, None)
+            self._forget_public_key(key)
+
+    def expiry(self, key):
+        return self._expiry.get(key)
+
+    def pop_expired(self, now=None):
+        """
+        Retira y regresa los arrendamientos vencidos
+        """
+        now = time.time() if now is None else now
+        expired = []
+        with self._lock:
+            while self._heap and self._heap[0][0] <= now:
+                expiry, key = heapq.heappop(self._heap)
+                # Entradas obsoletas: el arrendamiento se renovó o se liberó
+                if self._expiry.get(key) != expiry:
+                    continue
+                del self._expiry[key]
+                self._forget_public_key(key)
+                expired.append(key)
+        return expired
+
+    def _forget_public_key(self, key) -> None:
+        # Llamar con _lock tomado; la llave pública pudo pasar a otro endpoint
+        public_key = self._public_keys.pop(key, None)
+        if public_key is not None and self._by_public_key.get(public_key) == key:
+            del self._by_public_key[public_key]
+
+
+class LeaseSweeper:
+    """
+    Hilo que periódicamente renueva los arrendamientos con los handshakes y
+    entrega los vencidos, todos juntos, a `on_expired`
+    """
+
+    def __init__(self, table, handshakes, on_expired, ttl=DEFAULT_LEASE_TTL,
+                 interval=DEFAULT_LEASE_CHECK_INTERVAL):
+        """
+        Args:
+            table: LeaseTable
+            handshakes: Función que regresa {llave pública: último handshake}
+            on_expired: Función que recibe la lista de arrendamientos vencidos
+        """
+        self.table = table
+        self.handshakes = handshakes
+        self.on_expired = on_expired
+        self.ttl = ttl
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self) -> None:
+        if self._thread is None and self.interval > 0:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="lease-sweeper", daemon=True)
+            self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def sweep(self) -> int:
+        """
+        Returns:
+            int: Endpoints vencidos en esta pasada
+        """
+        self.table.renew_handshakes(self.handshakes(), self.ttl)
+        expired = self.table.pop_expired()
+        if expired:
+            self.on_expired(expired)
+        return len(expired)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.sweep()
+            except (RuntimeError, ValueError) as e:
+                logger.error("Error revisando arrendamientos: %s", e)
+            except Exception:
+                # Un error inesperado no debe detener el hilo para siempre
+                logger.exception("Error inesperado revisando arrendamientos")
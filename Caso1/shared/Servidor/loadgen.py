@@ -0,0 +1,250 @@
+## Generador de carga del plano de control: simula miles de daemons cliente
+import argparse
+import os
+import queue
+import socket
+import subprocess
+import sys
+import threading
+import time
+import xmlrpc.client
+
+# Módulos compartidos con el cliente (shared/common)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from common.keygen import generate_keypair
+
+DEFAULT_FLOWS = 1000
+DEFAULT_CONCURRENCY = 64
+# Etapas del flujo de un daemon, en orden
+STAGES = ("register_user", "identify_user", "create_private_network", "provision_endpoint")
+
+
+class Results:
+    """
+    Latencias y errores por RPC, compartidos por los hilos de carga
+    """
+
+    def __init__(self):
+        self.latencies = {stage: [] for stage in STAGES + ("flow",)}
+        self.errors = {stage: 0 for stage in STAGES + ("flow",)}
+        self._lock = threading.Lock()
+
+    def record(self, stage, seconds, ok=True):
+        with self._lock:
+            if ok:
+                self.latencies[stage].append(seconds)
+            else:
+                self.errors[stage] += 1
+
+
+def percentile(ordered, fraction):
+    """Percentil por rango más cercano de una lista ya ordenada."""
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+def run_flow(server, results, index, run_id, keypair, public_ip):
+    """
+    Flujo de un daemon nuevo: las mismas RPCs, en el mismo orden, que
+    register_user, identify_me, create_private_network y configure_as_peer
+    de ClientAsDeamon. La configuración local de Wireguard no toca el
+    orquestador y se omite.
+
+    Returns:
+        bool: True si todas las RPCs tuvieron éxito
+    """
+    email = f"load-{run_id}-{index}@example.com"
+    calls = (
+        ("register_user", lambda: server.register_user(f"load {index}", email, "secret"),
+         lambda r: bool(r)),
+        ("identify_user", lambda: server.identify_user(email, "secret"),
+         lambda r: bool(r)),
+    )
+    token = None
+    for stage, call, valid in calls:
+        token = _timed(results, stage, call, valid)
+        if token is None:
+            return False
+
+    network = _timed(results, "create_private_network",
+                     lambda: server.create_private_network(token, f"red-{index}"),
+                     lambda r: r != -1)
+    if network is None:
+        return False
+
+    _, public_key = keypair
+    config = _timed(results, "provision_endpoint",
+                    lambda: server.provision_endpoint(token, network, f"ep-{index}", public_key,
+                                                      public_ip, 51820),
+                    lambda r: r != -1)
+    return config is not None
+
+
+def _timed(results, stage, call, valid):
+    start = time.perf_counter()
+    try:
+        result = call()
+        ok = valid(result)
+    except (OSError, xmlrpc.client.Error):
+        result, ok = None, False
+    results.record(stage, time.perf_counter() - start, ok)
+    return result if ok else None
+
+
+def worker(url, jobs, results, run_id, keypairs, public_ip, start):
+    # Cada hilo es un daemon con su propia conexión keep-alive
+    server = xmlrpc.client.ServerProxy(url)
+    while True:
+        job = jobs.get()
+        if job is None:
+            return
+        index, offset = job
+        if offset is None:
+            # Lazo cerrado: cada hilo inicia un flujo en cuanto termina otro
+            arrival = time.perf_counter()
+        else:
+            # Llegadas abiertas: la latencia del flujo se mide desde su llegada
+            # programada, así que incluye el tiempo de espera si el
+            # orquestador no alcanza la tasa pedida
+            arrival = start + offset
+            delay = arrival - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+        ok = run_flow(server, results, index, run_id, keypairs[index], public_ip)
+        results.record("flow", time.perf_counter() - arrival, ok)
+
+
+def free_port():
+    """
+    Puerto TCP libre (lo elige el sistema)
+    """
+    with socket.socket() as sock:
+        sock.bind(("0.0.0.0", 0))
+        return sock.getsockname()[1]
+
+
+def check_port_free(port):
+    """
+    Falla si otro proceso ya escucha en el puerto: la carga iría contra él
+    en lugar del orquestador que se levanta
+    """
+    with socket.socket() as sock:
+        # Igual que server.py (allow_reuse_address)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        try:
+            sock.bind(("0.0.0.0", port))
+        except OSError as e:
+            raise RuntimeError(f"Port {port} is already in use: {e}")
+
+
+def spawn_server(port, args):
+    """
+    Levanta server.py en loopback con el backend en memoria y espera a que
+    acepte conexiones
+    """
+    check_port_free(port)
+    here = os.path.dirname(os.path.abspath(__file__))
+    cmd = [sys.executable, os.path.join(here, "server.py"), "127.0.0.1", "--port", str(port),
+           "--backend", "memory", "--backend-latency", str(args.backend_latency),
+           "--workers", str(args.workers), "--shards", str(args.shards),
+           "--supernet", args.supernet, "--network-prefix", str(args.network_prefix)]
+    process = subprocess.Popen(cmd, cwd=here, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"server.py exited with code {process.returncode}")
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=0.5).close()
+        except OSError:
+            time.sleep(0.1)
+            continue
+        # Quien aceptó la conexión debe ser el proceso recién levantado
+        if process.poll() is not None:
+            raise RuntimeError(f"server.py exited with code {process.returncode}")
+        return process
+    process.kill()
+    raise RuntimeError("server.py did not start listening")
+
+
+def report(results, elapsed, flows):
+    print(f"{'rpc':>24} {'n':>7} {'errores':>8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'max ms':>9}")
+    rpcs = 0
+    for stage in STAGES + ("flow",):
+        latencies = sorted(results.latencies[stage])
+        if stage != "flow":
+            rpcs += len(latencies) + results.errors[stage]
+        print(f"{stage:>24} {len(latencies):>7,} {results.errors[stage]:>8,} "
+              f"{percentile(latencies, 0.50) * 1000:>9.2f} {percentile(latencies, 0.95) * 1000:>9.2f} "
+              f"{percentile(latencies, 0.99) * 1000:>9.2f} "
+              f"{(latencies[-1] if latencies else 0) * 1000:>9.2f}")
+    completed = len(results.latencies["flow"])
+    print(f"{completed:,}/{flows:,} flujos completos en {elapsed:.2f} s: "
+          f"{completed / elapsed:,.1f} flujos/s, {rpcs / elapsed:,.1f} RPCs/s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generador de carga del orquestador")
+    parser.add_argument("--flows", type=int, default=DEFAULT_FLOWS,
+                        help="Daemons simulados (cada uno registra usuario, red y endpoint)")
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_CONCURRENCY,
+                        help="Daemons simultáneos como máximo")
+    parser.add_argument("--rate", type=float, default=0,
+                        help="Llegadas de daemons por segundo (0 = tan rápido como se pueda)")
+    parser.add_argument("--server", default=None,
+                        help="Orquestador ya iniciado, p. ej. http://127.0.0.1:8080/ (por defecto "
+                             "se levanta uno con --backend memory)")
+    parser.add_argument("--port", type=int, default=0,
+                        help="Puerto del orquestador que se levanta (0 = uno libre)")
+    parser.add_argument("--workers", type=int, default=16,
+                        help="Hilos del orquestador que se levanta")
+    parser.add_argument("--shards", type=int, default=1,
+                        help="Interfaces del orquestador que se levanta")
+    parser.add_argument("--supernet", default="100.64.0.0/10",
+                        help="Superred del orquestador que se levanta (cabe una red por daemon)")
+    parser.add_argument("--network-prefix", type=int, default=28,
+                        help="Prefijo de las redes del orquestador que se levanta")
+    parser.add_argument("--backend-latency", type=float, default=0.002,
+                        help="Latencia por comando simulado del orquestador que se levanta")
+    parser.add_argument("--public-ip", default="127.0.0.1",
+                        help="IP pública que reportan los daemons")
+    args = parser.parse_args()
+
+    # Las llaves se generan antes de medir: en el daemon salen de su KeyPool
+    start = time.perf_counter()
+    keypairs = [generate_keypair() for _ in range(args.flows)]
+    print(f"{args.flows:,} pares de llaves generados en {time.perf_counter() - start:.1f} s")
+
+    if args.server:
+        url, process = args.server, None
+    else:
+        port = args.port or free_port()
+        url = f"http://127.0.0.1:{port}/"
+        process = spawn_server(port, args)
+    try:
+        results = Results()
+        jobs = queue.Queue()
+        for index in range(args.flows):
+            jobs.put((index, index / args.rate if args.rate > 0 else None))
+        for _ in range(args.concurrency):
+            jobs.put(None)
+
+        run_id = f"{os.getpid()}-{int(time.time())}"
+        start = time.perf_counter()
+        threads = [threading.Thread(target=worker, daemon=True,
+                                    args=(url, jobs, results, run_id, keypairs, args.public_ip, start))
+                   for _ in range(args.concurrency)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        report(results, time.perf_counter() - start, args.flows)
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,170 @@
+## Servidor XML-RPC concurrente
+import selectors
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from xmlrpc.server import SimpleXMLRPCServer, SimpleXMLRPCRequestHandler
+
+# Número de hilos por defecto para atender peticiones
+DEFAULT_WORKERS = 16
+# Conexiones aceptadas que pueden esperar por un hilo libre (por hilo)
+PENDING_PER_WORKER = 4
+# Segundos que una conexión keep-alive ociosa permanece abierta
+KEEPALIVE_IDLE_TIMEOUT = 15.0
+# Segundos máximos para leer una petición una vez que empezó a llegar
+REQUEST_READ_TIMEOUT = 30.0
+
+
+class KeepAliveRequestHandler(SimpleXMLRPCRequestHandler):
+    """
+    Atiende una sola petición HTTP/1.1 por despacho.
+
+    Si el cliente pide mantener la conexión abierta, el servidor la estaciona
+    hasta que llegue la siguiente petición en lugar de retener un hilo.
+    """
+    protocol_version = "HTTP/1.1"
+    timeout = REQUEST_READ_TIMEOUT
+
+    def handle(self):
+        self.close_connection = True
+        self.handle_one_request()
+        self.keep_alive = not self.close_connection
+
+
+class PoolXMLRPCServer(SimpleXMLRPCServer):
+    """
+    SimpleXMLRPCServer que atiende cada conexión en un pool acotado de hilos.
+
+    El hilo de serve_forever() solo acepta conexiones; el procesamiento de la
+    petición (y cualquier llamada lenta a `wg`) ocurre en el pool, de modo que
+    una RPC lenta no bloquea a las demás. Cuando hay demasiadas conexiones
+    pendientes el hilo que acepta se bloquea y el resto espera en el backlog
+    del socket.
+
+    Las conexiones keep-alive ociosas se vigilan con un selector en un hilo
+    aparte y vuelven al pool solo cuando el cliente envía otra petición.
+    """
+
+    # Backlog del socket: las ráfagas de daemons no deben recibir ECONNREFUSED
+    request_queue_size = 128
+    daemon_threads = True
+
+    def __init__(self, addr, max_workers=DEFAULT_WORKERS,
+                 keepalive_timeout=KEEPALIVE_IDLE_TIMEOUT,
+                 requestHandler=KeepAliveRequestHandler, **kwargs):
+        self.max_workers = max_workers
+        self.keepalive_timeout = keepalive_timeout
+        self._pool = ThreadPoolExecutor(max_workers=max_workers,
+                                        thread_name_prefix="xmlrpc")
+        self._pending = threading.BoundedSemaphore(max_workers * PENDING_PER_WORKER)
+
+        # Conexiones keep-alive estacionadas {socket: (dirección, límite)}
+        self._parked = {}
+        self._parked_lock = threading.Lock()
+        self._selector = selectors.DefaultSelector()
+        self._wakeup_r, self._wakeup_w = socket.socketpair()
+        self._wakeup_r.setblocking(False)
+        self._selector.register(self._wakeup_r, selectors.EVENT_READ)
+        self._closed = False
+
+        super().__init__(addr, requestHandler=requestHandler, **kwargs)
+
+        self._watcher = threading.Thread(target=self._watch_parked,
+                                         name="xmlrpc-keepalive", daemon=True)
+        self._watcher.start()
+
+    def process_request(self, request, client_address):
+        """
+        Entrega la conexión al pool en lugar de atenderla en el hilo actual
+        """
+        self._pending.acquire()
+        try:
+            self._pool.submit(self._process_request_worker, request, client_address)
+        except RuntimeError:
+            # El pool ya fue cerrado
+            self._pending.release()
+            self.shutdown_request(request)
+
+    def finish_request(self, request, client_address):
+        """
+        Atiende una petición y regresa True si la conexión debe seguir abierta
+        """
+        handler = self.RequestHandlerClass(request, client_address, self)
+        return getattr(handler, "keep_alive", False)
+
+    def _process_request_worker(self, request, client_address):
+        keep_alive = False
+        try:
+            keep_alive = self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            if keep_alive and self.keepalive_timeout > 0 and not self._closed:
+                self._park(request, client_address)
+            else:
+                self.shutdown_request(request)
+            self._pending.release()
+
+    def _park(self, request, client_address):
+        with self._parked_lock:
+            self._parked[request] = (client_address,
+                                     time.monotonic() + self.keepalive_timeout)
+            self._selector.register(request, selectors.EVENT_READ)
+        try:
+            self._wakeup_w.send(b"\0")
+        except OSError:
+            pass
+
+    def _watch_parked(self):
+        """
+        Reenvía al pool las conexiones estacionadas que reciben datos y
+        cierra las que superan el tiempo de inactividad
+        """
+        while not self._closed:
+            try:
+                events = self._selector.select(timeout=1.0)
+            except (OSError, ValueError):
+                # El selector se cerró en server_close()
+                return
+
+            ready = []
+            with self._parked_lock:
+                for key, _ in events:
+                    if key.fileobj is self._wakeup_r:
+                        try:
+                            self._wakeup_r.recv(4096)
+                        except OSError:
+                            pass
+                        continue
+                    entry = self._parked.pop(key.fileobj, None)
+                    self._selector.unregister(key.fileobj)
+                    if entry is not None:
+                        ready.append((key.fileobj, entry[0]))
+
+                now = time.monotonic()
+                expired = [request for request, (_, deadline) in self._parked.items()
+                           if deadline < now]
+                for request in expired:
+                    del self._parked[request]
+                    self._selector.unregister(request)
+
+            for request in expired:
+                self.shutdown_request(request)
+            for request, client_address in ready:
+                self.process_request(request, client_address)
+
+    def server_close(self):
+        self._closed = True
+        super().server_close()
+        with self._parked_lock:
+            parked = list(self._parked)
+            self._parked.clear()
+            for request in parked:
+                self._selector.unregister(request)
+        for request in parked:
+            self.shutdown_request(request)
+        self._selector.close()
+        self._wakeup_r.close()
+        self._wakeup_w.close()
+        self._pool.shutdown(wait=True)
@@ -1,26 +1,104 @@
 ## Server-Orquestrador
-from xmlrpc.server import SimpleXMLRPCServer
+import os
+import sys
+
+# Módulos compartidos con el cliente (shared/common)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from xmlrpc.server import SimpleXMLRPCServer, SimpleXMLRPCRequestHandler, resolve_dotted_attribute
+from pool_server import PoolXMLRPCServer, KeepAliveRequestHandler, DEFAULT_WORKERS, KEEPALIVE_IDLE_TIMEOUT
 
 # Mis clases
 from usuario import Usuario
+from sessions import SessionTable, DEFAULT_SESSION_TTL
+from subnet_pool import SubnetPool, DEFAULT_SUPERNET, DEFAULT_NETWORK_PREFIX
+from state_store import StateStore
+from shards import ShardSet, DEFAULT_SHARDS
+from telemetry import TelemetryCollector, DEFAULT_TELEMETRY_INTERVAL
+from endpoint_index import EndpointIndex
+from leases import LeaseTable, LeaseSweeper, DEFAULT_LEASE_TTL, PENDING_LEASE_TTL, DEFAULT_LEASE_CHECK_INTERVAL
+from common.metrics import Metrics, CommandStats, MetricsPageMixin, DEFAULT_SLOW_COMMAND
+from common.structured_log import (setup_logging, RequestLog, RequestLogMixin, DEFAULT_LOG_LEVEL,
+                                   DEFAULT_REQUEST_SAMPLE)
 import PrivateNetwork as rp
+from EndPoint import ENDPOINT_FIELDS
 import WG.configGeneratorServer as wg
+from common.memory_executor import MemoryExecutor, DEFAULT_COMMAND_LATENCY
+from common.command_executor import thread_command_time
+
+import argparse
+import ipaddress
+import logging
+import threading
+from sys import exit
+
+logger = logging.getLogger("orquestador")
+
+# Puerto del servidor XML-RPC
+DEFAULT_PORT = 8080
+
+
+class MetricsRequestHandler(RequestLogMixin, MetricsPageMixin, KeepAliveRequestHandler):
+    """
+    Handler del servidor concurrente: RPCs por POST y métricas en GET /metrics
+    """
+
+
+class SimpleMetricsRequestHandler(RequestLogMixin, MetricsPageMixin, SimpleXMLRPCRequestHandler):
+    """
+    Handler del servidor secuencial: RPCs por POST y métricas en GET /metrics
+    """
 
-import os
-from sys import exit,argv
 
 class Servidor:
-    def __init__(self,public_ip, wg_port=51820):
+    def __init__(self,public_ip, wg_port=51820, workers=DEFAULT_WORKERS, session_ttl=DEFAULT_SESSION_TTL,
+                 keepalive_timeout=KEEPALIVE_IDLE_TIMEOUT, supernet=DEFAULT_SUPERNET,
+                 network_prefix=DEFAULT_NETWORK_PREFIX, state_db=None,
+                 reconcile_interval=wg.RECONCILE_INTERVAL, shards=DEFAULT_SHARDS,
+                 telemetry_interval=DEFAULT_TELEMETRY_INTERVAL, lease_ttl=DEFAULT_LEASE_TTL,
+                 lease_interval=DEFAULT_LEASE_CHECK_INTERVAL, backend="kernel",
+                 backend_latency=DEFAULT_COMMAND_LATENCY, request_sample=DEFAULT_REQUEST_SAMPLE,
+                 slow_command=DEFAULT_SLOW_COMMAND, port=DEFAULT_PORT):
         self.dir = "0.0.0.0"
-        self.port = 8080
-        self.xmlrpc_server = SimpleXMLRPCServer((self.dir, self.port))
+        self.port = port
+        # workers == 0 conserva el servidor secuencial original
+        if workers > 0:
+            self.xmlrpc_server = PoolXMLRPCServer((self.dir, self.port), max_workers=workers,
+                                                  keepalive_timeout=keepalive_timeout,
+                                                  requestHandler=MetricsRequestHandler)
+        else:
+            self.xmlrpc_server = SimpleXMLRPCServer((self.dir, self.port),
+                                                    requestHandler=SimpleMetricsRequestHandler)
         self.xmlrpc_server.register_instance(self)
+        # system.multicall: varias RPCs en un solo viaje
+        self.xmlrpc_server.register_multicall_functions()
+        # Latencia, errores y tiempo en comandos ip/wg/nft por RPC (ver
+        # _dispatch); se consultan con system.stats o en GET /metrics
+        self.metrics = Metrics("linkguard_rpc", command_time=thread_command_time)
+        # Tiempo de cada comando ip/wg/nft por tipo, interfaz y código de
+        # salida, y bitácora de los lentos; se consulta con system.command_stats
+        self.command_stats = CommandStats("linkguard_command", slow_threshold=slow_command)
+        self.xmlrpc_server.metrics = (self.metrics, self.command_stats)
+        self.xmlrpc_server.register_function(self.metrics.snapshot, "system.stats")
+        self.xmlrpc_server.register_function(self.command_stats.snapshot, "system.command_stats")
+        # Bitácora muestreada de RPCs (todas las que fallan)
+        self.request_log = RequestLog(logging.getLogger("orquestador.rpc"), request_sample)
 
-        # Usuario actual
-        self.usuario = None
+        # Sesiones abiertas {token: Usuario}
+        self.sesiones = SessionTable(session_ttl)
 
         # Lista de usuarios [id: Usuario]
         self.usuarios = {}
+        # Protege self.usuarios frente a RPCs concurrentes
+        self.usuarios_lock = threading.Lock()
+        # Subredes sin traslape para las redes privadas
+        self.subnet_pool = SubnetPool(supernet, network_prefix)
+        # Persistencia opcional: se recupera el estado antes de atender RPCs
+        self.store = None
+        if state_db:
+            self.store = StateStore(state_db)
+            self.usuarios = self.store.restore(self.subnet_pool)
+            logger.info("Estado recuperado: %d usuarios", len(self.usuarios))
         # Llave pública de Wireguard del orquestador
         self.wg_private_key = None
         self.wg_public_key = None
@@ -31,7 +109,42 @@ class Servidor:
         # La ip publica del servidor Wireguard
         self.public_ip = public_ip
 
-        self.wg = wg.WireGuardConfigurator()
+        # Backend de Wireguard: el kernel, o un modelo en memoria para pruebas
+        # y benchmarks sin root
+        if backend == "memory":
+            self.executor = MemoryExecutor(latency=backend_latency)
+        elif backend == "kernel":
+            self.executor = None
+        else:
+            raise ValueError(f"Unknown backend: {backend}")
+        # Interfaces Wireguard (wg10, wg11, ...); cada red privada vive en una
+        self.shards = ShardSet(shards, wg_port, self.wg_ip, self._desired_peers,
+                               reconcile_interval=reconcile_interval, executor=self.executor)
+        # Interfaz principal: llave y puerto que se anuncian por defecto
+        self.wg = self.shards[0].wg
+        # Los shards pueden compartir ejecutor (backend en memoria)
+        executors = {id(shard.wg.executor): shard.wg.executor for shard in self.shards}
+        for executor in executors.values():
+            executor.add_listener(self.command_stats.record)
+        # Peers registrados con create_peer que no pertenecen a un endpoint,
+        # por shard {llave pública: peer}
+        self.extra_peers = [{} for _ in self.shards]
+        # Las rutas solo se programan una vez creadas las interfaces
+        self.wireguard_ready = False
+        # Tráfico y handshakes por peer de todas las interfaces
+        self.telemetry = TelemetryCollector([shard.wg for shard in self.shards],
+                                            interval=telemetry_interval)
+        # Arrendamientos de los endpoints: los que no hacen handshake ni se
+        # renuevan dentro de lease_ttl se eliminan y liberan su IP
+        self.lease_ttl = lease_ttl
+        self.leases = LeaseTable()
+        # Endpoints por IP de Wireguard y por llave pública
+        self.endpoint_index = EndpointIndex()
+        for usuario, red in self._networks():
+            for endpoint in red.get_endpoints():
+                self._track_endpoint(usuario, red, endpoint)
+        self.lease_sweeper = LeaseSweeper(self.leases, self._latest_handshakes, self._expire_leases,
+                                          ttl=lease_ttl, interval=lease_interval)
 
     def iniciar(self):
         """
@@ -39,136 +152,341 @@ class Servidor:
         """
         self.xmlrpc_server.serve_forever()
 
+    def _dispatch(self, method, params):
+        """
+        Despacha las RPCs de esta instancia (incluidas las de system.multicall)
+        registrando su latencia, si terminaron en excepción y cuánto tiempo
+        pasaron en comandos externos. El wg addconf de un lote de PeerBatcher
+        se cuenta en cada RPC que lo esperó. Una muestra de las RPCs se
+        registra en la bitácora.
+        """
+        try:
+            func = resolve_dotted_attribute(self, method, False)
+        except AttributeError:
+            func = None
+        if not callable(func):
+            raise Exception(f'method "{method}" is not supported')
+        return self.request_log.timed(method, self.metrics.call, method, func, *params)
+
+    def _usuario(self, token):
+        """
+        Resuelve el usuario de la sesión asociada al token
+        """
+        return self.sesiones.resolve(token)
+
+    def _get_private_network(self, usuario, net_id):
+        """
+        Recupera una red privada del usuario o None
+        """
+        if usuario is None:
+            return None
+        return usuario.get_private_network_by_id(str(net_id))
+
+    def _save_endpoint(self, usuario, private_network, endpoint):
+        """
+        Persiste el endpoint y el contador de endpoints de su red
+        """
+        if self.store is not None:
+            self.store.save_network(usuario.email, private_network)
+            self.store.save_endpoint(usuario.email, endpoint)
+
     def register_user(self, name, email, password):
         """
-        Registra un usuario en el servidor
+        Registra un usuario en el servidor y abre su sesión
         """
-        print("Registrando usuario...")
-        if email in self.usuarios:
-            return False
+        with self.usuarios_lock:
+            if email in self.usuarios:
+                return False
+            usuario = Usuario(name, email, password)
+            self.usuarios[email] = usuario
+        if self.store is not None:
+            self.store.save_user(usuario)
 
-        self.usuario = Usuario(name, email, password)
-        self.usuarios[email] = self.usuario
-        print("Usuario registrado",self.usuario.name,"!")
-        print(self.usuarios)
-        return True
+        logger.debug("Usuario registrado", extra={"email": email})
+        return self.sesiones.create(usuario)
 
     def identify_user(self, email, password):
         """
-        Identifica a un usuario en el servidor
+        Identifica a un usuario en el servidor y regresa el token de su sesión
         """
-        print("Buscando usuario...")
-
-        try:
-            usuario = self.usuarios[email]
-            if usuario is not None and usuario.password == password:
-                self.usuario = usuario
-                print("Usuario identificado!")
-                return True
-        except:
-            return False
-            raise
+        with self.usuarios_lock:
+            usuario = self.usuarios.get(email)
+        if usuario is not None and usuario.password == password:
+            logger.debug("Usuario identificado", extra={"email": email})
+            return self.sesiones.create(usuario)
         return  False
 
-    def whoami(self):
+    def whoami(self, token):
         """
-        Recupera el usuario actual
+        Recupera el usuario de la sesión
         """
-        if self.usuario is None:
+        usuario = self._usuario(token)
+        if usuario is None:
             return "No hay usuario"
         else:
-            return self.usuario.name
+            return usuario.name
 
-    def close_session(self):
+    def close_session(self, token):
         """
-        Cierra la sesión del usuario y elimina la interfaz Wireguard actual
+        Cierra la sesión del usuario
         """
-        self.usuario = None
-        self.wg.clear_interface()
-        print("Sesión cerrada y la interfaz Wireguard eliminada.")
+        self.sesiones.close(token)
         return True
 
-    def create_private_network(self,net_name) -> int:
+    def create_private_network(self, token, net_name, segmento=None, mask=None) -> int:
         """
-        Crea una red privada
+        Crea una red privada. Si no se indica el segmento ('a.b.c.d' o
+        'a.b.c.d/p') se asigna una subred libre de la superred
         """
-        if self.usuario is None:
+        usuario = self._usuario(token)
+        if usuario is None:
             return -1
-        else:
-            # Crear la red privada
-            counter = self.usuario.private_network_counter
-            red = rp.PrivateNetwork(counter, net_name,'100.10.0.0', 24)
-            self.usuario.private_networks[str(red.id)] = red
-            self.usuario.private_network_counter += 1
-            return red.id
+        try:
+            if segmento:
+                if mask is not None and "/" not in str(segmento):
+                    segmento = f"{segmento}/{mask}"
+                elif "/" not in str(segmento):
+                    segmento = f"{segmento}/{self.subnet_pool.default_prefix}"
+                segment = self.subnet_pool.allocate_specific(segmento)
+            else:
+                segment = self.subnet_pool.allocate(mask)
+        except ValueError as e:
+            logger.warning("Segmento inválido %s: %s", segmento, e)
+            return -1
+        if segment is None:
+            logger.warning("No hay una subred disponible para la red %s", net_name)
+            return -1
+
+        # Crear la red privada
+        counter = usuario.next_private_network_id()
+        red = rp.PrivateNetwork(counter, net_name, str(segment.network_address), segment.prefixlen)
+        usuario.add_private_network(red)
+        if self.store is not None:
+            self.store.save_user(usuario)
+            self.store.save_network(usuario.email, red)
+        self._route_network(usuario, red)
+        return red.id
+
+    def delete_private_network(self, token, private_network_id):
+        """
+        Elimina una red privada y devuelve su subred al pool
+        """
+        usuario = self._usuario(token)
+        private_network = self._get_private_network(usuario, private_network_id)
+        if private_network is None:
+            return False
+        # El registro se actualiza antes que el kernel (ver WireGuardReconciler)
+        if usuario.remove_private_network(private_network) is None:
+            return False
+        endpoints = private_network.get_endpoints()
+        for endpoint in endpoints:
+            self._untrack_endpoint(usuario.email, private_network.id, endpoint)
+        shard = self.shards.for_network(usuario.email, private_network.id)
+        self._remove_peers(shard, endpoints, segment=private_network.get_segment())
+        self._route_network(usuario, private_network, remove=True)
+        self.subnet_pool.release(private_network.get_segment())
+        if self.store is not None:
+            self.store.delete_network(usuario.email, private_network.id)
+        return True
 
-    def get_private_networks(self)->list[str]:
+    def delete_endpoint(self, token, private_network_id, endpoint_id):
+        """
+        Elimina un endpoint: quita su peer y su IP pública del firewall y
+        devuelve su IP a la red privada
+        """
+        usuario = self._usuario(token)
+        private_network = self._get_private_network(usuario, private_network_id)
+        if private_network is None:
+            return False
+        endpoint = private_network.remove_endpoint(str(endpoint_id))
+        if endpoint is None:
+            return False
+        self._untrack_endpoint(usuario.email, private_network.id, endpoint)
+        self._remove_peers(self.shards.for_network(usuario.email, private_network.id), [endpoint])
+        if self.store is not None:
+            self.store.delete_endpoint(usuario.email, private_network.id, endpoint.get_id())
+        return True
+
+    def get_private_networks(self, token)->list[str]:
         """
         Recupera las redes privadas del usuario
         """
-        if self.usuario is None:
+        usuario = self._usuario(token)
+        if usuario is None:
             return ["No hay usuario"]
         else:
-            user_private_networks = self.usuario.get_private_networks()
-            return [str(red) for red in user_private_networks.values()]
+            user_private_networks = usuario.get_private_networks()
+            return [str(red) for red in list(user_private_networks.values())]
 
-    def get_private_network_by_id(self, net_id) -> rp.PrivateNetwork:
+    def get_private_network_by_id(self, token, net_id) -> str:
         """
         Recupera una red privada por su id
         """
-        if self.usuario is None:
+        private_network = self._get_private_network(self._usuario(token), net_id)
+        logger.debug("Red privada: %s", private_network)
+        if private_network is None:
             return -1 # type: ignore
-        else:
-            private_network = self.usuario.get_private_network_by_id(net_id)
-            print("Private network:",private_network, type(private_network))
-            if private_network is None:
-                return -1 # type: ignore
-            return private_network
+        return str(private_network)
 
-    def create_endpoint(self, private_network_id, endpoint_name):
+    def create_endpoint(self, token, private_network_id, endpoint_name):
         """
         Crea un endpoint en una red privada
         """
-        if self.usuario is None:
+        usuario = self._usuario(token)
+        private_network = self._get_private_network(usuario, private_network_id)
+        if private_network is None:
             return -1
-        else:
-            print("Creando endpoint...")
-            private_network = self.get_private_network_by_id(private_network_id)
-            if type(private_network) is not rp.PrivateNetwork:
-                return -1
-
-            endpoint = private_network.create_endpoint(endpoint_name)
-            print("Endpoint creado! ",endpoint.get_id())
-            return endpoint.get_wireguard_ip(), endpoint.get_id()
+        endpoint = private_network.create_endpoint(endpoint_name)
+        if endpoint is None:
+            return -1
+        self._save_endpoint(usuario, private_network, endpoint)
+        self._track_endpoint(usuario, private_network, endpoint)
+        logger.debug("Endpoint creado", extra={"endpoint": endpoint.get_id()})
+        return endpoint.get_wireguard_ip(), endpoint.get_id()
         
-    def complete_endpoint(self,id_red_privada, id_endpoint, wg_public_key, allowed_ips, ip_client, listen_port):
+    def complete_endpoint(self, token, id_red_privada, id_endpoint, wg_public_key, allowed_ips, ip_client, listen_port):
         """
         Completa la configuración del endpoint
         """
-        print("Completando endpoint...")
-        private_network = self.get_private_network_by_id(id_red_privada)
-        if type(private_network) is not rp.PrivateNetwork:
+        usuario = self._usuario(token)
+        private_network = self._get_private_network(usuario, id_red_privada)
+        if private_network is None:
             return -1
 
-        endpoint = private_network.get_endpoint_by_id(id_endpoint)
+        endpoint = private_network.get_endpoint_by_id(str(id_endpoint))
+        if type(endpoint) is not rp.Endpoint or not endpoint.get_wireguard_ip():
+            return -1
+        peer = self._valid_peer(wg_public_key, allowed_ips, ip_client, listen_port)
+        if peer is None:
+            return -1
+
+        endpoint.set_wireguard_public_key(wg_public_key)
+        endpoint.set_allowed_ips(peer["allowed_ips"])
+        endpoint.set_listen_port(peer["endpoint_port"])
+        endpoint.set_public_ip(ip_client)
+        self._save_endpoint(usuario, private_network, endpoint)
+        self._track_endpoint(usuario, private_network, endpoint)
+        return True
+
+    def renew_endpoint(self, token, private_network_id, endpoint_id):
+        """
+        Renueva el arrendamiento de un endpoint y regresa su nuevo vencimiento
+        """
+        usuario = self._usuario(token)
+        private_network = self._get_private_network(usuario, private_network_id)
+        if private_network is None:
+            return -1
+        endpoint = private_network.get_endpoint_by_id(str(endpoint_id))
         if type(endpoint) is not rp.Endpoint:
             return -1
+        expiry = self.leases.renew((usuario.email, private_network.id, endpoint.get_id()),
+                                   self._lease_ttl(endpoint))
+        if expiry is None:
+            return -1
+        return expiry
 
+    def provision_endpoint(self, token, private_network_id, endpoint_name, wg_public_key, ip_client, listen_port):
+        """
+        Crea el endpoint, registra su peer en el orquestador y regresa todo lo
+        que el daemon necesita para configurarse, en un solo viaje
+        """
+        usuario = self._usuario(token)
+        private_network = self._get_private_network(usuario, private_network_id)
+        if private_network is None:
+            return -1
+        # Los valores del cliente terminan en la configuración de wg
+        peer = self._valid_peer(wg_public_key, None, ip_client, listen_port)
+        if peer is None:
+            return -1
+        listen_port = peer["endpoint_port"]
+
+        endpoint = private_network.create_endpoint(endpoint_name)
+        if endpoint is None:
+            return -1
+        allowed_ips = private_network.get_available_ranges()
+
+        # El registro se actualiza antes que el kernel (ver WireGuardReconciler)
         endpoint.set_wireguard_public_key(wg_public_key)
         endpoint.set_allowed_ips(allowed_ips)
         endpoint.set_listen_port(listen_port)
-        endpoint.set_wireguard_ip(ip_client)
-        return True
+        endpoint.set_public_ip(ip_client)
+        shard = self.shards.for_network(usuario.email, private_network.id)
+        try:
+            shard.peer_batcher.add(wg_public_key, [endpoint.get_wireguard_ip() + "/32"],
+                                   ip_client, listen_port)
+        except RuntimeError as e:
+            logger.error("Error registrando el peer: %s", e)
+            # El endpoint aún no se persiste ni se indexa: solo se libera su IP
+            private_network.remove_endpoint(endpoint.get_id())
+            return -1
+        self._allow_source(ip_client, shard)
+        self._save_endpoint(usuario, private_network, endpoint)
+        self._track_endpoint(usuario, private_network, endpoint)
+        logger.debug("Endpoint aprovisionado", extra={"endpoint": endpoint.get_id(),
+                                                     "wireguard_ip": endpoint.get_wireguard_ip()})
+        return {
+            "endpoint_id": endpoint.get_id(),
+            "wireguard_ip": endpoint.get_wireguard_ip(),
+            "allowed_ips": allowed_ips,
+            "server_public_key": shard.wg.public_key,
+            "server_port": shard.listen_port,
+            "server_public_ip": self.public_ip,
+        }
 
-    def get_endpoints(self, private_network_id):
+    def get_endpoints(self, token, private_network_id, fields=None, cursor=0, limit=rp.DEFAULT_ENDPOINT_PAGE):
         """
-        Recupera los endpoints de una red privada
+        Recupera una página de los endpoints de una red privada.
+
+        `fields` elige los campos de cada endpoint (por defecto todos los de
+        ENDPOINT_FIELDS); la siguiente página se pide con el `next_cursor`
+        recibido, que es -1 en la última
         """
-        if self.usuario is None:
-            return []
-        else:
-            private_network = self.get_private_network_by_id(private_network_id)
-            return private_network.get_endpoints() 
+        private_network = self._get_private_network(self._usuario(token), private_network_id)
+        if private_network is None:
+            return -1
+        if fields and not set(fields) <= set(ENDPOINT_FIELDS):
+            return -1
+        try:
+            cursor, limit = int(cursor), min(int(limit), rp.MAX_ENDPOINT_PAGE)
+        except (TypeError, ValueError):
+            return -1
+        endpoints, next_cursor = private_network.page_endpoints(cursor, max(limit, 1))
+        return {
+            "endpoints": [endpoint.to_dict(fields) for endpoint in endpoints],
+            "next_cursor": next_cursor,
+        }
+
+    def find_endpoint_by_ip(self, token, wireguard_ip):
+        """
+        Busca, entre los endpoints del usuario, el que tiene la IP de Wireguard
+        """
+        return self._owned_endpoint(self._usuario(token), self.endpoint_index.by_ip(wireguard_ip))
+
+    def find_endpoint_by_public_key(self, token, public_key):
+        """
+        Busca, entre los endpoints del usuario, el que tiene la llave pública
+        """
+        return self._owned_endpoint(self._usuario(token), self.endpoint_index.by_public_key(public_key))
+
+    def _owned_endpoint(self, usuario, owner):
+        # Un usuario solo puede ver sus propios endpoints
+        if usuario is None or owner is None or owner[0] != usuario.email:
+            return -1
+        email, net_id, endpoint_id = owner
+        private_network = self._get_private_network(usuario, net_id)
+        if private_network is None:
+            return -1
+        endpoint = private_network.get_endpoint_by_id(str(endpoint_id))
+        if type(endpoint) is not rp.Endpoint:
+            return -1
+        return {
+            "private_network_id": private_network.id,
+            "endpoint_id": endpoint.get_id(),
+            "name": endpoint.get_name(),
+            "wireguard_ip": endpoint.get_wireguard_ip() or "",
+            "public_key": endpoint.get_wireguard_public_key() or "",
+            "public_ip": endpoint.get_public_ip() or "",
+        }
 
     def get_public_key(self):
         """
@@ -176,48 +494,413 @@ class Servidor:
         """
         return self.wg_public_key
 
-    def get_allowed_ips(self, private_network_id):
+    def get_allowed_ips(self, token, private_network_id):
+        """
+        Recupera las IPs permitidas de una red privada (su segmento)
+        """
+        private_network = self._get_private_network(self._usuario(token), private_network_id)
+        if private_network is None:
+            return []
+        return private_network.get_available_ranges()
+
+
+    def get_peer_stats(self, token, private_network_id, endpoint_id, limit=30):
         """
-        Recupera las IPs permitidas de una red privada
+        Tráfico, tasas y antigüedad del handshake de un endpoint, con sus
+        últimas `limit` muestras
         """
-        private_network = self.get_private_network_by_id(private_network_id)
-        return private_network.get_available_hosts()
+        private_network = self._get_private_network(self._usuario(token), private_network_id)
+        if private_network is None:
+            return -1
+        endpoint = private_network.get_endpoint_by_id(str(endpoint_id))
+        if type(endpoint) is not rp.Endpoint or not endpoint.get_wireguard_public_key():
+            return -1
+        stats = self.telemetry.peer(endpoint.get_wireguard_public_key(), limit)
+        if stats is None:
+            return -1
+        return stats
 
+    def get_network_stats(self, token, private_network_id):
+        """
+        Totales de tráfico de una red privada y sus peers con más tráfico
+        """
+        private_network = self._get_private_network(self._usuario(token), private_network_id)
+        if private_network is None:
+            return -1
+        return self._stats([private_network])
+
+    def get_user_stats(self, token):
+        """
+        Totales de tráfico de todas las redes privadas del usuario
+        """
+        usuario = self._usuario(token)
+        if usuario is None:
+            return -1
+        return self._stats(list(usuario.get_private_networks().values()))
 
-    def get_wireguard_config(self):
-        print("Configurando Wireguard...")
-        print("Obteniendo la llave pública del servidor...")
-        print("Llave pública del servidor: ", self.wg_public_key)
-        print("Puerto Wireguard del servidor: ", self.wg_port)
-        return self.wg_public_key, self.wg_port, self.public_ip
+    def _stats(self, redes):
+        # Llave pública -> (red, endpoint) para identificar a los peers
+        owners = {}
+        for red in redes:
+            for endpoint in red.get_endpoints():
+                if endpoint.get_wireguard_public_key():
+                    owners[endpoint.get_wireguard_public_key()] = (red.id, endpoint.get_id())
+        stats = self.telemetry.aggregate(owners)
+        for peer in stats["top_peers"]:
+            peer["private_network_id"], peer["endpoint_id"] = owners[peer["public_key"]]
+        return stats
 
-    def create_peer(self, public_key, allowed_ips, endpoint_ip_wg, listen_port, ip_cliente):
-        print("Crear peer en el servidor")
-        print(public_key, allowed_ips, endpoint_ip_wg, listen_port, ip_cliente)
-        self.wg.add_peer(public_key, allowed_ips, endpoint_ip_wg, listen_port)
-        print("IP de Wireguard asignada: ", endpoint_ip_wg)
+    def get_wireguard_config(self, token=None, private_network_id=None):
+        """
+        Llave pública, puerto e IP pública del orquestador. Con una red
+        privada se regresan los de la interfaz (shard) donde vive esa red.
+        """
+        shard = self.shards[0]
+        if private_network_id is not None:
+            usuario = self._usuario(token)
+            private_network = self._get_private_network(usuario, private_network_id)
+            if private_network is None:
+                return -1
+            shard = self.shards.for_network(usuario.email, private_network.id)
+        logger.debug("Configuración Wireguard del servidor", extra={"public_key": shard.wg.public_key,
+                                                                    "port": shard.listen_port})
+        return shard.wg.public_key, shard.listen_port, self.public_ip
+
+    def create_peer(self, token, public_key, allowed_ips, endpoint_ip_wg, listen_port, ip_cliente,
+                    private_network_id=None):
+        usuario = self._usuario(token)
+        if usuario is None:
+            return -1
+        peer = self._valid_peer(public_key, allowed_ips, endpoint_ip_wg, listen_port)
+        if peer is None:
+            return -1
+        allowed_ips, listen_port = peer["allowed_ips"], peer["endpoint_port"]
+        shard = self._peer_shard(usuario, allowed_ips, private_network_id)
+        if shard is None:
+            return -1
+        logger.debug("Creando peer", extra={"public_key": public_key, "allowed_ips": allowed_ips,
+                                            "wireguard_ip": endpoint_ip_wg, "public_ip": ip_cliente,
+                                            "port": listen_port, "shard": shard.index})
+        # Un peer que se vuelve a registrar puede cambiar de shard; el
+        # reconciliador lo quita de la interfaz anterior
+        released = []
+        for index, peers in enumerate(self.extra_peers):
+            previous = peers.pop(public_key, None)
+            if previous is not None and previous["endpoint_ip"]:
+                self.endpoint_index.remove_source(previous["endpoint_ip"], index)
+                released.append((previous["endpoint_ip"], self.shards[index]))
+        self.extra_peers[shard.index][public_key] = {
+            "public_key": public_key,
+            "allowed_ips": allowed_ips,
+            "endpoint_ip": endpoint_ip_wg,
+            "endpoint_port": listen_port,
+        }
+        if endpoint_ip_wg:
+            self.endpoint_index.add_source(endpoint_ip_wg, shard.index)
+        try:
+            shard.peer_batcher.add(public_key, allowed_ips, endpoint_ip_wg, listen_port)
+        except RuntimeError as e:
+            logger.error("Error registrando el peer: %s", e)
+            self.extra_peers[shard.index].pop(public_key, None)
+            if endpoint_ip_wg:
+                self.endpoint_index.remove_source(endpoint_ip_wg, shard.index)
+                released.append((endpoint_ip_wg, shard))
+            self._release_sources(released)
+            return -1
+        self._allow_source(endpoint_ip_wg, shard)
+        self._release_sources(released)
+        logger.debug("IP de Wireguard asignada: %s", endpoint_ip_wg)
         return endpoint_ip_wg
 
+    def _peer_shard(self, usuario, allowed_ips, private_network_id=None):
+        """
+        Shard de un peer de create_peer: el de la red privada indicada o, si
+        no se indica, el de la red del usuario que contiene sus IPs
+        permitidas (la interfaz principal si ninguna las contiene). None si
+        la red indicada no existe
+        """
+        if private_network_id is not None:
+            private_network = self._get_private_network(usuario, private_network_id)
+            if private_network is None:
+                return None
+            return self.shards.for_network(usuario.email, private_network.id)
+        networks = [ipaddress.ip_network(ip, strict=False) for ip in allowed_ips]
+        for red in list(usuario.get_private_networks().values()):
+            segment = red.get_segment()
+            if any(network.version == segment.version and network.subnet_of(segment) for network in networks):
+                return self.shards.for_network(usuario.email, red.id)
+        return self.shards[0]
+
+
+    def _valid_peer(self, public_key, allowed_ips, ip, port):
+        """
+        Valida la llave, las IPs permitidas, la IP y el puerto de un peer
+        (ver wg.validate_peer); None si alguno no es válido
+        """
+        try:
+            return wg.validate_peer(public_key, allowed_ips, ip, port)
+        except ValueError as e:
+            logger.warning("Peer rechazado: %s", e)
+            return None
+
+    def _allow_source(self, ip, shard=None):
+        """
+        Agrega la IP pública del peer al set del firewall (un solo elemento)
+        """
+        if not ip:
+            return
+        shard = shard or self.shards[0]
+        try:
+            shard.wg.add_firewall_peer(ip)
+        except (RuntimeError, ValueError) as e:
+            logger.error("No se pudo permitir la IP en el firewall: %s", e)
+
+    def _release_sources(self, sources):
+        """
+        Quita del firewall las IPs públicas [(IP, shard)] que ya ningún peer
+        de su shard usa
+        """
+        for ip, shard in sources:
+            if self.endpoint_index.source_in_use(ip, shard.index):
+                continue
+            try:
+                shard.wg.remove_firewall_peer(ip)
+            except (RuntimeError, ValueError) as e:
+                logger.error("No se pudo actualizar el firewall: %s", e)
+
+    def _route_network(self, usuario, red, remove=False):
+        """
+        Enruta el segmento de la red por la interfaz de su shard
+        """
+        if not self.wireguard_ready:
+            return
+        shard = self.shards.for_network(usuario.email, red.id)
+        try:
+            shard.wg.set_routes([str(red.get_segment())], remove=remove)
+        except RuntimeError as e:
+            logger.error("No se pudo actualizar la ruta de la red: %s", e)
+
+    def _lease_ttl(self, endpoint):
+        # Un endpoint sin llave pública nunca podrá hacer handshake
+        return self.lease_ttl if endpoint.get_wireguard_public_key() else min(self.lease_ttl, PENDING_LEASE_TTL)
+
+    def _track_endpoint(self, usuario, red, endpoint):
+        """
+        Indexa el endpoint y (re)inicia su arrendamiento
+        """
+        self.endpoint_index.add(usuario.email, red.id, endpoint, self.shards.index_for(usuario.email, red.id))
+        self.leases.grant((usuario.email, red.id, endpoint.get_id()), self._lease_ttl(endpoint),
+                          endpoint.get_wireguard_public_key())
+
+    def _untrack_endpoint(self, email, net_id, endpoint):
+        self.endpoint_index.remove(email, net_id, endpoint.get_id())
+        self.leases.release((email, net_id, endpoint.get_id()))
+
+    def _latest_handshakes(self):
+        """
+        Último handshake de cada peer de todas las interfaces
+        """
+        handshakes = {}
+        for shard in self.shards:
+            try:
+                handshakes.update(shard.wg.latest_handshakes())
+            except RuntimeError as e:
+                logger.warning("No se pudieron leer los handshakes de %s: %s", shard.interface_name, e)
+        return handshakes
+
+    def _expire_leases(self, keys):
+        """
+        Elimina los endpoints vencidos: primero del registro (ver
+        WireGuardReconciler), luego sus peers del kernel con un wg set por
+        interfaz, y devuelve sus IPs al asignador
+        """
+        with self.usuarios_lock:
+            usuarios = dict(self.usuarios)
+        removed = {}
+        for email, net_id, endpoint_id in keys:
+            usuario = usuarios.get(email)
+            red = self._get_private_network(usuario, net_id)
+            if red is None:
+                continue
+            endpoint = red.remove_endpoint(endpoint_id)
+            if endpoint is None:
+                continue
+            self.endpoint_index.remove(email, red.id, endpoint.get_id())
+            removed.setdefault(self.shards.index_for(email, red.id), []).append(endpoint)
+            if self.store is not None:
+                self.store.delete_endpoint(email, red.id, endpoint.get_id())
+            logger.info("Arrendamiento vencido", extra={"email": email, "network": red.id, "endpoint": endpoint.get_id(),
+                                                        "wireguard_ip": endpoint.get_wireguard_ip()})
+        for index, endpoints in removed.items():
+            self._remove_peers(self.shards[index], endpoints)
+
+    def _remove_peers(self, shard, endpoints, segment=None):
+        """
+        Quita del kernel los peers de endpoints ya eliminados del registro con
+        un solo wg set, y del firewall sus IPs públicas (y las fuentes dentro
+        de `segment`) con un solo nft
+        """
+        if not self.wireguard_ready:
+            return
+        public_keys = [ep.get_wireguard_public_key() for ep in endpoints if ep.get_wireguard_public_key()]
+        if public_keys:
+            try:
+                shard.wg.set_peers([], remove=public_keys)
+            except RuntimeError as e:
+                # El reconciliador los quitará en su siguiente pasada
+                logger.error("No se pudieron quitar los peers: %s", e)
+
+        # Una IP pública puede ser compartida (NAT) por peers que siguen activos
+        sources = {ep.get_public_ip() for ep in endpoints
+                   if ep.get_public_ip() and not self.endpoint_index.source_in_use(ep.get_public_ip(), shard.index)}
+        if segment is not None:
+            sources |= {source for source in shard.wg.firewall_sources
+                        if ipaddress.IPv4Network(source).subnet_of(segment)}
+        try:
+            shard.wg.remove_firewall_peers(sources)
+        except (RuntimeError, ValueError) as e:
+            logger.error("No se pudo actualizar el firewall: %s", e)
 
     def init_wireguard(self):
-        # Crear las claves pública y privada
-        private_key, public_key = self.wg.create_keys()
-        self.wg_public_key = public_key
-        self.wg_private_key = private_key
-        self.wg.create_interface(self.wg_ip)
-
-    def connect_peers(self, private_network_id):
-        local_ips = [str(x) for x in self.get_allowed_ips(private_network_id())]
-        wg.configure_firewall(local_ips)   # type: ignore
-
-if len(argv) < 2:
-    print("Ingresa la IP publica del orquestador!")
-
-server = Servidor(argv[1])
-# Verifica que se ejecute como root
-if os.geteuid() != 0: # type: ignore
-    print("Necesitas ejecutar este script como root!")
-    exit(1)
-server.init_wireguard()
-print("Listening on port ",server.port)
-server.iniciar()
+        for shard in self.shards:
+            self._init_shard(shard)
+        self.wg_public_key = self.wg.public_key
+        self.wg_private_key = self.wg.private_key
+        self.wireguard_ready = True
+        self.telemetry.start()
+        self.lease_sweeper.start()
+
+    def _init_shard(self, shard):
+        # Reutilizar las claves persistidas para que los daemons no tengan
+        # que volver a aprovisionarse tras un reinicio
+        suffix = "" if shard.index == 0 else f"_{shard.index}"
+        private_key = self.store.get_setting("wg_private_key" + suffix) if self.store else None
+        public_key = self.store.get_setting("wg_public_key" + suffix) if self.store else None
+        if private_key and public_key:
+            shard.wg.private_key, shard.wg.public_key = private_key, public_key
+        else:
+            # Crear las claves pública y privada
+            private_key, public_key = shard.wg.create_keys()
+            if self.store is not None:
+                self.store.save_setting("wg_private_key" + suffix, private_key)
+                self.store.save_setting("wg_public_key" + suffix, public_key)
+        created = shard.wg.create_interface(self.wg_ip)
+
+        # Rutas de las redes del shard, en un solo proceso ip
+        segments = [str(red.get_segment()) for usuario, red in self._networks(shard.index)]
+        shard.wg.set_routes(segments)
+
+        # Volver a registrar los peers recuperados del estado persistido, todos
+        # en un solo wg syncconf
+        peers = list(self._registered_peers(shard.index))
+        if created and peers:
+            shard.wg.apply_peers(peers, replace=True)
+        # Si la interfaz ya existía solo se corrigen las diferencias
+        logger.info("Reconciliación inicial %s: %s", shard.interface_name, shard.reconciler.reconcile())
+        shard.reconciler.start()
+
+    def _desired_peers(self, shard_index=0):
+        """
+        Estado deseado de la interfaz de un shard {llave pública: peer}
+        """
+        desired = dict(self.extra_peers[shard_index])
+        for peer in self._registered_peers(shard_index):
+            desired[peer["public_key"]] = peer
+        return desired
+
+    def _networks(self, shard_index=None):
+        """
+        Pares (usuario, red privada), opcionalmente solo los de un shard
+        """
+        with self.usuarios_lock:
+            usuarios = list(self.usuarios.values())
+        for usuario in usuarios:
+            for red in list(usuario.get_private_networks().values()):
+                if shard_index is None or self.shards.index_for(usuario.email, red.id) == shard_index:
+                    yield usuario, red
+
+    def _registered_peers(self, shard_index=None):
+        """
+        Peers de todos los endpoints completos del orquestador (o de un shard)
+        """
+        for usuario, red in self._networks(shard_index):
+            for endpoint in red.get_endpoints():
+                # Sin llave o sin IP (estado persistido por versiones que
+                # creaban endpoints en redes llenas) no hay peer que registrar
+                if not endpoint.get_wireguard_public_key() or not endpoint.get_wireguard_ip():
+                    continue
+                # En el orquestador cada peer solo enruta su propia IP
+                yield {
+                    "public_key": endpoint.get_wireguard_public_key(),
+                    "allowed_ips": [endpoint.get_wireguard_ip() + "/32"],
+                    "endpoint_ip": endpoint.get_public_ip() or None,
+                    "endpoint_port": endpoint.get_wireguard_port() or None,
+                }
+
+    def connect_peers(self, token, private_network_id):
+        usuario = self._usuario(token)
+        private_network = self._get_private_network(usuario, private_network_id)
+        if private_network is None:
+            return False
+        local_ips = [str(x) for x in private_network.get_available_ranges()]
+        self.shards.for_network(usuario.email, private_network.id).wg.configure_firewall(local_ips)
+        return True
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Orquestador LinkGuard")
+    parser.add_argument("public_ip", help="IP publica del orquestador")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT,
+                        help="Puerto del servidor XML-RPC")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS,
+                        help="Hilos para atender RPCs (0 = servidor secuencial)")
+    parser.add_argument("--session-ttl", type=int, default=DEFAULT_SESSION_TTL,
+                        help="Segundos de inactividad antes de expirar una sesión")
+    parser.add_argument("--keepalive", type=float, default=KEEPALIVE_IDLE_TIMEOUT,
+                        help="Segundos que una conexión keep-alive ociosa sigue abierta (0 = cerrar)")
+    parser.add_argument("--supernet", default=DEFAULT_SUPERNET,
+                        help="Superred de la que se reparten las redes privadas")
+    parser.add_argument("--network-prefix", type=int, default=DEFAULT_NETWORK_PREFIX,
+                        help="Prefijo por defecto de una red privada")
+    parser.add_argument("--state-db", default=None,
+                        help="Base SQLite donde persistir el estado (por defecto solo en memoria)")
+    parser.add_argument("--reconcile-interval", type=float, default=wg.RECONCILE_INTERVAL,
+                        help="Segundos entre reconciliaciones de la interfaz Wireguard (0 = solo al iniciar)")
+    parser.add_argument("--shards", type=int, default=DEFAULT_SHARDS,
+                        help="Interfaces Wireguard entre las que se reparten las redes privadas")
+    parser.add_argument("--telemetry-interval", type=float, default=DEFAULT_TELEMETRY_INTERVAL,
+                        help="Segundos entre lecturas de tráfico de los peers (0 = desactivado)")
+    parser.add_argument("--lease-ttl", type=int, default=DEFAULT_LEASE_TTL,
+                        help="Segundos sin handshake ni renovación antes de eliminar un endpoint")
+    parser.add_argument("--lease-interval", type=float, default=DEFAULT_LEASE_CHECK_INTERVAL,
+                        help="Segundos entre revisiones de arrendamientos vencidos (0 = desactivado)")
+    parser.add_argument("--backend", choices=("kernel", "memory"), default="kernel",
+                        help="Interfaces Wireguard reales o simuladas en memoria (no requiere root)")
+    parser.add_argument("--backend-latency", type=float, default=DEFAULT_COMMAND_LATENCY,
+                        help="Segundos que tarda cada comando simulado con --backend memory")
+    parser.add_argument("--log-level", default=DEFAULT_LOG_LEVEL,
+                        choices=("DEBUG", "INFO", "WARNING", "ERROR"), type=str.upper,
+                        help="Nivel mínimo de la bitácora (DEBUG registra cada RPC)")
+    parser.add_argument("--log-json", action="store_true",
+                        help="Escribir la bitácora como un objeto JSON por línea")
+    parser.add_argument("--request-sample", type=float, default=DEFAULT_REQUEST_SAMPLE,
+                        help="Fracción de las RPCs exitosas que se registran (las fallidas siempre)")
+    parser.add_argument("--slow-command", type=float, default=DEFAULT_SLOW_COMMAND,
+                        help="Segundos a partir de los cuales un comando ip/wg/nft se registra como lento (0 = nunca)")
+    args = parser.parse_args()
+    setup_logging(args.log_level, json_output=args.log_json)
+
+    # Verifica que se ejecute como root
+    if args.backend == "kernel" and os.geteuid() != 0: # type: ignore
+        print("Necesitas ejecutar este script como root!")
+        exit(1)
+    server = Servidor(args.public_ip, workers=args.workers, session_ttl=args.session_ttl,
+                      keepalive_timeout=args.keepalive, supernet=args.supernet,
+                      network_prefix=args.network_prefix, state_db=args.state_db,
+                      reconcile_interval=args.reconcile_interval, shards=args.shards,
+                      telemetry_interval=args.telemetry_interval, lease_ttl=args.lease_ttl,
+                      lease_interval=args.lease_interval, backend=args.backend,
+                      backend_latency=args.backend_latency, request_sample=args.request_sample,
+                      slow_command=args.slow_command, port=args.port)
+    server.init_wireguard()
+    logger.info("Escuchando en el puerto %d", server.port, extra={"workers": args.workers})
+    server.iniciar()
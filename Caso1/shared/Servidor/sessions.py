@@ -0,0 +1,76 @@
+## Sesiones del orquestador
+import secrets
+import threading
+import time
+
+# Tiempo de vida de una sesión sin actividad (segundos)
+DEFAULT_SESSION_TTL = 3600
+# Cada cuántas sesiones nuevas se purgan las expiradas
+PURGE_EVERY = 256
+
+
+class SessionTable:
+    """
+    Tabla de sesiones {token: [Usuario, expiración]}.
+
+    Cada identify_user crea un token opaco; las RPCs resuelven el usuario a
+    partir del token en O(1). La expiración es deslizante: cada uso válido
+    la extiende `ttl` segundos. Las lecturas no toman ningún lock, las
+    operaciones sobre el diccionario son atómicas.
+    """
+
+    def __init__(self, ttl=DEFAULT_SESSION_TTL):
+        self.ttl = ttl
+        self._sessions = {}
+        self._created = 0
+        self._purge_lock = threading.Lock()
+
+    def create(self, usuario) -> str:
+        """
+        Abre una sesión para el usuario y regresa su token
+        """
+        token = secrets.token_urlsafe(24)
+        self._sessions[token] = [usuario, time.monotonic() + self.ttl]
+        self._created += 1
+        if self._created % PURGE_EVERY == 0:
+            self.purge_expired()
+        return token
+
+    def resolve(self, token):
+        """
+        Regresa el usuario de la sesión o None si no existe o expiró
+        """
+        if not isinstance(token, str):
+            return None
+        entry = self._sessions.get(token)
+        if entry is None:
+            return None
+        now = time.monotonic()
+        if entry[1] < now:
+            self._sessions.pop(token, None)
+            return None
+        entry[1] = now + self.ttl
+        return entry[0]
+
+    def close(self, token) -> bool:
+        """
+        Cierra la sesión; regresa False si no existía
+        """
+        if not isinstance(token, str):
+            return False
+        return self._sessions.pop(token, None) is not None
+
+    def purge_expired(self) -> int:
+        """
+        Elimina las sesiones expiradas y regresa cuántas se eliminaron
+        """
+        with self._purge_lock:
+            now = time.monotonic()
+            expired = [token for token, entry in list(self._sessions.items())
+                       if entry[1] < now]
+            for token in expired:
+                self._sessions.pop(token, None)
+            return len(expired)
+
+    def __len__(self):
+        return len(self._sessions)
@@ -0,0 +1,84 @@
+## Reparto de los endpoints entre varias interfaces Wireguard
+import zlib
+
+import WG.configGeneratorServer as wg
+
+# Interfaces Wireguard del orquestador
+DEFAULT_SHARDS = 1
+# La interfaz i se llama wg<BASE_INTERFACE + i> y escucha en puerto_base + i
+BASE_INTERFACE = 10
+
+
+class Shard:
+    """
+    Una interfaz Wireguard del orquestador con su llave, puerto, agrupador de
+    altas y reconciliador propios
+    """
+
+    def __init__(self, index, listen_port, address, desired_peers,
+                 reconcile_interval=wg.RECONCILE_INTERVAL, executor=None):
+        self.index = index
+        self.wg = wg.WireGuardConfigurator(f"wg{BASE_INTERFACE + index}", listen_port,
+                                           executor=executor)
+        # Las altas de peers concurrentes se aplican juntas en un solo wg addconf
+        self.peer_batcher = wg.PeerBatcher(self.wg)
+        # Corrige las diferencias entre el kernel y los endpoints de este shard
+        self.reconciler = wg.WireGuardReconciler(self.wg, desired_peers, address=address,
+                                                 interval=reconcile_interval)
+
+    @property
+    def interface_name(self):
+        return self.wg.interface_name
+
+    @property
+    def listen_port(self):
+        return self.wg.listen_port
+
+
+class ShardSet:
+    """
+    Conjunto de shards. Cada red privada se asigna por hash a un shard, así
+    que todos sus endpoints viven en la misma interfaz y un cambio en una red
+    no toca los peers de otros usuarios.
+    """
+
+    def __init__(self, count, base_port, address, desired_peers,
+                 reconcile_interval=wg.RECONCILE_INTERVAL, executor=None):
+        """
+        Args:
+            count: Número de interfaces
+            base_port: Puerto de la primera interfaz
+            address: Dirección Wireguard del orquestador en cada interfaz
+            desired_peers: Función que recibe el índice del shard y regresa
+                sus peers deseados {llave pública: peer}
+            executor: Ejecutor compartido por las interfaces (por defecto
+                cada una crea un CommandExecutor)
+        """
+        if count < 1:
+            raise ValueError("At least one shard is required")
+        self._shards = [
+            Shard(i, base_port + i, address, lambda i=i: desired_peers(i), reconcile_interval,
+                  executor=executor)
+            for i in range(count)
+        ]
+
+    def __len__(self):
+        return len(self._shards)
+
+    def __iter__(self):
+        return iter(self._shards)
+
+    def __getitem__(self, index):
+        return self._shards[index]
+
+    def index_for(self, email, private_network_id) -> int:
+        """
+        Shard de una red privada; crc32 es estable entre reinicios
+        """
+        if len(self._shards) == 1:
+            return 0
+        key = f"{email}/{private_network_id}".encode()
+        return zlib.crc32(key) % len(self._shards)
+
+    def for_network(self, email, private_network_id) -> Shard:
+        return self._shards[self.index_for(email, private_network_id)]
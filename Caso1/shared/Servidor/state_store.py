@@ -0,0 +1,207 @@
+## Persistencia del estado del orquestador
+import json
+import logging
+import queue
+import sqlite3
+import threading
+
+from usuario import Usuario
+import PrivateNetwork as rp
+
+logger = logging.getLogger(__name__)
+
+# Cambios que se escriben como máximo en una transacción
+DEFAULT_BATCH_SIZE = 2000
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    email TEXT PRIMARY KEY,
+    name TEXT NOT NULL,
+    password TEXT NOT NULL,
+    network_counter INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS networks (
+    email TEXT NOT NULL,
+    network_id INTEGER NOT NULL,
+    name TEXT,
+    segment TEXT NOT NULL,
+    num_endpoints INTEGER NOT NULL,
+    PRIMARY KEY (email, network_id)
+);
+CREATE TABLE IF NOT EXISTS endpoints (
+    email TEXT NOT NULL,
+    network_id INTEGER NOT NULL,
+    endpoint_id INTEGER NOT NULL,
+    name TEXT,
+    wireguard_ip TEXT,
+    wireguard_port TEXT,
+    public_key TEXT,
+    public_ip TEXT,
+    allowed_ips TEXT,
+    PRIMARY KEY (email, network_id, endpoint_id)
+);
+CREATE TABLE IF NOT EXISTS settings (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+SAVE_USER = "INSERT OR REPLACE INTO users VALUES (?, ?, ?, ?)"
+SAVE_NETWORK = "INSERT OR REPLACE INTO networks VALUES (?, ?, ?, ?, ?)"
+SAVE_ENDPOINT = "INSERT OR REPLACE INTO endpoints VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)"
+DELETE_NETWORK = "DELETE FROM networks WHERE email = ? AND network_id = ?"
+DELETE_NETWORK_ENDPOINTS = "DELETE FROM endpoints WHERE email = ? AND network_id = ?"
+DELETE_ENDPOINT = "DELETE FROM endpoints WHERE email = ? AND network_id = ? AND endpoint_id = ?"
+SAVE_SETTING = "INSERT OR REPLACE INTO settings VALUES (?, ?)"
+
+
+class StateStore:
+    """
+    Guarda usuarios, redes privadas y endpoints en SQLite (modo WAL).
+
+    Las RPCs solo encolan una copia de la fila modificada; un hilo escritor
+    agrupa los cambios pendientes y los escribe en una sola transacción, de
+    modo que la latencia de una RPC no depende de fsync. Con
+    synchronous=NORMAL en modo WAL una caída del sistema puede perder el
+    último lote, pero la base nunca queda inconsistente.
+    """
+
+    def __init__(self, path: str, batch_size: int = DEFAULT_BATCH_SIZE):
+        self.path = path
+        self.batch_size = batch_size
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(SCHEMA)
+        self._conn.commit()
+
+        self._queue = queue.Queue()
+        self._closed = False
+        self._writer = threading.Thread(target=self._write_loop,
+                                        name="state-store", daemon=True)
+        self._writer.start()
+
+    # Cambios (se copian los valores al encolar)
+    def save_user(self, usuario) -> None:
+        self._queue.put((SAVE_USER, (usuario.email, usuario.name, usuario.password,
+                                     usuario.private_network_counter)))
+
+    def save_network(self, email, private_network) -> None:
+        self._queue.put((SAVE_NETWORK, (email, private_network.id, private_network.name,
+                                        str(private_network.segment),
+                                        private_network.num_endpoints)))
+
+    def save_endpoint(self, email, endpoint) -> None:
+        self._queue.put((SAVE_ENDPOINT, (email, endpoint.private_network_id, endpoint.id,
+                                         endpoint.name, endpoint.wireguard_ip,
+                                         str(endpoint.wireguard_port or ""),
+                                         endpoint.wireguard_public_key, endpoint.public_ip,
+                                         json.dumps(list(endpoint.allowed_ips)))))
+
+    def delete_network(self, email, network_id) -> None:
+        self._queue.put((DELETE_NETWORK_ENDPOINTS, (email, network_id)))
+        self._queue.put((DELETE_NETWORK, (email, network_id)))
+
+    def delete_endpoint(self, email, network_id, endpoint_id) -> None:
+        self._queue.put((DELETE_ENDPOINT, (email, network_id, endpoint_id)))
+
+    def save_setting(self, key, value) -> None:
+        self._queue.put((SAVE_SETTING, (key, value)))
+
+    def get_setting(self, key):
+        """
+        Lee un valor guardado directamente de la base (solo al arrancar)
+        """
+        row = self._conn.execute("SELECT value FROM settings WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def flush(self) -> None:
+        """
+        Bloquea hasta que todos los cambios encolados estén escritos
+        """
+        done = threading.Event()
+        self._queue.put((None, done))
+        done.wait()
+
+    def close(self) -> None:
+        if self._closed:
+            return
+        self.flush()
+        self._closed = True
+        self._queue.put((None, None))
+        self._writer.join()
+        self._conn.close()
+
+    def restore(self, subnet_pool) -> dict:
+        """
+        Reconstruye {email: Usuario} con sus redes y endpoints, y marca como
+        ocupadas las subredes e IPs recuperadas
+        """
+        usuarios = {}
+        for email, name, password, counter in self._conn.execute(
+                "SELECT email, name, password, network_counter FROM users"):
+            usuario = Usuario(name, email, password)
+            usuario.private_network_counter = counter
+            usuarios[email] = usuario
+
+        networks = {}
+        for email, network_id, name, segment, num_endpoints in self._conn.execute(
+                "SELECT email, network_id, name, segment, num_endpoints FROM networks"):
+            usuario = usuarios.get(email)
+            if usuario is None or subnet_pool.allocate_specific(segment) is None:
+                continue
+            address, prefix = segment.split("/")
+            red = rp.PrivateNetwork(network_id, name, address, int(prefix))
+            red.num_endpoints = num_endpoints
+            usuario.private_networks[str(network_id)] = red
+            networks[(email, network_id)] = red
+
+        for row in self._conn.execute(
+                "SELECT email, network_id, endpoint_id, name, wireguard_ip, wireguard_port, "
+                "public_key, public_ip, allowed_ips FROM endpoints ORDER BY email, network_id, endpoint_id"):
+            email, network_id, endpoint_id, name, wireguard_ip, port, public_key, public_ip, allowed_ips = row
+            red = networks.get((email, network_id))
+            if red is None:
+                continue
+            endpoint = rp.Endpoint(id_endpoint=endpoint_id, name=name, private_network_id=network_id)
+            endpoint.wireguard_ip = wireguard_ip
+            endpoint.wireguard_port = port
+            endpoint.wireguard_public_key = public_key
+            endpoint.public_ip = public_ip
+            endpoint.set_allowed_ips(json.loads(allowed_ips) if allowed_ips else [])
+            red.add_endpoint(endpoint)
+            if wireguard_ip:
+                red.allocator.allocate_address(wireguard_ip)
+        return usuarios
+
+    def _write_loop(self):
+        while True:
+            batch = [self._queue.get()]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            waiters = [params for sql, params in batch if sql is None]
+            changes = [(sql, params) for sql, params in batch if sql is not None]
+            if changes:
+                try:
+                    self._write(changes)
+                except sqlite3.Error as e:
+                    logger.error("Error guardando el estado: %s", e)
+            for done in waiters:
+                if done is None:
+                    return
+                done.set()
+
+    def _write(self, changes):
+        # Filas consecutivas con la misma sentencia van en un executemany
+        with self._conn:
+            run_sql, run = changes[0][0], []
+            for sql, params in changes:
+                if sql != run_sql:
+                    self._conn.executemany(run_sql, run)
+                    run_sql, run = sql, []
+                run.append(params)
+            self._conn.executemany(run_sql, run)
@@ -0,0 +1,163 @@
+## Reparto de subredes para las redes privadas
+import heapq
+import ipaddress
+import threading
+from typing import Optional
+
+# Superred de la que se reparten las redes privadas
+DEFAULT_SUPERNET = "100.10.0.0/16"
+# Prefijo de una red privada cuando no se indica
+DEFAULT_NETWORK_PREFIX = 24
+# Prefijo más largo que se reparte (un /30 deja dos hosts)
+MAX_NETWORK_PREFIX = 30
+
+
+class SubnetPool:
+    """
+    Reparte subredes sin traslape de una superred con un esquema buddy.
+
+    Por cada longitud de prefijo se guarda el conjunto de bloques libres. Para
+    asignar un /p se toma el bloque libre más pequeño que lo contenga y se
+    parte a la mitad hasta llegar a /p, dejando libres las mitades sobrantes.
+    Al liberar, un bloque se fusiona con su buddy mientras este también esté
+    libre, de modo que la superred no se fragmenta con el tiempo.
+
+    Los segmentos pedidos fuera de la superred se aceptan mientras no se
+    traslapen con otro segmento externo.
+    """
+
+    def __init__(self, supernet=DEFAULT_SUPERNET, default_prefix=DEFAULT_NETWORK_PREFIX):
+        self.supernet = ipaddress.IPv4Network(supernet)
+        if not self.supernet.prefixlen <= default_prefix <= MAX_NETWORK_PREFIX:
+            raise ValueError(f"Invalid network prefix /{default_prefix} for {self.supernet}")
+        self.default_prefix = default_prefix
+        # Bloques libres por prefijo {prefijo: {dirección de red}}; el heap
+        # permite entregar siempre el bloque más bajo
+        self._free = {p: set() for p in range(self.supernet.prefixlen, 33)}
+        self._heaps = {p: [] for p in range(self.supernet.prefixlen, 33)}
+        self._add_free(int(self.supernet.network_address), self.supernet.prefixlen)
+        # Subredes asignadas dentro de la superred {(dirección, prefijo)}
+        self._allocated = set()
+        # Segmentos asignados fuera de la superred
+        self._external = set()
+        self._lock = threading.Lock()
+
+    def allocate(self, prefix: Optional[int] = None) -> Optional[ipaddress.IPv4Network]:
+        """
+        Asigna la subred libre más baja del tamaño pedido.
+
+        Returns:
+            IPv4Network: La subred asignada, o None si no hay espacio
+        """
+        prefix = self.default_prefix if prefix is None else int(prefix)
+        self._check_prefix(prefix)
+        with self._lock:
+            for size in range(prefix, self.supernet.prefixlen - 1, -1):
+                block = self._pop_lowest(size)
+                if block is not None:
+                    break
+            else:
+                return None
+            # Partir el bloque; la mitad baja continúa, la alta queda libre
+            for size in range(size + 1, prefix + 1):
+                self._add_free(block + (1 << (32 - size)), size)
+            self._allocated.add((block, prefix))
+        return self._network(block, prefix)
+
+    def allocate_specific(self, segment) -> Optional[ipaddress.IPv4Network]:
+        """
+        Asigna un segmento concreto (ej. '10.1.2.0/24').
+
+        Returns:
+            IPv4Network: El segmento, o None si se traslapa con otro asignado
+        """
+        network = ipaddress.IPv4Network(segment, strict=False)
+        with self._lock:
+            if not network.subnet_of(self.supernet):
+                if network.overlaps(self.supernet):
+                    return None
+                if any(network.overlaps(other) for other in self._external):
+                    return None
+                self._external.add(network)
+                return network
+
+            self._check_prefix(network.prefixlen)
+            target = int(network.network_address)
+            for size in range(network.prefixlen, self.supernet.prefixlen - 1, -1):
+                block = target & self._mask(size)
+                if block in self._free[size]:
+                    self._free[size].remove(block)
+                    break
+            else:
+                return None
+            # Partir hacia el segmento pedido liberando la mitad que no lo contiene
+            for size in range(size + 1, network.prefixlen + 1):
+                half = 1 << (32 - size)
+                if target & half:
+                    self._add_free(block, size)
+                    block += half
+                else:
+                    self._add_free(block + half, size)
+            self._allocated.add((block, network.prefixlen))
+        return network
+
+    def release(self, segment) -> bool:
+        """
+        Devuelve una subred al pool.
+
+        Returns:
+            bool: False si la subred no estaba asignada
+        """
+        network = ipaddress.IPv4Network(segment, strict=False)
+        with self._lock:
+            if network in self._external:
+                self._external.remove(network)
+                return True
+            block, size = int(network.network_address), network.prefixlen
+            if (block, size) not in self._allocated:
+                return False
+            self._allocated.remove((block, size))
+            # Fusionar con el buddy mientras esté libre
+            while size > self.supernet.prefixlen:
+                buddy = block ^ (1 << (32 - size))
+                if buddy not in self._free[size]:
+                    break
+                self._free[size].remove(buddy)
+                block = min(block, buddy)
+                size -= 1
+            self._add_free(block, size)
+        return True
+
+    def is_allocated(self, segment) -> bool:
+        """Indica si la subred exacta está asignada."""
+        network = ipaddress.IPv4Network(segment, strict=False)
+        if network in self._external:
+            return True
+        return (int(network.network_address), network.prefixlen) in self._allocated
+
+    def _check_prefix(self, prefix):
+        if not self.supernet.prefixlen <= prefix <= MAX_NETWORK_PREFIX:
+            raise ValueError(f"Prefix /{prefix} out of range for {self.supernet}")
+
+    def _add_free(self, block, size):
+        self._free[size].add(block)
+        heapq.heappush(self._heaps[size], block)
+
+    def _pop_lowest(self, size):
+        heap = self._heaps[size]
+        free = self._free[size]
+        while heap:
+            block = heapq.heappop(heap)
+            # Entradas obsoletas: el bloque se fusionó o se asignó por dirección
+            if block in free:
+                free.remove(block)
+                return block
+        return None
+
+    @staticmethod
+    def _mask(size):
+        return (0xFFFFFFFF << (32 - size)) & 0xFFFFFFFF
+
+    @staticmethod
+    def _network(block, size):
+        return ipaddress.IPv4Network((block, size))
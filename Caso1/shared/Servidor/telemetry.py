@@ -0,0 +1,199 @@
+## Telemetría de peers: series de tiempo en buffers circulares
+import logging
+import math
+import threading
+import time
+from array import array
+
+logger = logging.getLogger(__name__)
+
+# Segundos entre dos lecturas de `wg show <iface> dump`
+DEFAULT_TELEMETRY_INTERVAL = 10.0
+# Muestras que se conservan por peer (20 minutos con el intervalo por defecto)
+DEFAULT_HISTORY = 120
+
+NAN = float("nan")
+
+
+class _PeerSeries:
+    """
+    Contadores de un peer. Los buffers están indexados por la misma ranura
+    que los tiempos del colector; NaN marca ranuras sin muestra.
+    """
+    __slots__ = ("interface", "rx", "tx", "latest_handshake")
+
+    def __init__(self, interface, history):
+        self.interface = interface
+        # 'd' porque los contadores superan 32 bits (exactos hasta 2**53)
+        self.rx = array("d", [NAN]) * history
+        self.tx = array("d", [NAN]) * history
+        self.latest_handshake = 0
+
+
+class TelemetryCollector:
+    """
+    Lee periódicamente el estado de las interfaces con un solo wg show dump
+    por interfaz y guarda, por peer, bytes recibidos/enviados y el último
+    handshake en buffers circulares de tamaño fijo. Las tasas (bytes/s) se
+    derivan al consultar, así que la memoria es 16 bytes por muestra y peer.
+
+    Los valores que se regresan son float para no exceder los enteros de
+    XML-RPC; un peer sin handshake reporta handshake_age -1.
+    """
+
+    def __init__(self, configurators, interval=DEFAULT_TELEMETRY_INTERVAL, history=DEFAULT_HISTORY):
+        self.configurators = list(configurators)
+        self.interval = interval
+        self.history = history
+        self._times = array("d", [NAN]) * history
+        self._slot = -1
+        self._series = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self) -> None:
+        if self._thread is None and self.interval > 0:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="telemetry", daemon=True)
+            self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def collect(self) -> int:
+        """
+        Toma una muestra de todas las interfaces.
+
+        Returns:
+            int: Número de peers muestreados
+        """
+        dumps = []
+        failed = set()
+        for configurator in self.configurators:
+            try:
+                _, peers = configurator.dump()
+            except RuntimeError as e:
+                logger.warning("No se pudo leer %s: %s", configurator.interface_name, e)
+                failed.add(configurator.interface_name)
+                continue
+            dumps.append((configurator.interface_name, peers))
+
+        now = time.time()
+        with self._lock:
+            slot = (self._slot + 1) % self.history
+            self._times[slot] = now
+            seen = set()
+            for interface, peers in dumps:
+                for key, peer in peers.items():
+                    series = self._series.get(key)
+                    if series is None or series.interface != interface:
+                        series = self._series[key] = _PeerSeries(interface, self.history)
+                    series.rx[slot] = peer['transfer_rx']
+                    series.tx[slot] = peer['transfer_tx']
+                    series.latest_handshake = peer['latest_handshake']
+                    seen.add(key)
+            for key in [key for key in self._series if key not in seen]:
+                series = self._series[key]
+                if series.interface in failed:
+                    # Sin lectura de su interfaz solo falta esta muestra
+                    series.rx[slot] = series.tx[slot] = NAN
+                else:
+                    # Los peers que ya no están en ninguna interfaz se olvidan
+                    del self._series[key]
+            self._slot = slot
+        return len(seen)
+
+    def peer(self, public_key, limit=None):
+        """
+        Resumen y muestras de un peer, o None si no se conoce.
+
+        Args:
+            limit: Número máximo de muestras recientes (None = todas)
+        """
+        with self._lock:
+            series = self._series.get(public_key)
+            if series is None:
+                return None
+            samples = self._samples(series)
+            summary = self._summary(public_key, series, samples)
+        if limit is not None:
+            samples = samples[-limit:] if limit > 0 else []
+        summary["samples"] = samples
+        return summary
+
+    def aggregate(self, public_keys, top=10):
+        """
+        Totales de un conjunto de peers (una red o un usuario) y los `top`
+        peers con más tráfico
+        """
+        summaries = []
+        with self._lock:
+            for key in set(public_keys):
+                series = self._series.get(key)
+                if series is not None:
+                    summaries.append(self._summary(key, series, self._samples(series)))
+        summaries.sort(key=lambda s: s["rx_rate"] + s["tx_rate"], reverse=True)
+        ages = [s["handshake_age"] for s in summaries if s["handshake_age"] >= 0]
+        return {
+            "peers": len(summaries),
+            "rx_bytes": sum(s["rx_bytes"] for s in summaries),
+            "tx_bytes": sum(s["tx_bytes"] for s in summaries),
+            "rx_rate": sum(s["rx_rate"] for s in summaries),
+            "tx_rate": sum(s["tx_rate"] for s in summaries),
+            "never_handshaken": len(summaries) - len(ages),
+            "max_handshake_age": max(ages) if ages else -1.0,
+            "top_peers": summaries[:top],
+        }
+
+    def _samples(self, series):
+        """
+        Muestras en orden cronológico con las tasas respecto a la anterior
+        """
+        samples = []
+        previous = None
+        for i in range(1, self.history + 1):
+            slot = (self._slot + i) % self.history
+            t, rx, tx = self._times[slot], series.rx[slot], series.tx[slot]
+            if math.isnan(t) or math.isnan(rx):
+                previous = None
+                continue
+            rx_rate = tx_rate = 0.0
+            if previous is not None and t > previous[0]:
+                elapsed = t - previous[0]
+                # Un contador que baja indica que el peer se recreó
+                rx_rate = max(rx - previous[1], 0.0) / elapsed
+                tx_rate = max(tx - previous[2], 0.0) / elapsed
+            samples.append({"time": t, "rx_bytes": rx, "tx_bytes": tx,
+                            "rx_rate": rx_rate, "tx_rate": tx_rate})
+            previous = (t, rx, tx)
+        return samples
+
+    def _summary(self, public_key, series, samples):
+        last = samples[-1] if samples else {"rx_bytes": 0.0, "tx_bytes": 0.0, "rx_rate": 0.0, "tx_rate": 0.0}
+        handshake_age = -1.0
+        if series.latest_handshake:
+            handshake_age = max(time.time() - series.latest_handshake, 0.0)
+        return {
+            "public_key": public_key,
+            "interface": series.interface,
+            "rx_bytes": last["rx_bytes"],
+            "tx_bytes": last["tx_bytes"],
+            "rx_rate": last["rx_rate"],
+            "tx_rate": last["tx_rate"],
+            "peak_rx_rate": max((s["rx_rate"] for s in samples), default=0.0),
+            "peak_tx_rate": max((s["tx_rate"] for s in samples), default=0.0),
+            "latest_handshake": float(series.latest_handshake),
+            "handshake_age": handshake_age,
+        }
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.collect()
+            except Exception:
+                # Un error inesperado no debe detener el hilo para siempre
+                logger.exception("Error inesperado leyendo la telemetría")
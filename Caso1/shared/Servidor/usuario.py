@@ -1,4 +1,8 @@
+import threading
+
 class Usuario:
+    __slots__ = ("name", "email", "password", "private_networks", "private_network_counter", "lock")
+
     def __init__(self, name, email, password):
         self.name = name 
         self.email = email
@@ -8,35 +12,34 @@ class Usuario:
 
         # Contador de redes privadas
         self.private_network_counter = 0
+        # Protege el contador y el diccionario frente a RPCs concurrentes
+        self.lock = threading.Lock()
 
     def __str__(self):
         return "Name: " + self.name
 
+    def next_private_network_id(self):
+        with self.lock:
+            private_network_id = self.private_network_counter
+            self.private_network_counter += 1
+            return private_network_id
+
     def add_private_network(self, private_network):
-        self.private_networks.append(private_network)
+        with self.lock:
+            self.private_networks[str(private_network.id)] = private_network
 
     def remove_private_network(self, private_network):
-        self.private_networks.remove(private_network)
+        with self.lock:
+            return self.private_networks.pop(str(private_network.id), None)
 
     def get_private_networks(self):
         return self.private_networks
 
     def get_private_network(self, private_network_id):
-        for private_network in self.private_networks:
-            if private_network.id == private_network_id:
-                return private_network
-        return None
+        return self.private_networks.get(str(private_network_id))
     
     def get_private_network_by_id(self, private_network_id):
-        print("Buscando red privada...")
-        try:
-            print(self.private_networks[private_network_id])
-            return self.private_networks[private_network_id]
-        except KeyError:
-            return None
-
-    def add_private_network(self, private_network):
-        self.private_networks.append(private_network)
+        return self.private_networks.get(private_network_id)
 
     def get_num_private_networks(self):
         return len(self.private_networks)
\ No newline at end of file
@@ -0,0 +1 @@
+## Módulos compartidos por el servidor y el cliente
@@ -0,0 +1,175 @@
+## Ejecución de comandos ip/wg/iptables sin shell
+import collections
+import subprocess
+import threading
+import time
+from typing import Callable, List, Optional, Sequence, Tuple
+
+# Ejecuciones cuyo tiempo se conserva
+DEFAULT_TIMING_HISTORY = 1024
+# Segundos máximos que puede tardar un comando antes de darlo por fallido
+DEFAULT_COMMAND_TIMEOUT = 30.0
+# Códigos de salida con que se reportan los comandos que no llegaron a
+# terminar (mismas convenciones que timeout(1) y el shell)
+TIMEOUT_RETURNCODE = 124
+NOT_EXECUTABLE_RETURNCODE = 126
+NOT_FOUND_RETURNCODE = 127
+
+# Segundos acumulados por cada hilo en comandos, de cualquier ejecutor
+_thread_state = threading.local()
+
+
+def thread_command_time() -> float:
+    """
+    Segundos que el hilo actual ha pasado ejecutando comandos; la diferencia
+    entre dos lecturas es el tiempo en comandos de lo que se hizo en medio
+    """
+    return getattr(_thread_state, "seconds", 0.0)
+
+
+def add_thread_command_time(seconds: float) -> None:
+    """
+    Acredita al hilo actual comandos que otro hilo ejecutó por él (p. ej. un
+    lote de PeerBatcher que el hilo estuvo esperando)
+    """
+    _thread_state.seconds = thread_command_time() + seconds
+
+
+def command_tag(argv: Sequence[str], input: Optional[str] = None) -> Tuple[str, str]:
+    """
+    Clasifica una ejecución como (tipo de comando, interfaz), p. ej.
+    ("wg set", "wg10"), ("ip link", "wg10") o ("nft add", ""). El tipo es el
+    programa y su primer subcomando; la interfaz sale del argumento que la
+    nombra (en `ip -batch`, de la primera línea de stdin que la tenga).
+    """
+    program = argv[0] if argv else ""
+    if program == "ip" and "-batch" in argv:
+        words = []
+        for line in (input or "").splitlines():
+            words = line.split()
+            if "dev" in words:
+                break
+        return "ip -batch", _ip_interface(words)
+    # Sin subcomando (p. ej. nft -f -) se usa la primera opción
+    subcommand = next((arg for arg in argv[1:] if not arg.startswith("-")),
+                      argv[1] if len(argv) > 1 else "")
+    kind = f"{program} {subcommand}".strip()
+    if program == "wg":
+        # wg <subcomando> <interfaz> ...
+        rest = list(argv[argv.index(subcommand) + 1:]) if subcommand else []
+        return kind, rest[0] if rest and subcommand != "genkey" else ""
+    if program == "ip":
+        return kind, _ip_interface(argv[1:])
+    return kind, ""
+
+
+def _ip_interface(words):
+    for keyword in ("dev", "show"):
+        if keyword in words:
+            index = words.index(keyword) + 1
+            if index < len(words) and words[index] != "dev":
+                return words[index]
+    return ""
+
+
+class CommandError(RuntimeError):
+    """
+    Un comando terminó con código distinto de cero
+    """
+
+    def __init__(self, argv: Sequence[str], returncode: int, stderr: str):
+        self.argv = list(argv)
+        self.returncode = returncode
+        self.stderr = stderr or ""
+        super().__init__(f"Command failed: {' '.join(self.argv)}\nError: {self.stderr.strip()}")
+
+
+class CommandExecutor:
+    """
+    Ejecuta comandos como listas de argumentos, sin /bin/sh de por medio.
+
+    Varias operaciones de `ip` se agrupan en un solo proceso `ip -batch -`
+    que las lee de stdin, de modo que crear, cambiar o borrar una interfaz
+    cuesta un fork en lugar de uno por operación. Cada ejecución queda
+    registrada en `timings` como (comando, operaciones, segundos, éxito) y
+    se notifica a los observadores agregados con add_listener.
+
+    Un comando que tarda más de `timeout` segundos se mata; ese caso y el de
+    un programa que no se puede ejecutar se reportan como un código de salida
+    distinto de cero (CommandError con check=True), igual que un fallo del
+    comando.
+    """
+
+    # Los comandos llegan al kernel (ver MemoryExecutor)
+    simulated = False
+
+    def __init__(self, history: int = DEFAULT_TIMING_HISTORY,
+                 timeout: Optional[float] = DEFAULT_COMMAND_TIMEOUT):
+        self.timeout = timeout
+        self.timings = collections.deque(maxlen=history)
+        self._listeners: List[Callable] = []
+        self._lock = threading.Lock()
+
+    def add_listener(self, listener: Callable) -> None:
+        """
+        Registra una función que se llama tras cada ejecución como
+        listener(tipo, interfaz, código de salida, segundos, operaciones, argv);
+        ver command_tag. Se llama en el hilo que ejecutó el comando.
+        """
+        self._listeners.append(listener)
+
+    def run(self, argv: Sequence[str], input: Optional[str] = None,
+            check: bool = True) -> subprocess.CompletedProcess:
+        """
+        Ejecuta un comando y regresa el proceso terminado.
+
+        Raises:
+            CommandError: Si check es True y el comando falla
+        """
+        return self._execute(list(argv), input, check, 1)
+
+    def ip_batch(self, commands: Sequence[Sequence[str]], check: bool = True) -> subprocess.CompletedProcess:
+        """
+        Ejecuta varias operaciones de ip (sin el 'ip' inicial) en un solo
+        proceso; se detiene en la primera que falle.
+
+        Ej. ip_batch([["link", "add", "dev", "wg0", "type", "wireguard"],
+                      ["link", "set", "up", "dev", "wg0"]])
+
+        Raises:
+            CommandError: Si check es True y alguna operación falla
+            ValueError: Si un argumento contiene espacios o saltos de línea
+        """
+        lines = []
+        for command in commands:
+            for arg in command:
+                if not arg or any(c.isspace() for c in arg):
+                    raise ValueError(f"Invalid ip batch argument: {arg!r}")
+            lines.append(" ".join(command))
+        return self._execute(["ip", "-batch", "-"], "\n".join(lines) + "\n", check, len(lines))
+
+    def _execute(self, argv, input, check, operations):
+        start = time.perf_counter()
+        try:
+            result = subprocess.run(argv, input=input, capture_output=True, text=True,
+                                    timeout=self.timeout)
+        except subprocess.TimeoutExpired:
+            result = subprocess.CompletedProcess(argv, TIMEOUT_RETURNCODE, "",
+                                                 f"Timed out after {self.timeout} s\n")
+        except FileNotFoundError as e:
+            result = subprocess.CompletedProcess(argv, NOT_FOUND_RETURNCODE, "", f"{e}\n")
+        except OSError as e:
+            result = subprocess.CompletedProcess(argv, NOT_EXECUTABLE_RETURNCODE, "", f"{e}\n")
+        self._record(argv, input, operations, time.perf_counter() - start, result.returncode)
+        if check and result.returncode != 0:
+            raise CommandError(argv, result.returncode, result.stderr)
+        return result
+
+    def _record(self, argv, input, operations, elapsed, returncode):
+        with self._lock:
+            self.timings.append((" ".join(argv[:3]), operations, elapsed, returncode == 0))
+        add_thread_command_time(elapsed)
+        if self._listeners:
+            kind, interface = command_tag(argv, input)
+            for listener in self._listeners:
+                listener(kind, interface, returncode, elapsed, operations, argv)
@@ -0,0 +1,162 @@
+## Generación de claves WireGuard (Curve25519) sin procesos externos
+import base64
+import os
+import queue
+import threading
+from typing import Tuple
+
+try:
+    from cryptography.hazmat.primitives.asymmetric.x25519 import X25519PrivateKey
+    from cryptography.hazmat.primitives.serialization import Encoding, PublicFormat
+except ImportError:  # cryptography es opcional
+    X25519PrivateKey = None
+
+# Primo del campo de Curve25519 y constante (A - 2) / 4 de la curva
+P = 2 ** 255 - 19
+A24 = 121665
+# Coordenada u del punto base
+BASE_POINT = (9).to_bytes(32, "little")
+KEY_SIZE = 32
+# Pares de claves que se mantienen generados por adelantado
+DEFAULT_KEY_POOL_SIZE = 64
+
+
+def _clamp(scalar: bytes) -> int:
+    k = bytearray(scalar)
+    k[0] &= 248
+    k[31] &= 127
+    k[31] |= 64
+    return int.from_bytes(k, "little")
+
+
+def x25519(scalar: bytes, u_coordinate: bytes) -> bytes:
+    """
+    Multiplicación escalar X25519 con la escalera de Montgomery (RFC 7748).
+
+    Es la implementación de respaldo cuando `cryptography` no está
+    instalado; los enteros de Python no garantizan tiempo constante.
+    """
+    k = _clamp(scalar)
+    x1 = int.from_bytes(u_coordinate, "little") & ((1 << 255) - 1)
+    x2, z2, x3, z3 = 1, 0, x1, 1
+    swap = 0
+    for t in range(254, -1, -1):
+        bit = (k >> t) & 1
+        if swap ^ bit:
+            x2, x3 = x3, x2
+            z2, z3 = z3, z2
+        swap = bit
+        a = x2 + z2
+        aa = a * a % P
+        b = x2 - z2
+        bb = b * b % P
+        e = aa - bb
+        da = (x3 - z3) * a % P
+        cb = (x3 + z3) * b % P
+        x3 = (da + cb) ** 2 % P
+        z3 = x1 * (da - cb) ** 2 % P
+        x2 = aa * bb % P
+        z2 = e * (aa + A24 * e) % P
+    if swap:
+        x2, z2 = x3, z3
+    return (x2 * pow(z2, P - 2, P) % P).to_bytes(KEY_SIZE, "little")
+
+
+def _decode_key(key: str) -> bytes:
+    try:
+        raw = base64.b64decode(key.strip(), validate=True)
+    except (ValueError, AttributeError):
+        raise ValueError("Invalid WireGuard key encoding")
+    if len(raw) != KEY_SIZE:
+        raise ValueError("Invalid WireGuard key length")
+    return raw
+
+
+def _encode_key(raw: bytes) -> str:
+    return base64.b64encode(raw).decode()
+
+
+def genkey() -> str:
+    """
+    Equivalente a `wg genkey`: 32 bytes aleatorios con el clamping de Curve25519
+    """
+    k = bytearray(os.urandom(KEY_SIZE))
+    k[0] &= 248
+    k[31] &= 127
+    k[31] |= 64
+    return _encode_key(bytes(k))
+
+
+def pubkey(private_key: str) -> str:
+    """
+    Equivalente a `wg pubkey`: deriva la clave pública de una privada en base64
+    """
+    raw = _decode_key(private_key)
+    if X25519PrivateKey is not None:
+        public = X25519PrivateKey.from_private_bytes(raw).public_key()
+        return _encode_key(public.public_bytes(Encoding.Raw, PublicFormat.Raw))
+    return _encode_key(x25519(raw, BASE_POINT))
+
+
+def genpsk() -> str:
+    """
+    Equivalente a `wg genpsk`: 32 bytes aleatorios
+    """
+    return _encode_key(os.urandom(KEY_SIZE))
+
+
+def generate_keypair() -> Tuple[str, str]:
+    """
+    Returns:
+        Tuple con (clave_privada, clave_publica) en base64
+    """
+    private_key = genkey()
+    return private_key, pubkey(private_key)
+
+
+class KeyPool:
+    """
+    Mantiene pares de claves generados por un hilo en segundo plano, para que
+    un alta masiva de endpoints no espere a la criptografía. Si el pool está
+    vacío se genera el par en el momento.
+    """
+
+    def __init__(self, size: int = DEFAULT_KEY_POOL_SIZE):
+        self.size = size
+        self._keys = queue.Queue(maxsize=size)
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self) -> "KeyPool":
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._fill, name="key-pool", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def get(self) -> Tuple[str, str]:
+        """
+        Entrega un par (clave_privada, clave_publica) que no se volverá a usar
+        """
+        try:
+            return self._keys.get_nowait()
+        except queue.Empty:
+            return generate_keypair()
+
+    def __len__(self) -> int:
+        return self._keys.qsize()
+
+    def _fill(self):
+        while not self._stop.is_set():
+            keypair = generate_keypair()
+            while not self._stop.is_set():
+                try:
+                    self._keys.put(keypair, timeout=0.5)
+                    break
+                except queue.Full:
+                    continue
@@ -0,0 +1,468 @@
+## Ejecutor en memoria: simula ip/wg/nft sin root ni kernel
+import base64
+import ipaddress
+import re
+import subprocess
+import threading
+import time
+from typing import Optional, Sequence
+
+from common.command_executor import CommandExecutor, CommandError, DEFAULT_TIMING_HISTORY
+from common.keygen import pubkey
+
+# Latencia aproximada de crear un proceso ip/wg/nft y hablar con el kernel
+DEFAULT_COMMAND_LATENCY = 0.002
+# Latencia aproximada de cada operación dentro de un comando (línea de ip
+# -batch, peer de wg set/syncconf, elemento de nft)
+DEFAULT_OPERATION_LATENCY = 0.00002
+
+PEER_OPTIONS = ("remove", "allowed-ips", "endpoint", "persistent-keepalive", "preshared-key")
+
+
+class _Failure(Exception):
+    """Un comando simulado falló; el mensaje es su stderr."""
+
+
+class MemoryInterface:
+    """
+    Estado de una interfaz Wireguard simulada
+    """
+
+    def __init__(self, name, index):
+        self.name = name
+        self.index = index
+        self.up = False
+        self.addresses = []
+        self.routes = set()
+        self.listen_port = 0
+        self.private_key = None
+        self.public_key = None
+        # {llave pública: {endpoint, allowed_ips, latest_handshake, transfer_rx, transfer_tx}}
+        self.peers = {}
+        # {red permitida: llave pública}; como en Wireguard, una red
+        # permitida pertenece a un solo peer
+        self.owners = {}
+
+
+class MemoryExecutor(CommandExecutor):
+    """
+    Ejecutor que no crea procesos: interpreta los comandos ip, wg y nft que
+    emiten los configuradores sobre un modelo en memoria de las interfaces,
+    sus direcciones, rutas, peers, redes permitidas y tablas de nftables.
+
+    Cada comando espera `latency` segundos más `operation_latency` por
+    operación, para que los benchmarks del plano de control reflejen el
+    costo de hablar con el kernel. Con `handshakes` los peers que tienen
+    endpoint reportan un handshake reciente, como un dispositivo conectado.
+    """
+
+    # Los configuradores no exigen Linux ni root con este ejecutor
+    simulated = True
+
+    def __init__(self, latency: float = DEFAULT_COMMAND_LATENCY,
+                 operation_latency: float = DEFAULT_OPERATION_LATENCY,
+                 handshakes: bool = True, history: int = DEFAULT_TIMING_HISTORY):
+        super().__init__(history)
+        self.latency = latency
+        self.operation_latency = operation_latency
+        self.handshakes = handshakes
+        self.interfaces = {}
+        # {tabla: {"lines": [...], "elements": set()}}
+        self.nft_tables = {}
+        self._state_lock = threading.Lock()
+        self._next_index = 2
+
+    def _execute(self, argv, input, check, operations):
+        start = time.perf_counter()
+        try:
+            with self._state_lock:
+                stdout, operations = self._dispatch(argv, input or "", operations)
+            returncode, stderr = 0, ""
+        except (_Failure, ValueError, IndexError) as e:
+            # Argumentos mal formados fallan como en la herramienta real
+            stdout, returncode, stderr = "", 1, str(e) + "\n"
+        delay = self.latency + operations * self.operation_latency
+        if delay > 0:
+            time.sleep(delay)
+        self._record(argv, input, operations, time.perf_counter() - start, returncode)
+        if check and returncode != 0:
+            raise CommandError(argv, returncode, stderr)
+        return subprocess.CompletedProcess(argv, returncode, stdout, stderr)
+
+    def _dispatch(self, argv, input, operations):
+        if argv[0] == "ip":
+            return self._ip(argv[1:], input)
+        if argv[0] == "wg":
+            return self._wg(argv[1:], input)
+        if argv[0] == "nft":
+            return self._nft(argv[1:], input)
+        raise _Failure(f"{argv[0]}: not available in the memory backend")
+
+    # ip
+    def _ip(self, args, input):
+        while args and args[0].startswith("-") and args[0] != "-batch":
+            args = args[1:]
+        if args[:2] != ["-batch", "-"]:
+            return self._ip_command(args), 1
+        lines = [line.split() for line in input.splitlines() if line.strip()]
+        for number, words in enumerate(lines, 1):
+            try:
+                self._ip_command(words)
+            except _Failure as e:
+                raise _Failure(f"{e}\nCommand failed -:{number}")
+        return "", len(lines)
+
+    def _ip_command(self, words):
+        if len(words) < 2:
+            raise _Failure("Object \"\" is unknown, try \"ip help\".")
+        obj, action, rest = words[0], words[1], words[2:]
+        if obj == "link":
+            return self._ip_link(action, rest)
+        if obj in ("address", "addr"):
+            return self._ip_address(action, rest)
+        if obj == "route":
+            return self._ip_route(action, rest)
+        raise _Failure(f"Object \"{obj}\" is unknown, try \"ip help\".")
+
+    def _ip_link(self, action, rest):
+        if action == "add":
+            name = self._option(rest, "dev")
+            if name in self.interfaces:
+                raise _Failure("RTNETLINK answers: File exists")
+            self.interfaces[name] = MemoryInterface(name, self._next_index)
+            self._next_index += 1
+            return ""
+        if action == "set":
+            interface = self._device(self._option(rest, "dev"))
+            interface.up = "up" in rest
+            return ""
+        if action in ("delete", "del"):
+            name = self._option(rest, "dev")
+            self._device(name)
+            del self.interfaces[name]
+            return ""
+        if action == "show":
+            interface = self._device(rest[-1])
+            flags = "POINTOPOINT,NOARP" + (",UP,LOWER_UP" if interface.up else "")
+            state = "UNKNOWN" if interface.up else "DOWN"
+            return (f"{interface.index}: {interface.name}: <{flags}> mtu 1420 qdisc noqueue "
+                    f"state {state} mode DEFAULT group default qlen 1000\n    link/none\n")
+        raise _Failure(f"Command \"{action}\" is unknown, try \"ip link help\".")
+
+    def _ip_address(self, action, rest):
+        interface = self._device(self._option(rest, "dev"))
+        if action == "show":
+            state = "UNKNOWN" if interface.up else "DOWN"
+            return f"{interface.name:<16} {state:<14} {' '.join(interface.addresses)}\n"
+        address = rest[0]
+        if action == "add":
+            if address in interface.addresses:
+                raise _Failure("RTNETLINK answers: File exists")
+            interface.addresses.append(address)
+            return ""
+        if action in ("del", "delete"):
+            if address not in interface.addresses:
+                raise _Failure("RTNETLINK answers: Cannot assign requested address")
+            interface.addresses.remove(address)
+            return ""
+        raise _Failure(f"Command \"{action}\" is unknown, try \"ip address help\".")
+
+    def _ip_route(self, action, rest):
+        interface = self._device(self._option(rest, "dev"))
+        network = str(ipaddress.ip_network(rest[0], strict=False))
+        if action == "replace":
+            interface.routes.add(network)
+        elif action == "add":
+            if network in interface.routes:
+                raise _Failure("RTNETLINK answers: File exists")
+            interface.routes.add(network)
+        elif action in ("del", "delete"):
+            if network not in interface.routes:
+                raise _Failure("RTNETLINK answers: No such process")
+            interface.routes.discard(network)
+        else:
+            raise _Failure(f"Command \"{action}\" is unknown, try \"ip route help\".")
+        return ""
+
+    # wg
+    def _wg(self, args, input):
+        if not args:
+            raise _Failure("Usage: wg <cmd> [<args>]")
+        if args[0] == "show":
+            return self._wg_show(args[1:]), 1
+        if args[0] == "set":
+            return "", self._wg_set(self._wg_device(args), args[2:], input)
+        if args[0] in ("setconf", "addconf", "syncconf"):
+            return "", self._wg_conf(args[0], self._wg_device(args), input)
+        raise _Failure(f"Invalid subcommand: `{args[0]}'")
+
+    def _wg_device(self, args):
+        if len(args) < 2 or args[1] not in self.interfaces:
+            raise _Failure("Unable to modify interface: No such device")
+        return self.interfaces[args[1]]
+
+    def _wg_show(self, args):
+        if not args or args[0] not in self.interfaces:
+            raise _Failure("Unable to access interface: No such device")
+        interface = self.interfaces[args[0]]
+        what = args[1] if len(args) > 1 else "dump"
+        if self.handshakes:
+            now = int(time.time())
+            for peer in interface.peers.values():
+                if peer["endpoint"]:
+                    peer["latest_handshake"] = now
+        lines = []
+        if what == "dump":
+            lines.append("\t".join([interface.private_key or "(none)", interface.public_key or "(none)",
+                                    str(interface.listen_port), "off"]))
+            for key, peer in interface.peers.items():
+                lines.append("\t".join([key, "(none)", peer["endpoint"] or "(none)",
+                                        ",".join(peer["allowed_ips"]) or "(none)",
+                                        str(peer["latest_handshake"]), str(peer["transfer_rx"]),
+                                        str(peer["transfer_tx"]), "off"]))
+        elif what == "latest-handshakes":
+            lines = [f"{key}\t{peer['latest_handshake']}" for key, peer in interface.peers.items()]
+        elif what == "transfer":
+            lines = [f"{key}\t{peer['transfer_rx']}\t{peer['transfer_tx']}"
+                     for key, peer in interface.peers.items()]
+        elif what == "peers":
+            lines = list(interface.peers)
+        else:
+            raise _Failure(f"Invalid parameter: `{what}'")
+        return "".join(line + "\n" for line in lines)
+
+    def _wg_set(self, interface, args, input):
+        # Validar todo antes de aplicar, como hace wg con sus argumentos
+        changes, i, operations = [], 0, 0
+        while i < len(args):
+            option = args[i]
+            if option == "listen-port":
+                changes.append(("listen-port", int(args[i + 1])))
+                i += 2
+            elif option == "private-key":
+                if args[i + 1] != "/dev/stdin":
+                    raise _Failure(f"{args[i + 1]}: No such file or directory")
+                changes.append(("private-key", self._key(input.strip())))
+                i += 2
+            elif option == "fwmark":
+                i += 2
+            elif option == "peer":
+                key = self._key(args[i + 1])
+                peer = {}
+                i += 2
+                while i < len(args) and args[i] in PEER_OPTIONS:
+                    if args[i] == "remove":
+                        peer["remove"] = True
+                        i += 1
+                    else:
+                        peer[args[i]] = args[i + 1]
+                        i += 2
+                changes.append(("peer", (key, peer)))
+                operations += 1
+            else:
+                raise _Failure(f"Invalid argument: {option}")
+        for change, value in changes:
+            if change == "listen-port":
+                interface.listen_port = value
+            elif change == "private-key":
+                interface.private_key, interface.public_key = value, pubkey(value)
+            else:
+                key, peer = value
+                if peer.get("remove"):
+                    self._remove_peer(interface, key)
+                    continue
+                allowed_ips = None
+                if "allowed-ips" in peer:
+                    allowed_ips = [ip for ip in peer["allowed-ips"].split(",") if ip]
+                self._update_peer(interface, key, peer.get("endpoint"), allowed_ips)
+        return max(operations, 1)
+
+    def _wg_conf(self, command, interface, config):
+        listen_port, private_key, peers = self._parse_conf(config)
+        if command != "addconf":
+            if listen_port is not None:
+                interface.listen_port = listen_port
+            if private_key is not None:
+                interface.private_key, interface.public_key = private_key, pubkey(private_key)
+            for key in list(interface.peers):
+                if command == "setconf" or key not in peers:
+                    self._remove_peer(interface, key)
+        for key, (endpoint, allowed_ips) in peers.items():
+            if command == "addconf" and key in interface.peers:
+                allowed_ips = interface.peers[key]["allowed_ips"] + allowed_ips
+            self._update_peer(interface, key, endpoint, allowed_ips)
+        return max(len(peers), 1)
+
+    def _parse_conf(self, config):
+        listen_port = private_key = None
+        peers, key, section = {}, None, None
+        for line in config.splitlines():
+            line = line.split("#", 1)[0].strip()
+            if not line:
+                continue
+            if line.startswith("["):
+                section = line.strip("[]").lower()
+                key = None
+                continue
+            if "=" not in line:
+                raise _Failure(f"Line unrecognized: `{line}'")
+            # Las llaves en base64 terminan en '=': solo se parte en el primero
+            name, value = (part.strip() for part in line.split("=", 1))
+            name = name.lower()
+            if section == "interface":
+                if name == "listenport":
+                    listen_port = int(value)
+                elif name == "privatekey":
+                    private_key = self._key(value)
+            elif section == "peer":
+                if name == "publickey":
+                    key = self._key(value)
+                    peers[key] = (None, [])
+                elif key is None:
+                    raise _Failure("Line unrecognized: peer without PublicKey")
+                elif name == "allowedips":
+                    # Como en wg, cada línea AllowedIPs se suma a las anteriores
+                    peers[key][1].extend(ip.strip() for ip in value.split(",") if ip.strip())
+                elif name == "endpoint":
+                    peers[key] = (value, peers[key][1])
+        return listen_port, private_key, peers
+
+    def _update_peer(self, interface, key, endpoint, allowed_ips):
+        peer = interface.peers.get(key)
+        if peer is None:
+            peer = {"endpoint": None, "allowed_ips": [], "latest_handshake": 0,
+                    "transfer_rx": 0, "transfer_tx": 0}
+            interface.peers[key] = peer
+        if endpoint:
+            peer["endpoint"] = endpoint
+        if allowed_ips is None:
+            return
+        for network in peer["allowed_ips"]:
+            if interface.owners.get(network) == key:
+                del interface.owners[network]
+        normalized = []
+        for ip in allowed_ips:
+            try:
+                network = str(ipaddress.ip_network(ip, strict=False))
+            except ValueError:
+                raise _Failure(f"Unable to parse IP address: `{ip}'")
+            # La red deja de pertenecer al peer anterior
+            owner = interface.owners.get(network)
+            if owner is not None and owner != key:
+                interface.peers[owner]["allowed_ips"].remove(network)
+            interface.owners[network] = key
+            if network not in normalized:
+                normalized.append(network)
+        peer["allowed_ips"] = normalized
+
+    def _remove_peer(self, interface, key):
+        peer = interface.peers.pop(key, None)
+        if peer is None:
+            return
+        for network in peer["allowed_ips"]:
+            if interface.owners.get(network) == key:
+                del interface.owners[network]
+
+    # nft
+    def _nft(self, args, input):
+        if args[:2] == ["-f", "-"]:
+            return "", self._nft_script(input)
+        if len(args) >= 4 and args[0] == "list" and args[1] == "table":
+            return self._nft_list(args[3]), 1
+        if len(args) >= 5 and args[1] == "element" and args[0] in ("add", "delete"):
+            table = self._nft_table(args[3])
+            elements = {e.strip() for e in " ".join(args[5:]).strip("{} ").split(",") if e.strip()}
+            if args[0] == "add":
+                table["elements"] |= elements
+            else:
+                missing = elements - table["elements"]
+                if missing:
+                    raise _Failure("Error: Could not process rule: No such file or directory")
+                table["elements"] -= elements
+            return "", max(len(elements), 1)
+        raise _Failure(f"Error: syntax error, unexpected {args[0] if args else 'end of file'}")
+
+    def _nft_script(self, script):
+        lines = script.splitlines()
+        tables = dict(self.nft_tables)
+        i = 0
+        while i < len(lines):
+            line = lines[i].strip()
+            match = re.match(r"(delete )?table inet (\S+)( \{)?$", line)
+            if match is None:
+                if line:
+                    raise _Failure(f"Error: syntax error, unexpected {line.split()[0]}")
+                i += 1
+                continue
+            deleting, name, opening = match.groups()
+            if deleting:
+                if name not in tables:
+                    raise _Failure("Error: Could not process rule: No such file or directory")
+                del tables[name]
+                i += 1
+                continue
+            tables.setdefault(name, {"lines": [f"table inet {name} {{", "}"], "elements": set()})
+            if not opening:
+                i += 1
+                continue
+            # Bloque de la tabla hasta la llave que lo cierra
+            block, depth = [], 0
+            while i < len(lines):
+                block.append(lines[i])
+                depth += lines[i].count("{") - lines[i].count("}")
+                i += 1
+                if depth == 0:
+                    break
+            elements = set()
+            for block_line in block:
+                element_match = re.match(r"\s*elements = \{(.*)\}", block_line)
+                if element_match:
+                    elements = {e.strip() for e in element_match.group(1).split(",") if e.strip()}
+            tables[name] = {"lines": [l for l in block if "elements = {" not in l],
+                            "elements": elements}
+        # El script se aplica completo o no se aplica
+        self.nft_tables = tables
+        return max(len(lines), 1)
+
+    def _nft_list(self, name):
+        table = self._nft_table(name)
+        lines = list(table["lines"])
+        if table["elements"]:
+            for i, line in enumerate(lines):
+                if line.strip().startswith("set ") and line.strip().endswith("{"):
+                    end = next(j for j in range(i + 1, len(lines)) if lines[j].strip() == "}")
+                    lines.insert(end, f"        elements = {{ {', '.join(sorted(table['elements']))} }}")
+                    break
+        return "\n".join(lines) + "\n"
+
+    def _nft_table(self, name):
+        if name not in self.nft_tables:
+            raise _Failure("Error: Could not process rule: No such file or directory")
+        return self.nft_tables[name]
+
+    # Utilidades
+    def _device(self, name) -> MemoryInterface:
+        if name not in self.interfaces:
+            raise _Failure(f"Cannot find device \"{name}\"")
+        return self.interfaces[name]
+
+    @staticmethod
+    def _option(words, option) -> Optional[str]:
+        if option in words and words.index(option) + 1 < len(words):
+            return words[words.index(option) + 1]
+        raise _Failure(f"Not enough information: \"{option}\" argument is required.")
+
+    @staticmethod
+    def _key(key: str) -> str:
+        try:
+            if len(base64.b64decode(key, validate=True)) == 32 and len(key) == 44:
+                return key
+        except ValueError:
+            pass
+        raise _Failure(f"Key is not the correct length or format: `{key}'")
+
+    def peers(self, interface_name: str) -> Sequence[str]:
+        """Llaves públicas de los peers de una interfaz (vacío si no existe)."""
+        with self._state_lock:
+            interface = self.interfaces.get(interface_name)
+            return list(interface.peers) if interface else []
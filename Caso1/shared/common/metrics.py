@@ -0,0 +1,327 @@
+## Métricas de RPCs: histogramas de latencia con cubetas fijas
+import collections
+import logging
+import threading
+import time
+from bisect import bisect_left
+
+# Cotas superiores (segundos) de las cubetas; la última cubeta es el excedente
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1,
+                   0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# Segundos a partir de los cuales un comando externo se considera lento
+DEFAULT_SLOW_COMMAND = 0.25
+# Comandos lentos que se conservan
+DEFAULT_SLOW_HISTORY = 100
+# Caracteres de la línea de comando que se guardan en la bitácora de lentos
+SLOW_COMMAND_MAX_CHARS = 200
+
+logger = logging.getLogger("comandos")
+
+
+class Histogram:
+    """
+    Conteo de observaciones por cubeta de cotas fijas, más su suma y máximo.
+    Memoria constante sin importar cuántas observaciones se registren.
+    """
+    __slots__ = ("bounds", "counts", "sum", "max")
+
+    def __init__(self, bounds=DEFAULT_BUCKETS):
+        self.bounds = tuple(bounds)
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.sum = 0.0
+        self.max = 0.0
+
+    @property
+    def count(self) -> int:
+        return sum(self.counts)
+
+    def observe(self, value) -> None:
+        # bisect_left: un valor igual a la cota cae en esa cubeta (le)
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        if value > self.max:
+            self.max = value
+
+    def quantile(self, fraction) -> float:
+        """
+        Cota superior de la cubeta que contiene el cuantil (el máximo
+        observado si cae en el excedente); 0.0 sin observaciones
+        """
+        total = self.count
+        if total == 0:
+            return 0.0
+        rank = fraction * total
+        seen = 0
+        for bound, count in zip(self.bounds, self.counts):
+            seen += count
+            if seen >= rank:
+                return min(bound, self.max)
+        return self.max
+
+
+class _MethodStats:
+    __slots__ = ("calls", "errors", "latency", "commands")
+
+    def __init__(self, bounds, commands):
+        self.calls = 0
+        self.errors = 0
+        self.latency = Histogram(bounds)
+        # Segundos de la llamada que se pasaron en comandos ip/wg/nft
+        self.commands = Histogram(bounds) if commands else None
+
+
+class Metrics:
+    """
+    Llamadas, errores e histograma de latencia por método.
+
+    Si se da `command_time` (una función que regresa los segundos acumulados
+    del hilo en comandos externos, ver thread_command_time) cada método lleva
+    además un histograma del tiempo que pasó en comandos. Los valores se
+    pueden consultar como diccionario (serializable por XML-RPC) o como
+    texto en el formato de exposición de Prometheus.
+    """
+
+    def __init__(self, prefix, buckets=DEFAULT_BUCKETS, command_time=None):
+        self.prefix = prefix
+        self.buckets = tuple(buckets)
+        self.command_time = command_time
+        self.commands = command_time is not None
+        self.started = time.time()
+        self._methods = {}
+        self._lock = threading.Lock()
+
+    def observe(self, method, seconds, error=False, command_seconds=0.0) -> None:
+        with self._lock:
+            stats = self._methods.get(method)
+            if stats is None:
+                stats = self._methods[method] = _MethodStats(self.buckets, self.commands)
+            stats.calls += 1
+            if error:
+                stats.errors += 1
+            stats.latency.observe(seconds)
+            if stats.commands is not None:
+                stats.commands.observe(command_seconds)
+
+    def call(self, method, func, *args):
+        """
+        Ejecuta func(*args) registrando su duración; una excepción cuenta
+        como error y se vuelve a lanzar
+        """
+        command_time = self.command_time
+        before = command_time() if command_time is not None else 0.0
+        start = time.perf_counter()
+        error = True
+        try:
+            result = func(*args)
+            error = False
+            return result
+        finally:
+            elapsed = time.perf_counter() - start
+            spent = command_time() - before if command_time is not None else 0.0
+            self.observe(method, elapsed, error, spent)
+
+    def snapshot(self) -> dict:
+        """
+        Regresa {"uptime", "buckets", "methods": {método: {...}}}. Los
+        conteos por cubeta no son acumulados y el último es el excedente.
+        """
+        with self._lock:
+            methods = {}
+            for method, stats in self._methods.items():
+                entry = {
+                    "calls": stats.calls,
+                    "errors": stats.errors,
+                    "seconds": stats.latency.sum,
+                    "max": stats.latency.max,
+                    "p50": stats.latency.quantile(0.50),
+                    "p95": stats.latency.quantile(0.95),
+                    "p99": stats.latency.quantile(0.99),
+                    "latency": list(stats.latency.counts),
+                }
+                if stats.commands is not None:
+                    entry["command_seconds"] = stats.commands.sum
+                    entry["commands"] = list(stats.commands.counts)
+                methods[method] = entry
+        return {"uptime": time.time() - self.started, "buckets": list(self.buckets),
+                "methods": methods}
+
+    def render(self) -> str:
+        """
+        Métricas en el formato de texto de Prometheus
+        """
+        p = self.prefix
+        with self._lock:
+            stats = sorted(self._methods.items())
+            lines = [f"# TYPE {p}_calls_total counter"]
+            lines += [f'{p}_calls_total{{method="{m}"}} {s.calls}' for m, s in stats]
+            lines.append(f"# TYPE {p}_errors_total counter")
+            lines += [f'{p}_errors_total{{method="{m}"}} {s.errors}' for m, s in stats]
+            lines += render_histograms(f"{p}_seconds", [(f'method="{m}"', s.latency) for m, s in stats])
+            if self.commands:
+                lines += render_histograms(f"{p}_command_seconds",
+                                           [(f'method="{m}"', s.commands) for m, s in stats])
+        return "\n".join(lines) + "\n"
+
+
+class CommandStats:
+    """
+    Tiempo de los comandos externos (ip, wg, nft) por tipo, interfaz y
+    código de salida, más una bitácora de los que tardan al menos
+    `slow_threshold` segundos. Se alimenta con CommandExecutor.add_listener.
+    """
+
+    def __init__(self, prefix, slow_threshold=DEFAULT_SLOW_COMMAND,
+                 slow_history=DEFAULT_SLOW_HISTORY, buckets=DEFAULT_BUCKETS):
+        self.prefix = prefix
+        self.slow_threshold = slow_threshold
+        self.buckets = tuple(buckets)
+        # {(tipo, interfaz, código): [ejecuciones, operaciones, Histogram]}
+        self._commands = {}
+        # Comandos lentos desde el arranque; la bitácora solo guarda los últimos
+        self.slow_total = 0
+        self._slow = collections.deque(maxlen=slow_history)
+        self._lock = threading.Lock()
+
+    def record(self, kind, interface, returncode, seconds, operations=1, argv=()) -> None:
+        key = (kind, interface, returncode)
+        with self._lock:
+            entry = self._commands.get(key)
+            if entry is None:
+                entry = self._commands[key] = [0, 0, Histogram(self.buckets)]
+            entry[0] += 1
+            entry[1] += operations
+            entry[2].observe(seconds)
+            slow = self.slow_threshold > 0 and seconds >= self.slow_threshold
+            if slow:
+                self.slow_total += 1
+                command = " ".join(argv)[:SLOW_COMMAND_MAX_CHARS]
+                self._slow.append((time.time(), kind, interface, returncode, seconds, operations, command))
+        if slow:
+            logger.warning("comando lento", extra={"command": kind, "interface": interface,
+                                                   "status": returncode, "ms": round(seconds * 1000, 3),
+                                                   "operations": operations})
+
+    def snapshot(self) -> dict:
+        """
+        Regresa {"buckets", "slow_threshold", "slow_total", "commands": [...], "slow": [...]}
+        con los comandos ordenados por tiempo total, de mayor a menor, y los
+        lentos del más reciente al más antiguo
+        """
+        with self._lock:
+            commands = [{
+                "command": kind,
+                "interface": interface,
+                "status": returncode,
+                "calls": calls,
+                "operations": operations,
+                "seconds": histogram.sum,
+                "max": histogram.max,
+                "p50": histogram.quantile(0.50),
+                "p95": histogram.quantile(0.95),
+                "p99": histogram.quantile(0.99),
+                "latency": list(histogram.counts),
+            } for (kind, interface, returncode), (calls, operations, histogram) in self._commands.items()]
+            slow = [{
+                "time": when,
+                "command": kind,
+                "interface": interface,
+                "status": returncode,
+                "seconds": seconds,
+                "operations": operations,
+                "argv": command,
+            } for when, kind, interface, returncode, seconds, operations, command in reversed(self._slow)]
+            slow_total = self.slow_total
+        commands.sort(key=lambda entry: entry["seconds"], reverse=True)
+        return {"buckets": list(self.buckets), "slow_threshold": self.slow_threshold,
+                "slow_total": slow_total, "commands": commands, "slow": slow}
+
+    def render(self) -> str:
+        """
+        Métricas en el formato de texto de Prometheus
+        """
+        p = self.prefix
+        with self._lock:
+            entries = sorted(self._commands.items())
+            labels = [(f'command="{kind}",interface="{interface}",status="{returncode}"', entry)
+                      for (kind, interface, returncode), entry in entries]
+            lines = [f"# TYPE {p}_operations_total counter"]
+            lines += [f"{p}_operations_total{{{label}}} {entry[1]}" for label, entry in labels]
+            lines += render_histograms(f"{p}_seconds", [(label, entry[2]) for label, entry in labels])
+            lines.append(f"# TYPE {p}_slow_total counter")
+            lines.append(f"{p}_slow_total {self.slow_total}")
+        return "\n".join(lines) + "\n"
+
+
+def render_histograms(name, histograms):
+    """
+    Líneas de texto Prometheus de varios histogramas [(etiquetas, Histogram)]
+    """
+    lines = [f"# TYPE {name} histogram"]
+    for labels, histogram in histograms:
+        cumulative = 0
+        for bound, count in zip(histogram.bounds, histogram.counts):
+            cumulative += count
+            lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+        lines.append(f'{name}_bucket{{{labels},le="+Inf"}} {histogram.count}')
+        lines.append(f'{name}_sum{{{labels}}} {histogram.sum}')
+        lines.append(f'{name}_count{{{labels}}} {histogram.count}')
+    return lines
+
+
+class MetricsPageMixin:
+    """
+    Agrega a un handler XML-RPC la página GET /metrics con el render() de
+    cada objeto en `self.server.metrics`; las demás rutas regresan 404
+    """
+    metrics_path = "/metrics"
+
+    def do_GET(self):
+        sources = getattr(self.server, "metrics", None)
+        if not sources or self.path.split("?", 1)[0] != self.metrics_path:
+            self.report_404()
+            return
+        body = "".join(source.render() for source in sources).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class InstrumentedProxy:
+    """
+    Envoltura de un xmlrpc.client.ServerProxy que registra en `metrics` cada
+    llamada saliente (incluye nombres con punto, p. ej. system.multicall) y,
+    si se da `request_log` (structured_log.RequestLog), una muestra en la
+    bitácora
+    """
+
+    def __init__(self, proxy, metrics, request_log=None):
+        self._proxy = proxy
+        self._metrics = metrics
+        self._request_log = request_log
+
+    def __getattr__(self, name):
+        return _TimedMethod(self, name)
+
+    def __call__(self, attr):
+        # ServerProxy("close") / ServerProxy("transport")
+        return self._proxy(attr)
+
+
+class _TimedMethod:
+    __slots__ = ("_owner", "_name")
+
+    def __init__(self, owner, name):
+        self._owner = owner
+        self._name = name
+
+    def __getattr__(self, name):
+        return _TimedMethod(self._owner, f"{self._name}.{name}")
+
+    def __call__(self, *args):
+        owner = self._owner
+        method = getattr(owner._proxy, self._name)
+        if owner._request_log is None:
+            return owner._metrics.call(self._name, method, *args)
+        return owner._request_log.timed(self._name, owner._metrics.call, self._name, method, *args)
@@ -0,0 +1,130 @@
+## Logging estructurado con escritura en segundo plano
+import atexit
+import json
+import logging
+import queue
+import random
+import sys
+import time
+from logging.handlers import QueueHandler, QueueListener
+
+LOG_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+DEFAULT_LOG_LEVEL = "INFO"
+# Fracción de las peticiones exitosas que se registran en nivel INFO
+DEFAULT_REQUEST_SAMPLE = 0.01
+
+# Atributos propios de un LogRecord; el resto llegó por `extra` y son campos
+_RECORD_ATTRS = frozenset(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+
+class StructuredFormatter(logging.Formatter):
+    """
+    Formatea un registro con los campos que se pasaron en `extra`.
+
+    En texto agrega `clave=valor` al final de LOG_FORMAT; con json=True
+    escribe un objeto JSON por línea.
+    """
+
+    def __init__(self, json_output=False):
+        super().__init__(LOG_FORMAT)
+        self.json_output = json_output
+
+    def format(self, record):
+        fields = {key: value for key, value in vars(record).items() if key not in _RECORD_ATTRS}
+        if not self.json_output:
+            line = super().format(record)
+            if fields:
+                line += " " + " ".join(f"{key}={value}" for key, value in fields.items())
+            return line
+        entry = {
+            "ts": round(record.created, 6),
+            "level": record.levelname.lower(),
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        entry.update(fields)
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+def setup_logging(level=DEFAULT_LOG_LEVEL, json_output=False, stream=None) -> QueueListener:
+    """
+    Configura el logger raíz del proceso: los hilos que registran solo
+    encolan el registro y un hilo aparte lo formatea y escribe, así que una
+    terminal o tubería lenta no frena a las RPCs. Los mensajes por debajo
+    de `level` se descartan antes de formatearse.
+
+    Returns:
+        QueueListener: El escritor, ya iniciado (se detiene al salir)
+    """
+    records = queue.SimpleQueue()
+    handler = logging.StreamHandler(stream or sys.stderr)
+    handler.setFormatter(StructuredFormatter(json_output))
+    listener = QueueListener(records, handler, respect_handler_level=True)
+
+    root = logging.getLogger()
+    for previous in list(root.handlers):
+        root.removeHandler(previous)
+    root.addHandler(QueueHandler(records))
+    root.setLevel(level.upper() if isinstance(level, str) else level)
+
+    listener.start()
+    # Vacía la cola antes de terminar el proceso
+    atexit.register(listener.stop)
+    return listener
+
+
+class RequestLog:
+    """
+    Registro muestreado de peticiones: las que fallan siempre se registran
+    (WARNING), de las exitosas solo una fracción `sample_rate` (INFO), y
+    todas si el logger está en DEBUG.
+    """
+
+    def __init__(self, logger, sample_rate=DEFAULT_REQUEST_SAMPLE):
+        self.logger = logger
+        self.sample_rate = sample_rate
+
+    def record(self, method, seconds, error=False, **fields) -> None:
+        if error:
+            level = logging.WARNING
+        elif self.logger.isEnabledFor(logging.DEBUG):
+            level = logging.DEBUG
+        elif self.sample_rate > 0 and random.random() < self.sample_rate:
+            level = logging.INFO
+        else:
+            return
+        self.logger.log(level, "request", extra=dict(fields, method=method, ms=round(seconds * 1000, 3),
+                                                     ok=not error))
+
+    def timed(self, method, func, *args, **fields):
+        """
+        Ejecuta func(*args) y registra la petición; una excepción cuenta como
+        error y se vuelve a lanzar
+        """
+        start = time.perf_counter()
+        error = True
+        try:
+            result = func(*args)
+            error = False
+            return result
+        finally:
+            self.record(method, time.perf_counter() - start, error, **fields)
+
+
+class RequestLogMixin:
+    """
+    Sustituye la bitácora de BaseHTTPRequestHandler (una línea síncrona en
+    stderr por petición) por el logger del servidor: las peticiones HTTP
+    exitosas solo en DEBUG y los errores de protocolo como WARNING
+    """
+    http_logger = logging.getLogger("http")
+
+    def log_request(self, code="-", size="-"):
+        if self.http_logger.isEnabledFor(logging.DEBUG):
+            self.http_logger.debug("http", extra={"client": self.address_string(),
+                                                  "request": self.requestline, "code": str(code)})
+
+    def log_error(self, format, *args):
+        self.http_logger.warning(format, *args, extra={"client": self.address_string()})
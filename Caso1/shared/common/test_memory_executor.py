@@ -0,0 +1,30 @@
+import unittest
+
+from common.keygen import generate_keypair
+from common.memory_executor import MemoryExecutor
+
+
+class MemoryExecutorConfTest(unittest.TestCase):
+
+    def setUp(self):
+        self.executor = MemoryExecutor(latency=0, operation_latency=0)
+        self.executor.run(["ip", "link", "add", "dev", "wg10", "type", "wireguard"])
+        self.public_key = generate_keypair()[1]
+
+    def allowed_ips(self):
+        # wg show dump: la primera línea es la interfaz y las demás los peers
+        output = self.executor.run(["wg", "show", "wg10", "dump"]).stdout
+        peers = [line.split("\t") for line in output.splitlines()[1:]]
+        return {fields[0]: fields[3].split(",") for fields in peers}
+
+    def test_allowed_ips_lines_accumulate(self):
+        config = (f"[Peer]\nPublicKey = {self.public_key}\n"
+                  "AllowedIPs = 100.10.0.2/32\n"
+                  "AllowedIPs = 100.20.0.0/24, 100.30.0.0/24\n")
+        self.executor.run(["wg", "addconf", "wg10", "/dev/stdin"], input=config)
+        self.assertEqual(self.allowed_ips()[self.public_key],
+                         ["100.10.0.2/32", "100.20.0.0/24", "100.30.0.0/24"])
+
+
+if __name__ == "__main__":
+    unittest.main()